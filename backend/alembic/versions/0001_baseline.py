@@ -0,0 +1,292 @@
+"""baseline
+
+Схема базы на момент появления миграций (до content-addressed хранилища).
+Существующие базы без таблицы alembic_version помечаются этой ревизией (см. app/core/migrations.py).
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-18 23:55:30.491073
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('email', sa.String(length=255), nullable=False),
+    sa.Column('hashed_password', sa.String(length=255), nullable=False),
+    sa.Column('full_name', sa.String(length=255), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('is_superuser', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_users_email'), ['email'], unique=True)
+        batch_op.create_index(batch_op.f('ix_users_id'), ['id'], unique=False)
+
+    op.create_table('cases',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('case_number', sa.String(length=100), nullable=False),
+    sa.Column('title', sa.String(length=500), nullable=False),
+    sa.Column('article', sa.String(length=100), nullable=True),
+    sa.Column('defendant_name', sa.String(length=255), nullable=True),
+    sa.Column('investigative_body', sa.String(length=255), nullable=True),
+    sa.Column('initiation_date', sa.Date(), nullable=True),
+    sa.Column('status', sa.String(length=50), nullable=True),
+    sa.Column('notes', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('cases', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_cases_case_number'), ['case_number'], unique=False)
+        batch_op.create_index(batch_op.f('ix_cases_id'), ['id'], unique=False)
+
+    op.create_table('case_analyses',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('case_id', sa.Integer(), nullable=False),
+    sa.Column('analysis_status', sa.String(length=50), nullable=True),
+    sa.Column('progress', sa.Integer(), nullable=True),
+    sa.Column('findings', sa.JSON(), nullable=True),
+    sa.Column('violations', sa.JSON(), nullable=True),
+    sa.Column('contradictions', sa.JSON(), nullable=True),
+    sa.Column('defense_lines', sa.JSON(), nullable=True),
+    sa.Column('judicial_practice', sa.JSON(), nullable=True),
+    sa.Column('total_documents_analyzed', sa.Integer(), nullable=True),
+    sa.Column('total_violations_found', sa.Integer(), nullable=True),
+    sa.Column('total_contradictions_found', sa.Integer(), nullable=True),
+    sa.Column('ai_model', sa.String(length=50), nullable=True),
+    sa.Column('total_tokens_used', sa.Integer(), nullable=True),
+    sa.Column('total_processing_time', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['case_id'], ['cases.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('case_analyses', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_case_analyses_id'), ['id'], unique=False)
+
+    op.create_table('defense_strategies',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('case_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=True),
+    sa.Column('content', sa.JSON(), nullable=True),
+    sa.Column('summary', sa.Text(), nullable=True),
+    sa.Column('procedural_violations', sa.JSON(), nullable=True),
+    sa.Column('evidence_analysis', sa.JSON(), nullable=True),
+    sa.Column('defense_lines', sa.JSON(), nullable=True),
+    sa.Column('tactical_plan', sa.JSON(), nullable=True),
+    sa.Column('ai_model', sa.String(length=50), nullable=True),
+    sa.Column('generated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['case_id'], ['cases.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('defense_strategies', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_defense_strategies_id'), ['id'], unique=False)
+
+    op.create_table('volumes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('case_id', sa.Integer(), nullable=False),
+    sa.Column('volume_number', sa.Integer(), nullable=False),
+    sa.Column('gdrive_file_id', sa.String(length=255), nullable=True),
+    sa.Column('file_name', sa.String(length=500), nullable=True),
+    sa.Column('file_size', sa.Integer(), nullable=True),
+    sa.Column('page_count', sa.Integer(), nullable=True),
+    sa.Column('ocr_quality', sa.Integer(), nullable=True),
+    sa.Column('processing_status', sa.String(length=50), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('processed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['case_id'], ['cases.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('volumes', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_volumes_id'), ['id'], unique=False)
+
+    op.create_table('extraction_runs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('volume_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('documents_count', sa.Integer(), nullable=True),
+    sa.Column('total_pages', sa.Integer(), nullable=True),
+    sa.Column('crop_ratio', sa.String(length=10), nullable=True),
+    sa.Column('model_used', sa.String(length=100), nullable=True),
+    sa.Column('is_current', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['volume_id'], ['volumes.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('extraction_runs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_extraction_runs_id'), ['id'], unique=False)
+
+    op.create_table('ocr_runs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('volume_id', sa.Integer(), nullable=False),
+    sa.Column('engine', sa.String(length=50), nullable=False),
+    sa.Column('model', sa.String(length=100), nullable=True),
+    sa.Column('pages_processed', sa.Integer(), nullable=True),
+    sa.Column('pages_total', sa.Integer(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('avg_confidence', sa.Integer(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['volume_id'], ['volumes.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('ocr_runs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_ocr_runs_id'), ['id'], unique=False)
+
+    op.create_table('documents',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('case_id', sa.Integer(), nullable=False),
+    sa.Column('volume_id', sa.Integer(), nullable=False),
+    sa.Column('extraction_run_id', sa.Integer(), nullable=True),
+    sa.Column('doc_type', sa.String(length=100), nullable=True),
+    sa.Column('title', sa.String(length=1000), nullable=False),
+    sa.Column('start_page', sa.Integer(), nullable=True),
+    sa.Column('end_page', sa.Integer(), nullable=True),
+    sa.Column('document_date', sa.Date(), nullable=True),
+    sa.Column('author', sa.String(length=255), nullable=True),
+    sa.Column('importance_score', sa.Integer(), nullable=True),
+    sa.Column('analysis_status', sa.String(length=50), nullable=True),
+    sa.Column('full_text', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('analyzed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['case_id'], ['cases.id'], ),
+    sa.ForeignKeyConstraint(['extraction_run_id'], ['extraction_runs.id'], ),
+    sa.ForeignKeyConstraint(['volume_id'], ['volumes.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_documents_id'), ['id'], unique=False)
+
+    op.create_table('page_texts',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('volume_id', sa.Integer(), nullable=False),
+    sa.Column('ocr_run_id', sa.Integer(), nullable=True),
+    sa.Column('page_number', sa.Integer(), nullable=False),
+    sa.Column('ocr_engine', sa.String(length=50), nullable=True),
+    sa.Column('text', sa.Text(), nullable=True),
+    sa.Column('confidence', sa.Integer(), nullable=True),
+    sa.Column('word_boxes', sa.Text(), nullable=True),
+    sa.Column('processed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['ocr_run_id'], ['ocr_runs.id'], ),
+    sa.ForeignKeyConstraint(['volume_id'], ['volumes.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('page_texts', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_page_texts_id'), ['id'], unique=False)
+
+    op.create_table('text_chunks',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('ocr_run_id', sa.Integer(), nullable=False),
+    sa.Column('volume_id', sa.Integer(), nullable=False),
+    sa.Column('page_number', sa.Integer(), nullable=False),
+    sa.Column('chunk_index', sa.Integer(), nullable=False),
+    sa.Column('text', sa.Text(), nullable=False),
+    sa.Column('char_start', sa.Integer(), nullable=True),
+    sa.Column('char_end', sa.Integer(), nullable=True),
+    sa.Column('embedding', sa.Text(), nullable=True),
+    sa.Column('embedding_model', sa.String(length=100), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['ocr_run_id'], ['ocr_runs.id'], ),
+    sa.ForeignKeyConstraint(['volume_id'], ['volumes.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('text_chunks', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_text_chunks_id'), ['id'], unique=False)
+
+    op.create_table('document_analyses',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('document_id', sa.Integer(), nullable=False),
+    sa.Column('analysis_type', sa.String(length=50), nullable=False),
+    sa.Column('findings', sa.JSON(), nullable=True),
+    sa.Column('violations', sa.JSON(), nullable=True),
+    sa.Column('recommendations', sa.JSON(), nullable=True),
+    sa.Column('ai_model', sa.String(length=50), nullable=True),
+    sa.Column('tokens_used', sa.Integer(), nullable=True),
+    sa.Column('processing_time', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('document_analyses', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_document_analyses_id'), ['id'], unique=False)
+
+    op.create_table('entities',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('document_id', sa.Integer(), nullable=False),
+    sa.Column('entity_type', sa.String(length=50), nullable=False),
+    sa.Column('entity_value', sa.Text(), nullable=False),
+    sa.Column('context', sa.Text(), nullable=True),
+    sa.Column('confidence', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('entities', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_entities_id'), ['id'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('entities', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_entities_id'))
+
+    op.drop_table('entities')
+    with op.batch_alter_table('document_analyses', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_document_analyses_id'))
+
+    op.drop_table('document_analyses')
+    with op.batch_alter_table('text_chunks', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_text_chunks_id'))
+
+    op.drop_table('text_chunks')
+    with op.batch_alter_table('page_texts', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_page_texts_id'))
+
+    op.drop_table('page_texts')
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_documents_id'))
+
+    op.drop_table('documents')
+    with op.batch_alter_table('ocr_runs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_ocr_runs_id'))
+
+    op.drop_table('ocr_runs')
+    with op.batch_alter_table('extraction_runs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_extraction_runs_id'))
+
+    op.drop_table('extraction_runs')
+    with op.batch_alter_table('volumes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_volumes_id'))
+
+    op.drop_table('volumes')
+    with op.batch_alter_table('defense_strategies', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_defense_strategies_id'))
+
+    op.drop_table('defense_strategies')
+    with op.batch_alter_table('case_analyses', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_case_analyses_id'))
+
+    op.drop_table('case_analyses')
+    with op.batch_alter_table('cases', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_cases_id'))
+        batch_op.drop_index(batch_op.f('ix_cases_case_number'))
+
+    op.drop_table('cases')
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_id'))
+        batch_op.drop_index(batch_op.f('ix_users_email'))
+
+    op.drop_table('users')
@@ -0,0 +1,96 @@
+"""storage and ingest
+
+Content-addressed хранилище (file_blobs), возобновляемые загрузки (upload_sessions),
+новые колонки томов: хеш файла, Google Drive метки синхронизации, манифест страниц,
+статистика нормализации. Колонки, уже добавленные вручную, пропускаются.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 23:55:37.665626
+"""
+
+from alembic import op, context
+import sqlalchemy as sa
+
+
+VOLUME_COLUMNS = [
+    sa.Column('blob_id', sa.Integer(), nullable=True),
+    sa.Column('gdrive_md5', sa.String(length=32), nullable=True),
+    sa.Column('gdrive_modified_time', sa.String(length=40), nullable=True),
+    sa.Column('file_hash', sa.String(length=64), nullable=True),
+    sa.Column('page_manifest', sa.Text(), nullable=True),
+    sa.Column('normalization', sa.Text(), nullable=True),
+]
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('file_blobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('storage_path', sa.String(length=1000), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('file_blobs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_file_blobs_id'), ['id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_file_blobs_sha256'), ['sha256'], unique=True)
+
+    op.create_table('upload_sessions',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('case_id', sa.Integer(), nullable=False),
+    sa.Column('file_name', sa.String(length=500), nullable=False),
+    sa.Column('total_size', sa.BigInteger(), nullable=False),
+    sa.Column('committed_offset', sa.BigInteger(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('volume_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['case_id'], ['cases.id'], ),
+    sa.ForeignKeyConstraint(['volume_id'], ['volumes.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('upload_sessions', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_upload_sessions_case_id'), ['case_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_upload_sessions_expires_at'), ['expires_at'], unique=False)
+
+    existing = set()
+    if not context.is_offline_mode():
+        existing = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('volumes')}
+    with op.batch_alter_table('volumes', schema=None) as batch_op:
+        for column in VOLUME_COLUMNS:
+            if column.name not in existing:
+                batch_op.add_column(column.copy())
+        batch_op.create_index(batch_op.f('ix_volumes_blob_id'), ['blob_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_volumes_file_hash'), ['file_hash'], unique=False)
+        batch_op.create_index(batch_op.f('ix_volumes_gdrive_file_id'), ['gdrive_file_id'], unique=False)
+        batch_op.create_foreign_key('fk_volumes_blob_id', 'file_blobs', ['blob_id'], ['id'])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('volumes', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_volumes_blob_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_volumes_gdrive_file_id'))
+        batch_op.drop_index(batch_op.f('ix_volumes_file_hash'))
+        batch_op.drop_index(batch_op.f('ix_volumes_blob_id'))
+        for column in reversed(VOLUME_COLUMNS):
+            batch_op.drop_column(column.name)
+
+    with op.batch_alter_table('upload_sessions', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_upload_sessions_expires_at'))
+        batch_op.drop_index(batch_op.f('ix_upload_sessions_case_id'))
+
+    op.drop_table('upload_sessions')
+    with op.batch_alter_table('file_blobs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_file_blobs_sha256'))
+        batch_op.drop_index(batch_op.f('ix_file_blobs_id'))
+
+    op.drop_table('file_blobs')
@@ -0,0 +1,72 @@
+"""hot query indexes
+
+Составные индексы под горячие запросы (страницы OCR запуска, чанки тома, документы
+выделения, последний запуск OCR) и уникальные ограничения:
+одна страница на запуск OCR, один чанк на позицию, одна версия выделения на том.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 23:55:59.077507
+"""
+
+from alembic import op
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.create_index('ix_documents_case', ['case_id'], unique=False)
+        batch_op.create_index('ix_documents_run_start', ['extraction_run_id', 'start_page'], unique=False)
+        batch_op.create_index('ix_documents_volume_run_start', ['volume_id', 'extraction_run_id', 'start_page'], unique=False)
+
+    with op.batch_alter_table('extraction_runs', schema=None) as batch_op:
+        batch_op.create_index('ix_extraction_runs_volume_current', ['volume_id', 'is_current'], unique=False)
+        batch_op.create_unique_constraint('uq_extraction_runs_volume_version', ['volume_id', 'version'])
+
+    with op.batch_alter_table('ocr_runs', schema=None) as batch_op:
+        batch_op.create_index('ix_ocr_runs_volume_status', ['volume_id', 'status', 'id'], unique=False)
+
+    with op.batch_alter_table('page_texts', schema=None) as batch_op:
+        batch_op.create_index('ix_page_texts_volume_page', ['volume_id', 'page_number'], unique=False)
+        batch_op.create_index('ix_page_texts_volume_run_page', ['volume_id', 'ocr_run_id', 'page_number'], unique=False)
+        batch_op.create_unique_constraint('uq_page_texts_run_page', ['ocr_run_id', 'page_number'])
+
+    with op.batch_alter_table('text_chunks', schema=None) as batch_op:
+        batch_op.create_index('ix_text_chunks_volume_page_chunk', ['volume_id', 'page_number', 'chunk_index'], unique=False)
+        batch_op.create_index('ix_text_chunks_volume_run_page_chunk', ['volume_id', 'ocr_run_id', 'page_number', 'chunk_index'], unique=False)
+        batch_op.create_unique_constraint('uq_text_chunks_run_page_chunk', ['ocr_run_id', 'page_number', 'chunk_index'])
+
+    with op.batch_alter_table('volumes', schema=None) as batch_op:
+        batch_op.create_index('ix_volumes_case_number', ['case_id', 'volume_number'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('volumes', schema=None) as batch_op:
+        batch_op.drop_index('ix_volumes_case_number')
+
+    with op.batch_alter_table('text_chunks', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_text_chunks_run_page_chunk', type_='unique')
+        batch_op.drop_index('ix_text_chunks_volume_run_page_chunk')
+        batch_op.drop_index('ix_text_chunks_volume_page_chunk')
+
+    with op.batch_alter_table('page_texts', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_page_texts_run_page', type_='unique')
+        batch_op.drop_index('ix_page_texts_volume_run_page')
+        batch_op.drop_index('ix_page_texts_volume_page')
+
+    with op.batch_alter_table('ocr_runs', schema=None) as batch_op:
+        batch_op.drop_index('ix_ocr_runs_volume_status')
+
+    with op.batch_alter_table('extraction_runs', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_extraction_runs_volume_version', type_='unique')
+        batch_op.drop_index('ix_extraction_runs_volume_current')
+
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.drop_index('ix_documents_volume_run_start')
+        batch_op.drop_index('ix_documents_run_start')
+        batch_op.drop_index('ix_documents_case')
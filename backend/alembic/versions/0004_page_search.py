@@ -0,0 +1,39 @@
+"""page search
+
+Полнотекстовый поиск по page_texts.
+SQLite: FTS5-таблица page_search (основы слов и метки дела/тома), наполняется приложением.
+PostgreSQL: GIN-индекс по to_tsvector('russian', text), поддерживается базой.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 01:10:00.000000
+"""
+
+from alembic import op
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == "sqlite":
+        # Существующие страницы индексируются при старте приложения (search_service.schedule_backfill)
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS page_search USING fts5("
+            "terms, scope, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    else:
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_page_texts_search ON page_texts "
+            "USING gin (to_tsvector('russian', coalesce(text, '')))"
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "sqlite":
+        op.execute("DROP TABLE IF EXISTS page_search")
+    else:
+        op.execute("DROP INDEX IF EXISTS ix_page_texts_search")
@@ -0,0 +1,32 @@
+"""run retention
+
+Политика хранения старых запусков OCR и выделения для дела (cases.run_retention).
+Колонка, уже созданная database_schema.sql, пропускается.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 02:20:00.000000
+"""
+
+from alembic import op, context
+import sqlalchemy as sa
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    existing = set()
+    if not context.is_offline_mode():
+        existing = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('cases')}
+    if 'run_retention' not in existing:
+        with op.batch_alter_table('cases', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('run_retention', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('cases', schema=None) as batch_op:
+        batch_op.drop_column('run_retention')
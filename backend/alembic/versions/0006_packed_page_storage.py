@@ -0,0 +1,42 @@
+"""packed page storage
+
+Компактное хранение страниц: page_texts.word_boxes_packed (координаты слов колонками)
+и page_texts.text_zstd (текст, сжатый zstd). Колонки, уже созданные
+database_schema.sql, пропускаются.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 03:05:00.000000
+"""
+
+from alembic import op, context
+import sqlalchemy as sa
+
+
+PAGE_TEXT_COLUMNS = [
+    sa.Column('text_zstd', sa.LargeBinary(), nullable=True),
+    sa.Column('word_boxes_packed', sa.LargeBinary(), nullable=True),
+]
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    existing = set()
+    if not context.is_offline_mode():
+        existing = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('page_texts')}
+    missing = [column for column in PAGE_TEXT_COLUMNS if column.name not in existing]
+    if missing:
+        with op.batch_alter_table('page_texts', schema=None) as batch_op:
+            for column in missing:
+                batch_op.add_column(column.copy())
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('page_texts', schema=None) as batch_op:
+        for column in reversed(PAGE_TEXT_COLUMNS):
+            batch_op.drop_column(column.name)
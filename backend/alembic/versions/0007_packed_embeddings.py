@@ -0,0 +1,80 @@
+"""packed embeddings
+
+Векторы chunks в бинарном виде: text_chunks.embedding_packed (float32, app.core.packing)
+и индекс (ocr_run_id, embedding_model) для сверки матрицы векторов дела.
+Старые JSON-векторы переносятся в embedding_packed порциями, JSON обнуляется.
+Колонка и индекс, уже созданные database_schema.sql, пропускаются.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 05:10:00.000000
+"""
+
+import json
+
+from alembic import op, context
+import sqlalchemy as sa
+
+from app.core.packing import pack_vector, unpack_vector
+
+
+CONVERT_BATCH = 1000
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def convert_json_embeddings(bind) -> int:
+    converted = 0
+    while True:
+        rows = bind.execute(sa.text(
+            "SELECT id, embedding FROM text_chunks WHERE embedding IS NOT NULL LIMIT :limit"
+        ), {"limit": CONVERT_BATCH}).all()
+        if not rows:
+            return converted
+        bind.execute(sa.text(
+            "UPDATE text_chunks SET embedding_packed = :packed, embedding = NULL WHERE id = :id"
+        ), [{"id": row.id, "packed": pack_vector(json.loads(row.embedding))} for row in rows])
+        converted += len(rows)
+
+
+def upgrade() -> None:
+    existing_columns = set()
+    existing_indexes = set()
+    if not context.is_offline_mode():
+        inspector = sa.inspect(op.get_bind())
+        existing_columns = {c['name'] for c in inspector.get_columns('text_chunks')}
+        existing_indexes = {i['name'] for i in inspector.get_indexes('text_chunks')}
+
+    with op.batch_alter_table('text_chunks', schema=None) as batch_op:
+        if 'embedding_packed' not in existing_columns:
+            batch_op.add_column(sa.Column('embedding_packed', sa.LargeBinary(), nullable=True))
+        if 'ix_text_chunks_run_model' not in existing_indexes:
+            batch_op.create_index('ix_text_chunks_run_model', ['ocr_run_id', 'embedding_model'], unique=False)
+
+    if not context.is_offline_mode():
+        convert_json_embeddings(op.get_bind())
+
+
+def restore_json_embeddings(bind):
+    while True:
+        rows = bind.execute(sa.text(
+            "SELECT id, embedding_packed FROM text_chunks WHERE embedding_packed IS NOT NULL LIMIT :limit"
+        ), {"limit": CONVERT_BATCH}).all()
+        if not rows:
+            return
+        bind.execute(sa.text(
+            "UPDATE text_chunks SET embedding = :embedding, embedding_packed = NULL WHERE id = :id"
+        ), [{"id": row.id, "embedding": json.dumps(unpack_vector(row.embedding_packed).tolist())} for row in rows])
+
+
+def downgrade() -> None:
+    if not context.is_offline_mode():
+        restore_json_embeddings(op.get_bind())
+
+    with op.batch_alter_table('text_chunks', schema=None) as batch_op:
+        batch_op.drop_index('ix_text_chunks_run_model')
+        batch_op.drop_column('embedding_packed')
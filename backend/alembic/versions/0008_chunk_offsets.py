@@ -0,0 +1,42 @@
+"""chunk offsets
+
+Chunks по смещениям в страницах: text_chunks.page_end (последняя страница chunk),
+text_chunks.text становится необязательным — новые chunks текст не дублируют.
+Колонка, уже созданная database_schema.sql, пропускается.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 06:40:00.000000
+"""
+
+from alembic import op, context
+import sqlalchemy as sa
+
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    existing = {}
+    if not context.is_offline_mode():
+        existing = {c['name']: c for c in sa.inspect(op.get_bind()).get_columns('text_chunks')}
+    text_required = 'text' not in existing or not existing['text']['nullable']
+    if 'page_end' in existing and not text_required:
+        return
+
+    with op.batch_alter_table('text_chunks', schema=None) as batch_op:
+        if 'page_end' not in existing:
+            batch_op.add_column(sa.Column('page_end', sa.Integer(), nullable=True))
+        if text_required:
+            batch_op.alter_column('text', existing_type=sa.Text(), nullable=True)
+
+
+def downgrade() -> None:
+    # Chunks без текста (по смещениям) в старой схеме не представимы
+    op.execute("DELETE FROM text_chunks WHERE text IS NULL")
+    with op.batch_alter_table('text_chunks', schema=None) as batch_op:
+        batch_op.alter_column('text', existing_type=sa.Text(), nullable=False)
+        batch_op.drop_column('page_end')
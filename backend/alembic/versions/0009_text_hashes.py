@@ -0,0 +1,49 @@
+"""text hashes
+
+Хеши для инкрементальной векторизации: page_texts.text_hash (текст страницы) и
+text_chunks.text_hash с индексом (переиспользование векторов по тексту chunk).
+Существующие строки не пересчитываются: хеши считает chunking_service при
+первой векторизации запуска. Колонки и индекс, уже созданные database_schema.sql, пропускаются.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 08:20:00.000000
+"""
+
+from alembic import op, context
+import sqlalchemy as sa
+
+
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    page_columns = set()
+    chunk_columns = set()
+    chunk_indexes = set()
+    if not context.is_offline_mode():
+        inspector = sa.inspect(op.get_bind())
+        page_columns = {c['name'] for c in inspector.get_columns('page_texts')}
+        chunk_columns = {c['name'] for c in inspector.get_columns('text_chunks')}
+        chunk_indexes = {i['name'] for i in inspector.get_indexes('text_chunks')}
+
+    if 'text_hash' not in page_columns:
+        with op.batch_alter_table('page_texts', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('text_hash', sa.String(length=32), nullable=True))
+
+    with op.batch_alter_table('text_chunks', schema=None) as batch_op:
+        if 'text_hash' not in chunk_columns:
+            batch_op.add_column(sa.Column('text_hash', sa.String(length=32), nullable=True))
+        if 'ix_text_chunks_text_hash' not in chunk_indexes:
+            batch_op.create_index('ix_text_chunks_text_hash', ['text_hash'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('text_chunks', schema=None) as batch_op:
+        batch_op.drop_index('ix_text_chunks_text_hash')
+        batch_op.drop_column('text_hash')
+    with op.batch_alter_table('page_texts', schema=None) as batch_op:
+        batch_op.drop_column('text_hash')
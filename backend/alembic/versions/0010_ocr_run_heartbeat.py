@@ -0,0 +1,39 @@
+"""ocr run heartbeat
+
+Владелец и пульс запусков OCR: ocr_runs.owner (процесс, выполняющий запуск) и
+ocr_runs.heartbeat_at (время записи последней страницы). При старте failed помечаются
+только брошенные запуски — процесс-владелец завершён или пульс давно не обновлялся.
+Колонки, уже созданные database_schema.sql, пропускаются.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19 12:40:00.000000
+"""
+
+from alembic import op, context
+import sqlalchemy as sa
+
+
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    run_columns = set()
+    if not context.is_offline_mode():
+        inspector = sa.inspect(op.get_bind())
+        run_columns = {c['name'] for c in inspector.get_columns('ocr_runs')}
+
+    with op.batch_alter_table('ocr_runs', schema=None) as batch_op:
+        if 'owner' not in run_columns:
+            batch_op.add_column(sa.Column('owner', sa.String(length=100), nullable=True))
+        if 'heartbeat_at' not in run_columns:
+            batch_op.add_column(sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('ocr_runs', schema=None) as batch_op:
+        batch_op.drop_column('heartbeat_at')
+        batch_op.drop_column('owner')
@@ -2,6 +2,6 @@
 API v1 роутеры
 """
 
-from app.api.v1 import auth, cases, documents, analysis, strategy
+from app.api.v1 import auth, cases, documents, analysis, strategy, uploads
 
-__all__ = ["auth", "cases", "documents", "analysis", "strategy"]
+__all__ = ["auth", "cases", "documents", "analysis", "strategy", "uploads"]
@@ -11,7 +11,7 @@ router = APIRouter()
 
 
 @router.post("/cases/{case_id}/start")
-async def start_case_analysis(
+def start_case_analysis(
     case_id: int,
     modules: list = None,  # Какие модули анализа запустить
     depth: str = "standard",  # quick, standard, deep
@@ -29,7 +29,7 @@ async def start_case_analysis(
 
 
 @router.get("/cases/{case_id}/status")
-async def get_analysis_status(
+def get_analysis_status(
     case_id: int,
     db: Session = Depends(get_db)
 ):
@@ -45,7 +45,7 @@ async def get_analysis_status(
 
 
 @router.get("/cases/{case_id}/results")
-async def get_analysis_results(
+def get_analysis_results(
     case_id: int,
     db: Session = Depends(get_db)
 ):
@@ -60,7 +60,7 @@ async def get_analysis_results(
 
 
 @router.post("/cases/{case_id}/pause")
-async def pause_analysis(
+def pause_analysis(
     case_id: int,
     db: Session = Depends(get_db)
 ):
@@ -70,7 +70,7 @@ async def pause_analysis(
 
 
 @router.post("/cases/{case_id}/cancel")
-async def cancel_analysis(
+def cancel_analysis(
     case_id: int,
     db: Session = Depends(get_db)
 ):
@@ -22,7 +22,7 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 # )
 
 @router.post("/register")
-async def register(
+def register(
     email: str,
     password: str,
     full_name: str,
@@ -63,7 +63,7 @@ async def register(
 
 
 @router.post("/login")
-async def login(
+def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
@@ -101,7 +101,7 @@ async def login(
 
 
 @router.get("/me")
-async def get_current_user_info(
+def get_current_user_info(
     # current_user: User = Depends(get_current_user)
     db: Session = Depends(get_db)
 ):
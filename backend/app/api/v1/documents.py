@@ -2,16 +2,17 @@
 API для работы с документами
 """
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, status, Request
 from sqlalchemy.orm import Session
 
-from app.models import get_db
+from app.models import get_db, Document
+from app.api.v1.cases import document_pdf_response
 
 router = APIRouter()
 
 
 @router.get("/")
-async def get_documents(
+def get_documents(
     case_id: int = None,
     volume_id: int = None,
     doc_type: str = None,
@@ -25,7 +26,7 @@ async def get_documents(
 
 
 @router.get("/{document_id}")
-async def get_document(
+def get_document(
     document_id: int,
     db: Session = Depends(get_db)
 ):
@@ -35,7 +36,7 @@ async def get_document(
 
 
 @router.post("/{document_id}/analyze")
-async def analyze_document(
+def analyze_document(
     document_id: int,
     analysis_type: str = "full",
     db: Session = Depends(get_db)
@@ -46,7 +47,7 @@ async def analyze_document(
 
 
 @router.get("/{document_id}/entities")
-async def get_document_entities(
+def get_document_entities(
     document_id: int,
     entity_type: str = None,
     db: Session = Depends(get_db)
@@ -57,7 +58,7 @@ async def get_document_entities(
 
 
 @router.get("/{document_id}/connections")
-async def get_document_connections(
+def get_document_connections(
     document_id: int,
     db: Session = Depends(get_db)
 ):
@@ -67,11 +68,25 @@ async def get_document_connections(
 
 
 @router.get("/{document_id}/download")
-async def download_document(
+def download_document(
     document_id: int,
+    request: Request,
     format: str = "pdf",  # pdf, docx, txt
     db: Session = Depends(get_db)
 ):
-    """Скачать документ"""
-    # TODO: Implement document export
-    return {"message": "TODO: Download document"}
+    """Скачать документ (PDF берётся из кеша вырезок томов)"""
+    if format != "pdf":
+        # TODO: Implement docx/txt export
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Пока поддерживается только формат pdf"
+        )
+
+    document = db.query(Document).filter(Document.id == document_id).first()
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Документ не найден"
+        )
+
+    return document_pdf_response(request, db, document, disposition="attachment")
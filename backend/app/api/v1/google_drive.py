@@ -6,15 +6,15 @@ from fastapi import APIRouter, HTTPException, status, Depends
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional, List
-import os
-from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
-import io
+import asyncio
+import httpx
 
 from app.models import get_db, Case
 from app.core.config import settings
+from app.services.gdrive_ingest import (
+    DriveClient, DriveIngestError, ingest_file, ingest_folder, make_http_client
+)
 
 router = APIRouter()
 
@@ -79,7 +79,7 @@ async def get_google_auth_url():
 
 
 @router.post("/oauth/callback")
-async def handle_oauth_callback(
+def handle_oauth_callback(
     callback_data: GoogleAuthCallback,
     db: Session = Depends(get_db)
 ):
@@ -120,30 +120,28 @@ async def handle_oauth_callback(
         )
 
 
+def get_case_or_404(db: Session, case_id: int) -> Case:
+    case = db.query(Case).filter(Case.id == case_id).first()
+    if not case:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Дело не найдено"
+        )
+    return case
+
+
 @router.post("/folders/{folder_id}/files")
 async def list_folder_files(
     folder_id: str,
     access_token: str,
     db: Session = Depends(get_db)
 ):
-    """Получить список файлов из папки Google Drive"""
+    """Получить список файлов из папки Google Drive (все страницы)"""
 
     try:
-        # Создаем credentials из токена
-        credentials = Credentials(token=access_token)
-
-        # Создаем сервис Google Drive
-        service = build('drive', 'v3', credentials=credentials)
-
-        # Получаем список файлов из папки
-        query = f"'{folder_id}' in parents and mimeType='application/pdf'"
-        results = service.files().list(
-            q=query,
-            pageSize=100,
-            fields="files(id, name, mimeType, size, webViewLink)"
-        ).execute()
-
-        files = results.get('files', [])
+        async with make_http_client() as http:
+            client = DriveClient(http, access_token=access_token)
+            files = await client.list_folder(folder_id)
 
         return {
             "folder_id": folder_id,
@@ -151,7 +149,7 @@ async def list_folder_files(
             "total": len(files)
         }
 
-    except Exception as e:
+    except (DriveIngestError, httpx.HTTPError) as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при получении списка файлов: {str(e)}"
@@ -165,59 +163,41 @@ async def download_file(
     case_id: int,
     db: Session = Depends(get_db)
 ):
-    """Скачать файл из Google Drive"""
+    """Скачать файл из Google Drive и создать том"""
 
-    try:
-        # Проверяем существование дела
-        case = db.query(Case).filter(Case.id == case_id).first()
-        if not case:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Дело не найдено"
-            )
+    await asyncio.to_thread(get_case_or_404, db, case_id)
 
-        # Создаем credentials из токена
-        credentials = Credentials(token=access_token)
-
-        # Создаем сервис Google Drive
-        service = build('drive', 'v3', credentials=credentials)
-
-        # Получаем информацию о файле
-        file_metadata = service.files().get(fileId=file_id, fields="name,mimeType,size").execute()
-
-        # Скачиваем файл
-        request = service.files().get_media(fileId=file_id)
-        file_content = io.BytesIO()
-        downloader = MediaIoBaseDownload(file_content, request)
-
-        done = False
-        while done is False:
-            status_progress, done = downloader.next_chunk()
-
-        # Сохраняем файл на диск
-        upload_dir = f"/var/data/starec-advocat/uploads/case_{case_id}"
-        os.makedirs(upload_dir, exist_ok=True)
+    try:
+        result = await ingest_file(db, case_id, file_id, access_token=access_token)
 
-        file_path = os.path.join(upload_dir, file_metadata['name'])
-        with open(file_path, 'wb') as f:
-            f.write(file_content.getvalue())
+    except (DriveIngestError, httpx.HTTPError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при загрузке файла: {str(e)}"
+        )
 
-        # TODO: Создать запись Volume в базе данных
-        # TODO: Поставить задачу на OCR обработку в Celery
+    if result["failed"]:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при загрузке файла: {result['failed'][0]['error']}"
+        )
 
+    if result["skipped"]:
         return {
             "file_id": file_id,
-            "file_name": file_metadata['name'],
-            "file_path": file_path,
-            "size": file_metadata.get('size'),
-            "message": "Файл успешно загружен"
+            "file_name": result["skipped"][0]["name"],
+            "message": "Файл уже синхронизирован"
         }
 
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Ошибка при загрузке файла: {str(e)}"
-        )
+    file_info = result["downloaded"][0]
+    return {
+        "file_id": file_id,
+        "file_name": file_info["filename"],
+        "file_path": file_info["path"],
+        "size": file_info["size"],
+        "volume_id": file_info["volume_id"],
+        "message": "Файл успешно загружен"
+    }
 
 
 @router.post("/sync-folder")
@@ -225,78 +205,34 @@ async def sync_folder(
     folder_id: str,
     case_id: int,
     access_token: str,
+    concurrency: int = None,
     db: Session = Depends(get_db)
 ):
-    """Синхронизация всей папки из Google Drive"""
+    """
+    Синхронизация всей папки из Google Drive.
+    Файлы скачиваются потоково и параллельно, уже синхронизированные пропускаются.
+    """
 
-    try:
-        # Проверяем существование дела
-        case = db.query(Case).filter(Case.id == case_id).first()
-        if not case:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Дело не найдено"
-            )
-
-        # Получаем список файлов
-        credentials = Credentials(token=access_token)
-        service = build('drive', 'v3', credentials=credentials)
-
-        query = f"'{folder_id}' in parents and mimeType='application/pdf'"
-        results = service.files().list(
-            q=query,
-            pageSize=1000,
-            fields="files(id, name, mimeType, size)"
-        ).execute()
-
-        files = results.get('files', [])
-
-        # Загружаем каждый файл
-        downloaded_files = []
-        upload_dir = f"/var/data/starec-advocat/uploads/case_{case_id}"
-        os.makedirs(upload_dir, exist_ok=True)
-
-        for file in files:
-            try:
-                # Скачиваем файл
-                request = service.files().get_media(fileId=file['id'])
-                file_content = io.BytesIO()
-                downloader = MediaIoBaseDownload(file_content, request)
-
-                done = False
-                while done is False:
-                    status_progress, done = downloader.next_chunk()
-
-                # Сохраняем файл
-                file_path = os.path.join(upload_dir, file['name'])
-                with open(file_path, 'wb') as f:
-                    f.write(file_content.getvalue())
-
-                downloaded_files.append({
-                    "id": file['id'],
-                    "name": file['name'],
-                    "path": file_path,
-                    "size": file.get('size')
-                })
-
-            except Exception as e:
-                print(f"Ошибка при загрузке файла {file['name']}: {str(e)}")
-                continue
-
-        # TODO: Создать записи Volume в базе данных
-        # TODO: Поставить задачи на OCR обработку в Celery
+    await asyncio.to_thread(get_case_or_404, db, case_id)
 
-        return {
-            "case_id": case_id,
-            "folder_id": folder_id,
-            "total_files": len(files),
-            "downloaded": len(downloaded_files),
-            "files": downloaded_files,
-            "message": f"Синхронизировано {len(downloaded_files)} из {len(files)} файлов"
-        }
+    try:
+        result = await ingest_folder(db, case_id, folder_id, access_token=access_token, concurrency=concurrency)
 
-    except Exception as e:
+    except (DriveIngestError, httpx.HTTPError) as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при синхронизации папки: {str(e)}"
         )
+
+    downloaded_files = result["downloaded"]
+
+    return {
+        "case_id": case_id,
+        "folder_id": folder_id,
+        "total_files": result["total_files"],
+        "downloaded": len(downloaded_files),
+        "skipped": len(result["skipped"]),
+        "failed": result["failed"],
+        "files": downloaded_files,
+        "message": f"Синхронизировано {len(downloaded_files)} из {result['total_files']} файлов"
+    }
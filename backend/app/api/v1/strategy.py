@@ -11,7 +11,7 @@ router = APIRouter()
 
 
 @router.get("/cases/{case_id}")
-async def get_defense_strategy(
+def get_defense_strategy(
     case_id: int,
     version: int = None,  # Конкретная версия стратегии
     db: Session = Depends(get_db)
@@ -32,7 +32,7 @@ async def get_defense_strategy(
 
 
 @router.post("/cases/{case_id}/generate")
-async def generate_defense_strategy(
+def generate_defense_strategy(
     case_id: int,
     based_on_analysis_id: int = None,
     ai_model: str = "claude-opus-4.5",
@@ -49,7 +49,7 @@ async def generate_defense_strategy(
 
 
 @router.get("/cases/{case_id}/export")
-async def export_strategy(
+def export_strategy(
     case_id: int,
     format: str = "docx",  # docx, pdf, markdown
     version: int = None,
@@ -66,7 +66,7 @@ async def export_strategy(
 
 
 @router.put("/cases/{case_id}")
-async def update_strategy(
+def update_strategy(
     case_id: int,
     section: str,  # Какую секцию обновить
     content: dict,  # Новое содержимое секции
@@ -78,7 +78,7 @@ async def update_strategy(
 
 
 @router.get("/cases/{case_id}/tactical-plan")
-async def get_tactical_plan(
+def get_tactical_plan(
     case_id: int,
     db: Session = Depends(get_db)
 ):
@@ -96,7 +96,7 @@ async def get_tactical_plan(
 
 
 @router.post("/cases/{case_id}/documents/generate")
-async def generate_legal_documents(
+def generate_legal_documents(
     case_id: int,
     document_type: str,  # complaint, motion, objection
     based_on_violation_id: int = None,
@@ -0,0 +1,351 @@
+"""
+API возобновляемой загрузки томов
+
+Протокол:
+1. POST /            — создать сессию загрузки (case_id, file_name, total_size)
+2. PATCH /{id}       — дописать чанк, заголовок Upload-Offset = текущее смещение
+3. HEAD /{id}        — узнать записанное смещение (после обрыва связи)
+4. POST /{id}/finalize — превратить загруженный файл в том
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Header, Response
+from sqlalchemy.orm import Session
+from starlette.requests import ClientDisconnect
+from pydantic import BaseModel
+import os
+import uuid
+import asyncio
+from typing import Optional
+
+from app.models import get_db, Case, Volume, UploadSession
+from app.core.config import settings
+from app.services.storage_service import (
+    partial_upload_path, upload_session_expiry, cleanup_expired_upload_sessions,
+    hash_file, commit_blob, link_to_staging, register_volume, fsync_close
+)
+from app.services.ingest_service import schedule_ingest_on_upload
+
+router = APIRouter()
+
+# Один PATCH или finalize на сессию одновременно (в пределах процесса)
+_session_locks = {}
+
+
+class UploadSessionCreate(BaseModel):
+    case_id: int
+    file_name: str
+    total_size: int
+
+
+def upload_to_dict(upload: UploadSession) -> dict:
+    return {
+        "upload_id": upload.id,
+        "case_id": upload.case_id,
+        "file_name": upload.file_name,
+        "total_size": upload.total_size,
+        "offset": upload.committed_offset,
+        "status": upload.status,
+        "volume_id": upload.volume_id,
+        "expires_at": upload.expires_at.isoformat() if upload.expires_at else None
+    }
+
+
+def acquire_session_lock(upload_id: str) -> asyncio.Lock:
+    """Замок сессии; если по ней уже идёт запрос (PATCH или finalize) — 409"""
+    lock = _session_locks.setdefault(upload_id, asyncio.Lock())
+    if lock.locked():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="По этой загрузке уже выполняется запрос"
+        )
+    return lock
+
+
+def get_active_upload(db: Session, upload_id: str) -> UploadSession:
+    upload = db.query(UploadSession).filter(UploadSession.id == upload_id).first()
+
+    if not upload:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Загрузка не найдена"
+        )
+
+    if upload.status != "active":
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail=f"Загрузка уже не активна (статус: {upload.status})"
+        )
+
+    return upload
+
+
+@router.post("/")
+def create_upload(
+    upload_data: UploadSessionCreate,
+    db: Session = Depends(get_db)
+):
+    """Создать сессию возобновляемой загрузки"""
+
+    case = db.query(Case).filter(Case.id == upload_data.case_id).first()
+    if not case:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Дело не найдено"
+        )
+
+    if not upload_data.file_name.endswith('.pdf'):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Поддерживаются только PDF файлы"
+        )
+
+    if upload_data.total_size <= 0 or upload_data.total_size > settings.MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Размер файла должен быть от 1 байта до {settings.MAX_FILE_SIZE // (1024 * 1024)} MB"
+        )
+
+    # Заодно чистим брошенные загрузки
+    cleanup_expired_upload_sessions(db)
+
+    upload = UploadSession(
+        id=uuid.uuid4().hex,
+        case_id=upload_data.case_id,
+        file_name=os.path.basename(upload_data.file_name),
+        total_size=upload_data.total_size,
+        committed_offset=0,
+        status="active",
+        expires_at=upload_session_expiry()
+    )
+
+    path = partial_upload_path(upload.id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+
+    db.add(upload)
+    db.commit()
+    db.refresh(upload)
+
+    return upload_to_dict(upload)
+
+
+@router.get("/{upload_id}")
+def get_upload(
+    upload_id: str,
+    db: Session = Depends(get_db)
+):
+    """Состояние загрузки"""
+    upload = db.query(UploadSession).filter(UploadSession.id == upload_id).first()
+
+    if not upload:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Загрузка не найдена"
+        )
+
+    return upload_to_dict(upload)
+
+
+@router.head("/{upload_id}")
+def get_upload_offset(
+    upload_id: str,
+    db: Session = Depends(get_db)
+):
+    """Записанное смещение (с него продолжать после обрыва)"""
+    upload = get_active_upload(db, upload_id)
+
+    return Response(
+        status_code=status.HTTP_200_OK,
+        headers={
+            "Upload-Offset": str(upload.committed_offset),
+            "Upload-Length": str(upload.total_size),
+            "Cache-Control": "no-store"
+        }
+    )
+
+
+@router.patch("/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset"),
+    db: Session = Depends(get_db)
+):
+    """
+    Дописать чанк с указанного смещения.
+    Смещение должно совпадать с уже записанным, иначе 409 (клиент делает HEAD и продолжает).
+    При обрыве соединения сохраняется всё, что успело дойти.
+    Запросы к БД (синхронная сессия) выполняются в потоках.
+    """
+    upload = await asyncio.to_thread(get_active_upload, db, upload_id)
+
+    lock = acquire_session_lock(upload_id)
+    try:
+        async with lock:
+            await asyncio.to_thread(db.refresh, upload)
+
+            if upload_offset != upload.committed_offset:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Неверное смещение: записано {upload.committed_offset} байт",
+                    headers={"Upload-Offset": str(upload.committed_offset)}
+                )
+
+            path = partial_upload_path(upload_id)
+            f = await asyncio.to_thread(open, path, 'r+b')
+            # Отбрасываем хвост, который мог остаться от оборванного чанка
+            await asyncio.to_thread(f.truncate, upload_offset)
+            await asyncio.to_thread(f.seek, upload_offset)
+
+            written = 0
+            try:
+                async for chunk in request.stream():
+                    if not chunk:
+                        continue
+                    if written + len(chunk) > settings.UPLOAD_MAX_CHUNK_SIZE:
+                        raise HTTPException(
+                            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"Чанк больше {settings.UPLOAD_MAX_CHUNK_SIZE // (1024 * 1024)} MB"
+                        )
+                    if upload_offset + written + len(chunk) > upload.total_size:
+                        raise HTTPException(
+                            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail="Данных больше, чем заявленный размер файла"
+                        )
+                    await asyncio.to_thread(f.write, chunk)
+                    written += len(chunk)
+
+            except ClientDisconnect:
+                # Соединение оборвалось — фиксируем то, что успели получить
+                print(f"[UPLOAD] {upload_id}: обрыв соединения после {written} байт")
+
+            finally:
+                await fsync_close(f)
+                committed_offset = upload_offset + written
+                upload.committed_offset = committed_offset
+                upload.expires_at = upload_session_expiry()
+                await asyncio.to_thread(db.commit)
+    finally:
+        _session_locks.pop(upload_id, None)
+
+    return Response(
+        status_code=status.HTTP_204_NO_CONTENT,
+        headers={"Upload-Offset": str(committed_offset)}
+    )
+
+
+def finalized_to_dict(upload: UploadSession, volume: Volume, deduplicated: bool = None, reused: dict = None) -> dict:
+    return {
+        "upload_id": upload.id,
+        "filename": volume.file_name,
+        "size": volume.file_size,
+        "sha256": volume.file_hash,
+        "deduplicated": deduplicated,
+        "reused_results": reused,
+        "volume_id": volume.id,
+        "volume_number": volume.volume_number
+    }
+
+
+def finalized_volume(db: Session, upload: Optional[UploadSession]) -> Optional[Volume]:
+    """Том уже завершённой загрузки (повторный finalize возвращает его же)"""
+    if upload is None or upload.status != "finalized" or upload.volume_id is None:
+        return None
+    return db.get(Volume, upload.volume_id)
+
+
+@router.post("/{upload_id}/finalize")
+async def finalize_upload(
+    upload_id: str,
+    db: Session = Depends(get_db)
+):
+    """
+    Завершить загрузку: файл уходит в хранилище, создаётся том.
+    Повтор безопасен: для завершённой загрузки возвращается тот же том, после сбоя
+    загруженные данные остаются на месте и finalize можно вызвать снова.
+    Запросы к БД (синхронная сессия) выполняются в потоках.
+    """
+    def find_finalized() -> Optional[dict]:
+        """Ответ завершённой загрузки или None (выполняется в потоке)"""
+        upload = db.query(UploadSession).filter(UploadSession.id == upload_id).first()
+        volume = finalized_volume(db, upload)
+        return finalized_to_dict(upload, volume) if volume is not None else None
+
+    def check_pending(upload: UploadSession) -> Optional[dict]:
+        """Перечитать загрузку под блокировкой: ответ, если её уже завершили (выполняется в потоке)"""
+        db.refresh(upload)
+        volume = finalized_volume(db, upload)
+        if volume is not None:
+            return finalized_to_dict(upload, volume)
+        if upload.committed_offset != upload.total_size:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Загрузка не завершена: {upload.committed_offset} из {upload.total_size} байт",
+                headers={"Upload-Offset": str(upload.committed_offset)}
+            )
+        return None
+
+    def register_upload(upload: UploadSession, staged: str, file_hash: str) -> dict:
+        """Файл в хранилище, том, статус загрузки (выполняется в потоке)"""
+        try:
+            blob = commit_blob(db, staged, file_hash, upload.total_size)
+            deduplicated = blob.ref_count > 1
+
+            volume, reused = register_volume(db, upload.case_id, blob, upload.file_name)
+
+            upload.status = "finalized"
+            upload.volume_id = volume.id
+            db.commit()
+        except Exception:
+            db.rollback()
+            if os.path.exists(staged):
+                os.remove(staged)
+            raise
+        db.refresh(volume)
+        return finalized_to_dict(upload, volume, deduplicated, reused)
+
+    finalized = await asyncio.to_thread(find_finalized)
+    if finalized is not None:
+        return finalized
+
+    upload = await asyncio.to_thread(get_active_upload, db, upload_id)
+
+    lock = acquire_session_lock(upload_id)
+    try:
+        async with lock:
+            finalized = await asyncio.to_thread(check_pending, upload)
+            if finalized is not None:
+                return finalized
+
+            path = partial_upload_path(upload_id)
+            file_hash = await asyncio.to_thread(hash_file, path)
+
+            # В хранилище уходит вторая ссылка на файл: при ошибке данные загрузки не теряются
+            staged = await asyncio.to_thread(link_to_staging, path)
+            result = await asyncio.to_thread(register_upload, upload, staged, file_hash)
+            if os.path.exists(path):
+                os.remove(path)
+    finally:
+        _session_locks.pop(upload_id, None)
+
+    schedule_ingest_on_upload([result["volume_id"]])
+
+    return result
+
+
+@router.delete("/{upload_id}")
+def abort_upload(
+    upload_id: str,
+    db: Session = Depends(get_db)
+):
+    """Отменить загрузку и удалить загруженные данные"""
+    upload = get_active_upload(db, upload_id)
+
+    path = partial_upload_path(upload_id)
+    if os.path.exists(path):
+        os.remove(path)
+
+    upload.status = "aborted"
+    db.commit()
+
+    return {"message": "Загрузка отменена"}
@@ -0,0 +1,384 @@
+"""
+Разбиение текста тома на chunks по структуре
+
+Текст тома — страницы подряд через PAGE_SEPARATOR; карта смещений страниц переводит
+позицию в тексте тома в (страница, позиция на странице). Поэтому предложение,
+начатое на одной странице и законченное на следующей, попадает в один chunk.
+
+Границы: абзацы (пустая строка) и предложения ([.!?…] + пробел + заглавная буква,
+цифра или кавычка). Сокращения ("ст. 159 ч. 4", "т.е.", "г.") и инициалы ("И. И. Иванов")
+границей не считаются. Предложения собираются в chunk до бюджета токенов (слов);
+абзац закрывает chunk, если тот уже не меньше минимума. Предложение длиннее бюджета
+режется по словам. Соседние chunks перекрываются последними предложениями
+(до overlap токенов) — перекрытие хранится смещениями, текст не дублируется.
+
+Chunk описывается смещениями: page_number/char_start — начало, page_end/char_end —
+конец (не включая) на своей странице. Текст восстанавливается по страницам (chunk_text).
+
+Хеши: page_hash — точный текст страницы (от него зависят смещения chunks),
+chunk_hash — текст chunk без учёта пробелов (по нему переиспользуются векторы).
+
+Инкрементальное разбиение (rechunk_spans): после изменения страниц заново разбиваются
+только окна вокруг них; результат совпадает с разбиением всего нового текста.
+"""
+
+import re
+import hashlib
+import unicodedata
+from bisect import bisect_left, bisect_right
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+PAGE_SEPARATOR = "\n"
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Конец предложения: знаки, закрывающие кавычки/скобки, пробелы. Абзац — пустая строка.
+BOUNDARY_RE = re.compile(r"[.!?…]+[\"»”)\]]*\s+|\n[ \t]*\n\s*")
+PARAGRAPH_RE = re.compile(r"\n[ \t]*\n")
+SENTENCE_START_RE = re.compile(r"[\"«“(\[—–-]*[A-ZА-ЯЁ0-9]")
+PREVIOUS_WORD_RE = re.compile(r"(\w+)\W*$")
+SPACE_RE = re.compile(r"\s+")
+
+# Chunk на страницах запуска: (page_number, char_start, page_end, char_end)
+Span = Tuple[int, int, int, int]
+# Позиция в тексте: (номер страницы, позиция на странице); None — край текста
+Position = Optional[Tuple[int, int]]
+
+# Сокращения, после которых точка не заканчивает предложение (сравнение в нижнем регистре)
+ABBREVIATIONS = frozenset({
+    "ст", "ч", "п", "пп", "пт", "абз", "гл", "разд", "прим", "см", "ср", "рис", "табл",
+    "г", "гг", "в", "вв", "т", "е", "к", "н", "др", "пр", "им", "напр",
+    "ул", "д", "кв", "корп", "стр", "пер", "пр-т", "пос", "обл", "р-н", "с",
+    "руб", "коп", "тыс", "млн", "млрд", "шт", "экз", "л", "об",
+    "гр", "гражд", "уд", "св", "исх", "вх", "рег", "тел", "no",
+})
+
+
+class Sentence:
+    __slots__ = ("start", "end", "tokens", "paragraph_end")
+
+    def __init__(self, start: int, end: int, tokens: int, paragraph_end: bool):
+        self.start = start
+        self.end = end
+        self.tokens = tokens
+        self.paragraph_end = paragraph_end
+
+
+# ============================================================
+# ТЕКСТ ТОМА
+# ============================================================
+
+def join_pages(pages: Sequence[Tuple[int, str]]) -> Tuple[str, List[int], List[int]]:
+    """Текст тома, смещения начала страниц и номера страниц (страницы по порядку)"""
+    starts, numbers, parts = [], [], []
+    offset = 0
+    for page_number, text in pages:
+        text = text or ""
+        starts.append(offset)
+        numbers.append(page_number)
+        parts.append(text)
+        offset += len(text) + len(PAGE_SEPARATOR)
+    return PAGE_SEPARATOR.join(parts), starts, numbers
+
+
+def is_abbreviation(text: str, position: int) -> bool:
+    """Точка в position стоит после сокращения или инициала"""
+    match = PREVIOUS_WORD_RE.search(text, max(0, position - 16), position)
+    if not match:
+        return False
+    word = match.group(1)
+    if len(word) == 1 and word.isalpha() and word.isupper():
+        return True  # инициал
+    return word.lower() in ABBREVIATIONS
+
+
+def split_sentences(text: str, word_starts: List[int]) -> List[Sentence]:
+    """Предложения текста (без пробелов по краям), с числом слов и признаком конца абзаца"""
+    sentences = []
+    start = 0
+
+    def add(end: int, paragraph_end: bool):
+        nonlocal start
+        left, right = start, end
+        while left < right and text[left].isspace():
+            left += 1
+        while right > left and text[right - 1].isspace():
+            right -= 1
+        if right > left:
+            tokens = bisect_left(word_starts, right) - bisect_left(word_starts, left)
+            sentences.append(Sentence(left, right, tokens, paragraph_end))
+        elif paragraph_end and sentences:
+            sentences[-1].paragraph_end = True
+
+    for match in BOUNDARY_RE.finditer(text):
+        gap = match.group()
+        paragraph_end = PARAGRAPH_RE.search(gap) is not None
+        if gap[0] in ".!?…" and not paragraph_end:
+            if not SENTENCE_START_RE.match(text, match.end()):
+                continue
+            if gap[0] == "." and gap[1:2] != "." and is_abbreviation(text, match.start()):
+                continue
+        add(match.end(), paragraph_end)
+        start = match.end()
+    add(len(text), True)
+    return sentences
+
+
+# ============================================================
+# CHUNKS
+# ============================================================
+
+def split_long(sentence: Sentence, word_starts: List[int], max_tokens: int) -> List[Tuple[int, int, int]]:
+    """Предложение длиннее бюджета -> части по max_tokens слов (start, end, tokens)"""
+    first = bisect_left(word_starts, sentence.start)
+    last = bisect_left(word_starts, sentence.end)
+    parts = []
+    for index in range(first, last, max_tokens):
+        start = sentence.start if index == first else word_starts[index]
+        end = word_starts[index + max_tokens] if index + max_tokens < last else sentence.end
+        parts.append((start, end, min(max_tokens, last - index)))
+    return parts
+
+
+def chunk_spans(text: str, max_tokens: int, min_tokens: int, overlap_tokens: int) -> List[Tuple[int, int, int]]:
+    """Chunks текста: (start, end, tokens) по границам абзацев и предложений"""
+    word_starts = [match.start() for match in WORD_RE.finditer(text)]
+    sentences = split_sentences(text, word_starts)
+    spans = []
+    current: List[Sentence] = []
+    tokens = 0
+
+    def close(with_overlap: bool):
+        nonlocal current, tokens
+        spans.append((current[0].start, current[-1].end, tokens))
+        kept: List[Sentence] = []
+        kept_tokens = 0
+        if with_overlap:
+            for sentence in reversed(current[1:]):
+                if kept_tokens + sentence.tokens > overlap_tokens:
+                    break
+                kept.insert(0, sentence)
+                kept_tokens += sentence.tokens
+        current, tokens = kept, kept_tokens
+
+    for sentence in sentences:
+        if sentence.tokens > max_tokens:
+            if current:
+                close(with_overlap=False)
+            spans.extend(split_long(sentence, word_starts, max_tokens))
+            continue
+        if current and tokens + sentence.tokens > max_tokens:
+            close(with_overlap=True)
+            if current and tokens + sentence.tokens > max_tokens:
+                current, tokens = [], 0
+        current.append(sentence)
+        tokens += sentence.tokens
+        if sentence.paragraph_end and tokens >= min_tokens:
+            close(with_overlap=False)
+
+    if current and (not spans or current[-1].end > spans[-1][1]):
+        spans.append((current[0].start, current[-1].end, tokens))
+    return spans
+
+
+def locate(position: int, starts: List[int], numbers: List[int], end: bool = False) -> Tuple[int, int]:
+    """Позиция в тексте тома -> (номер страницы, позиция на странице)"""
+    index = bisect_right(starts, position - 1 if end else position) - 1
+    index = max(index, 0)
+    return numbers[index], position - starts[index]
+
+
+def chunk_pages(pages: Sequence[Tuple[int, str]], max_tokens: int, min_tokens: int = 0,
+                overlap_tokens: int = 0) -> List[dict]:
+    """
+    Chunks тома по страницам [(номер, текст)] в порядке страниц.
+    Результат — поля TextChunk: page_number, char_start, page_end, char_end, chunk_index
+    (номер chunk среди начинающихся на той же странице) и tokens.
+    """
+    text, starts, numbers = join_pages(pages)
+    chunks = []
+    index_on_page: Dict[int, int] = {}
+    for start, end, tokens in chunk_spans(text, max_tokens, min_tokens, overlap_tokens):
+        page_number, char_start = locate(start, starts, numbers)
+        page_end, char_end = locate(end, starts, numbers, end=True)
+        chunk_index = index_on_page.get(page_number, 0)
+        index_on_page[page_number] = chunk_index + 1
+        chunks.append({
+            "page_number": page_number,
+            "char_start": char_start,
+            "page_end": page_end,
+            "char_end": char_end,
+            "chunk_index": chunk_index,
+            "tokens": tokens
+        })
+    return chunks
+
+
+def chunk_text(pages: Dict[int, str], page_number: int, char_start: int,
+               page_end: Optional[int], char_end: int) -> str:
+    """Текст chunk по смещениям (pages — тексты нужных страниц по номеру)"""
+    if page_end is None or page_end == page_number:
+        return (pages.get(page_number) or "")[char_start:char_end]
+    parts = [(pages.get(page_number) or "")[char_start:]]
+    parts.extend(pages[number] or "" for number in range(page_number + 1, page_end) if number in pages)
+    parts.append((pages.get(page_end) or "")[:char_end])
+    return PAGE_SEPARATOR.join(parts)
+
+
+# ============================================================
+# ИНКРЕМЕНТАЛЬНОЕ РАЗБИЕНИЕ
+# ============================================================
+#
+# Разбиение — проход по предложениям с состоянием (собираемый chunk). Там, где chunk
+# начинается после предыдущего с промежутком, состояние пустое: дальше разбиение зависит
+# только от текста. Окно начинается в таком старом начале, если всё, от чего зависит
+# состояние в нём (chunk и начало следующего), лежит до изменённой страницы. Конец окна
+# не угадывается: окно продлевается, пока новое разбиение не начнёт chunk с пустым
+# состоянием ровно в старом таком же начале за изменениями (сходимость) — с этого места
+# старые chunks совпадают с новыми.
+
+def fresh_starts(spans: Sequence[Span]) -> List[bool]:
+    """
+    Для каждого chunk: начинается ли он с пустым состоянием после границы предложения.
+    Часть длинного предложения, разрезанного по словам, начинается ровно на конце
+    предыдущей (на следующей странице — с позиции 0): такие начала не считаются.
+    """
+    fresh = []
+    for i, (page_number, char_start, _, _) in enumerate(spans):
+        if i == 0:
+            fresh.append(True)
+            continue
+        _, _, previous_page, previous_end = spans[i - 1]
+        if page_number == previous_page:
+            fresh.append(char_start > previous_end)
+        else:
+            fresh.append(page_number > previous_page and char_start > 0)
+    return fresh
+
+
+def restartable(spans: Sequence[Span], fresh: List[bool], index: int, first_changed: int) -> bool:
+    """С начала chunk index можно разбивать заново: его состояние не зависит от изменённых страниц"""
+    if not fresh[index] or spans[index][2] >= first_changed or index + 1 == len(spans):
+        return False
+    following = spans[index + 1]
+    if following[0] >= first_changed:
+        return False
+    # Первое предложение chunk закончилось до начала следующего chunk
+    return fresh[index + 1] or following[:2] < spans[index][2:]
+
+
+def window_pages(numbers: Iterable[int], start: Position, end: Position) -> List[int]:
+    low = start[0] if start else float("-inf")
+    high = end[0] if end else float("inf")
+    return [number for number in numbers if low <= number <= high]
+
+
+def chunk_window(pages: Dict[int, str], numbers: List[int], start: Position, end: Position,
+                 max_tokens: int, min_tokens: int = 0, overlap_tokens: int = 0) -> List[dict]:
+    """Chunks участка текста от start до end (смещения — на страницах текста)"""
+    window = []
+    for number in window_pages(numbers, start, end):
+        text = pages.get(number, "")
+        low = start[1] if start and number == start[0] else 0
+        high = end[1] if end and number == end[0] else len(text)
+        if end and number == end[0] and high == 0:
+            break
+        window.append((number, text[low:high]))
+
+    chunks = chunk_pages(window, max_tokens, min_tokens, overlap_tokens)
+    if start:
+        for chunk in chunks:
+            if chunk["page_number"] == start[0]:
+                chunk["char_start"] += start[1]
+            if chunk["page_end"] == start[0]:
+                chunk["char_end"] += start[1]
+    return chunks
+
+
+def span_of(chunk: dict) -> Span:
+    return chunk["page_number"], chunk["char_start"], chunk["page_end"], chunk["char_end"]
+
+
+def rechunk_spans(spans: Sequence[Span], changed: List[int], numbers: List[int],
+                  load: Callable[[List[int]], Dict[int, str]], max_tokens: int,
+                  min_tokens: int = 0, overlap_tokens: int = 0) -> Tuple[List[int], List[dict]]:
+    """
+    Индексы сохраняемых старых chunks и новые chunks (как у chunk_pages).
+    spans — старые chunks по порядку (разбиение старого текста с теми же настройками),
+    changed — отсортированные номера изменённых, добавленных и удалённых страниц,
+    numbers — страницы нового текста, load(номера) -> {номер: текст} нового текста.
+    """
+    fresh = fresh_starts(spans)
+    clean = [i for i in range(len(spans)) if fresh[i]]
+    clean_pages = [spans[i][0] for i in clean]
+    clean_at = {spans[i][:2]: i for i in clean}
+
+    kept: List[int] = []
+    created: List[dict] = []
+    done, cursor = 0, None  # старые chunks до done разобраны; в cursor состояние пустое
+    next_changed = 0
+    while next_changed < len(changed):
+        first = changed[next_changed]
+        begin, start = done, cursor
+        for i in range(done, len(spans)):
+            if spans[i][0] >= first:
+                break
+            if restartable(spans, fresh, i, first):
+                begin, start = i, spans[i][:2]
+        kept.extend(range(done, begin))
+
+        # Концы окна — старые чистые начала за первой изменённой страницей: 2-е, 3-е, 5-е, 9-е...
+        after = bisect_right(clean_pages, first)
+        step = 1
+        while True:
+            end = spans[clean[after + step]][:2] if after + step < len(clean) else None
+            window = chunk_window(load(window_pages(numbers, start, end)), numbers, start, end,
+                                  max_tokens, min_tokens, overlap_tokens)
+            if end is None:
+                created.extend(window)
+                done, next_changed = len(spans), len(changed)
+                break
+            met = converged(window, clean_at, changed, end)
+            if met is not None:
+                created.extend(window[:met[0]])
+                done, cursor = met[1], spans[met[1]][:2]
+                next_changed = bisect_left(changed, cursor[0])
+                break
+            step *= 2
+    kept.extend(range(done, len(spans)))
+    return kept, created
+
+
+def converged(window: List[dict], clean_at: Dict[tuple, int], changed: List[int],
+              end: Tuple[int, int]) -> Optional[Tuple[int, int]]:
+    """
+    (номер chunk окна, индекс старого chunk) первого совпадения: новый chunk начинается
+    с пустым состоянием там же, где старый чистый, и от него до конца окна нет изменений
+    """
+    spans = [span_of(chunk) for chunk in window]
+    fresh = fresh_starts(spans)
+    for j in range(1, len(spans)):
+        position = spans[j][:2]
+        index = clean_at.get(position)
+        if not fresh[j] or index is None or position >= end:
+            continue
+        i = bisect_left(changed, position[0])
+        if i == len(changed) or changed[i] > end[0]:
+            return j, index
+    return None
+
+
+# ============================================================
+# ХЕШИ
+# ============================================================
+
+def digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def page_hash(text: Optional[str]) -> str:
+    return digest(text or "")
+
+
+def chunk_hash(text: str) -> str:
+    """Хеш текста chunk: NFC, пробелы схлопнуты и обрезаны по краям"""
+    return digest(SPACE_RE.sub(" ", unicodedata.normalize("NFC", text)).strip())
@@ -0,0 +1,213 @@
+"""
+Сжатие ответов API (brotli / gzip)
+
+ASGI middleware: кодировка выбирается по Accept-Encoding (br, если установлен brotli,
+иначе gzip), сжимаются только текстовые ответы не меньше COMPRESSION_MIN_SIZE.
+Не сжимаются:
+- SSE (text/event-stream) — события должны уходить клиенту сразу, без буферизации
+- изображения, PDF и прочие бинарные ответы (уже сжаты, плюс Range-запросы к PDF)
+- частичные ответы (206) и ответы с уже заданным Content-Encoding
+
+Потоковые ответы (NDJSON) сжимаются по частям: после каждой части компрессор
+сбрасывается (flush), клиент получает данные без задержки.
+Данные от thread_min_size байт сжимаются в потоке (asyncio.to_thread): сжатие
+многомегабайтного ответа не останавливает event loop.
+"""
+
+import zlib
+import asyncio
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+NEVER_COMPRESS_TYPES = ("text/event-stream",)
+
+
+def accepted_encodings(accept_encoding: str) -> dict:
+    """Accept-Encoding -> {кодировка: q}"""
+    encodings = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[name.strip().lower()] = q
+    return encodings
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    encodings = accepted_encodings(accept_encoding)
+    wildcard = encodings.get("*", 0.0)
+    if HAS_BROTLI and encodings.get("br", wildcard) > 0:
+        return "br"
+    if encodings.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+def is_compressible(content_type: str) -> bool:
+    content_type = content_type.lower()
+    if content_type.startswith(NEVER_COMPRESS_TYPES):
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class StreamCompressor:
+    """Компрессор с промежуточным flush (для потоковых ответов)"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4,
+                 thread_min_size: int = 256 * 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.thread_min_size = thread_min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        responder = CompressionResponder(send, encoding, self)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    """
+    Решение о сжатии принимается на первой части тела, когда известны заголовки.
+    Ответ с Content-Length (в том числе пропущенный частями через BaseHTTPMiddleware)
+    собирается целиком и сжимается за один раз; ответ без длины — настоящий поток,
+    сжимается по частям.
+    """
+
+    def __init__(self, send: Send, encoding: str, options: CompressionMiddleware):
+        self._send = send
+        self.encoding = encoding
+        self.options = options
+        self.start_message: Optional[Message] = None
+        self.headers: Optional[MutableHeaders] = None
+        self.compressor: Optional[StreamCompressor] = None
+        self.mode = None  # passthrough | buffer | stream
+        self.buffer = []
+
+    def choose_mode(self, first_body: bytes, more_body: bool) -> str:
+        status = self.start_message["status"]
+        headers = self.headers
+        if status < 200 or status in (204, 206, 304):
+            return "passthrough"
+        if "content-encoding" in headers or "content-range" in headers:
+            return "passthrough"
+        if not is_compressible(headers.get("content-type", "")):
+            return "passthrough"
+
+        declared = headers.get("content-length")
+        if declared is not None:
+            size = int(declared)
+        elif not more_body:
+            size = len(first_body)
+        else:
+            return "stream"
+        return "buffer" if size >= self.options.minimum_size else "passthrough"
+
+    def set_encoding_headers(self):
+        headers = self.headers
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if "etag" in headers and not headers["etag"].startswith("W/"):
+            headers["ETag"] = f'W/{headers["etag"]}'  # сжатое представление — другие байты
+
+    async def compress(self, data: bytes, finish: bool) -> bytes:
+        """Сжать часть тела; большие части — в потоке"""
+        def run() -> bytes:
+            compressed = self.compressor.compress(data) if data else b""
+            return compressed + self.compressor.finish() if finish else compressed
+
+        if len(data) >= self.options.thread_min_size:
+            return await asyncio.to_thread(run)
+        return run()
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            self.headers = MutableHeaders(raw=message["headers"])
+            return
+
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.mode is None:
+            self.mode = self.choose_mode(body, more_body)
+            if self.mode != "passthrough":
+                self.compressor = StreamCompressor(self.encoding, self.options.gzip_level, self.options.brotli_quality)
+                self.set_encoding_headers()
+            if self.mode == "stream":
+                del self.headers["Content-Length"]
+                await self._send(self.start_message)
+            elif self.mode == "passthrough":
+                await self._send(self.start_message)
+
+        if self.mode == "passthrough":
+            await self._send(message)
+
+        elif self.mode == "buffer":
+            self.buffer.append(body)
+            if not more_body:
+                compressed = await self.compress(b"".join(self.buffer), finish=True)
+                self.buffer = []
+                self.headers["Content-Length"] = str(len(compressed))
+                await self._send(self.start_message)
+                await self._send({"type": "http.response.body", "body": compressed})
+
+        else:
+            data = await self.compress(body, finish=not more_body)
+            if data or not more_body:
+                await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
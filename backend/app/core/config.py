@@ -22,6 +22,13 @@ class Settings(BaseSettings):
         "https://advocat.starec.ai"
     ]
 
+    # Сжатие ответов (brotli, если установлен, иначе gzip)
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024  # байт, меньшие ответы не сжимаются
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4  # 0-11, выше 5 заметно медленнее
+    COMPRESSION_THREAD_MIN_SIZE: int = 256 * 1024  # байт, ответы больше сжимаются в потоке (не блокируют event loop)
+
     # База данных PostgreSQL
     POSTGRES_SERVER: str = "localhost"
     POSTGRES_PORT: int = 5433
@@ -33,12 +40,33 @@ class Settings(BaseSettings):
     USE_SQLITE: bool = os.getenv("USE_SQLITE", "true").lower() == "true"
     SQLITE_PATH: str = os.getenv("SQLITE_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "local_starec.db"))
 
+    # Профиль SQLite (WAL, кеш, mmap, ожидание блокировки)
+    SQLITE_BUSY_TIMEOUT_MS: int = 30000
+    SQLITE_CACHE_SIZE_KB: int = 64 * 1024  # 64 MB кеш страниц на соединение
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024  # 256 MB memory-mapped I/O
+    SQLITE_SINGLE_WRITER: bool = True  # потоковые записи (страницы OCR) через один поток-писатель
+
+    # Пул соединений (синхронный и асинхронный движки, у каждого свой пул)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT: int = 30  # секунд ожидания свободного соединения
+    DB_POOL_RECYCLE: int = 1800  # секунд жизни соединения (PostgreSQL)
+
+    AUTO_MIGRATE: bool = os.getenv("AUTO_MIGRATE", "true").lower() == "true"  # alembic upgrade head при старте
+
     @property
     def DATABASE_URL(self) -> str:
         if self.USE_SQLITE:
             return f"sqlite:///{self.SQLITE_PATH}"
         return f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
 
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        """URL для асинхронного движка (aiosqlite / asyncpg)"""
+        if self.USE_SQLITE:
+            return f"sqlite+aiosqlite:///{self.SQLITE_PATH}"
+        return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
+
     # MongoDB
     MONGODB_URL: str = "mongodb://localhost:27018/starec_advocat"
     MONGODB_DB: str = "starec_advocat"
@@ -68,11 +96,21 @@ class Settings(BaseSettings):
     # Google Drive API
     GOOGLE_CLIENT_ID: str = os.getenv("GOOGLE_CLIENT_ID", "")
     GOOGLE_CLIENT_SECRET: str = os.getenv("GOOGLE_CLIENT_SECRET", "")
+    GOOGLE_API_KEY: str = os.getenv("GOOGLE_API_KEY", "")  # для публичных файлов и папок, только из окружения
+    GDRIVE_API_BASE: str = os.getenv("GDRIVE_API_BASE", "https://www.googleapis.com/drive/v3")
+    GDRIVE_DOWNLOAD_CONCURRENCY: int = 4  # сколько файлов скачивать одновременно
 
     # Файловое хранилище
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "./uploads")
     PROCESSED_DIR: str = os.getenv("PROCESSED_DIR", "./processed")
 
+    # Кеш изображений страниц
+    PAGE_IMAGE_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024  # 2 GB
+    PAGE_IMAGE_FEED_FROM_PROCESSING: bool = True  # класть в кеш рендеры OCR и выделения документов
+
+    # Кеш вырезок документов (PDF отдельных документов тома)
+    DOCUMENT_SLICE_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024  # 1 GB
+
     # OCR настройки
     TESSERACT_CMD: str = "/usr/bin/tesseract"
     OCR_LANGUAGE: str = "rus+eng"
@@ -82,6 +120,47 @@ class Settings(BaseSettings):
     MAX_VOLUMES_PER_CASE: int = 500
     MAX_DOCUMENTS_PER_VOLUME: int = 100
 
+    # Возобновляемая загрузка
+    UPLOAD_SESSION_TTL_HOURS: int = 24  # незавершённые загрузки удаляются после простоя
+    UPLOAD_MAX_CHUNK_SIZE: int = 64 * 1024 * 1024  # 64 MB на один PATCH
+    CASE_ARCHIVE_MAX_SIZE: int = 200 * 1024 * 1024 * 1024  # 200 GB — импорт архива дела
+
+    # Фоновая обработка томов
+    BACKGROUND_WORKERS: int = 2  # потоков для фоновых задач
+    INGEST_ON_UPLOAD: bool = True  # подготовка тома сразу после загрузки
+    INGEST_OCR_POLICY: str = os.getenv("INGEST_OCR_POLICY", "auto")  # auto (только сканы), all, none
+    PDF_NORMALIZE: bool = os.getenv("PDF_NORMALIZE", "true").lower() == "true"  # оптимизированная копия для просмотра
+    PAGE_TEXT_ZSTD: bool = os.getenv("PAGE_TEXT_ZSTD", "false").lower() == "true"  # текст страниц сжатым zstd (SQLite)
+    OCR_RUN_STALE_SECONDS: int = 600  # запуск OCR без записи страниц дольше — брошен (процесс на другом хосте)
+
+    # Хранение старых запусков OCR и выделения документов
+    RUN_RETENTION_PREVIOUS: int = int(os.getenv("RUN_RETENTION_PREVIOUS", "2"))  # кроме текущего; для дела — Case.run_retention
+    RETENTION_MODE: str = os.getenv("RETENTION_MODE", "delete")  # delete, archive (gzip NDJSON в PROCESSED_DIR/archive)
+    RETENTION_BATCH_SIZE: int = 500  # строк за одну транзакцию удаления
+    RETENTION_VACUUM: str = os.getenv("RETENTION_VACUUM", "incremental")  # incremental, full (блокирует базу), none — SQLite
+    RETENTION_ON_STARTUP: bool = True  # проход компактора по всем делам при старте
+
+    # Разбиение текста тома на chunks (app.core.chunking), токены — слова
+    CHUNK_MAX_TOKENS: int = int(os.getenv("CHUNK_MAX_TOKENS", "200"))
+    CHUNK_MIN_TOKENS: int = 60  # абзац закрывает chunk не короче этого
+    CHUNK_OVERLAP_TOKENS: int = 40  # перекрытие соседних chunks целыми предложениями
+
+    # Векторы chunks (embeddings)
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "auto")  # auto, hashing, onnx, openai
+    EMBEDDING_MODEL_PATH: str = os.getenv("EMBEDDING_MODEL_PATH", "")  # каталог с model.onnx и tokenizer.json
+    EMBEDDING_OPENAI_MODEL: str = "text-embedding-3-small"
+    EMBEDDING_DIM: int = 512  # размер вектора hashing-бэкенда
+    EMBEDDING_MAX_TOKENS: int = 256  # обрезка chunk для onnx-модели
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+    EMBEDDING_THREADS: int = int(os.getenv("EMBEDDING_THREADS", "2"))
+    EMBEDDING_STORAGE_DTYPE: str = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32")  # float32, float16, int8 — в базе
+    VECTOR_MATRIX_DTYPE: str = os.getenv("VECTOR_MATRIX_DTYPE", "float32")  # float16 — вдвое меньше файл, но перебор ~10x медленнее
+    VECTOR_SYNC_INTERVAL: int = 10  # секунд между сверками матрицы дела с базой
+    VECTOR_INDEX_MIN_VECTORS: int = 20000  # меньшие дела — точный перебор без индекса
+    VECTOR_INDEX_NPROBE: int = int(os.getenv("VECTOR_INDEX_NPROBE", "32"))  # списков IVF на запрос
+    VECTOR_INDEX_RERANK: int = 200  # кандидатов на точный пересчёт по float32
+    VECTOR_INDEX_REBUILD_FRACTION: float = 0.1  # доля дописанных векторов, после которой индекс пересобирается
+
     # Celery Workers
     CELERY_OCR_WORKERS: int = 3
     CELERY_ANALYSIS_WORKERS: int = 2
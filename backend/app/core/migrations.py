@@ -0,0 +1,67 @@
+"""
+Применение миграций Alembic при старте приложения
+
+Базы, созданные до появления миграций (database_schema.sql в docker-compose,
+локальная SQLite), не имеют таблицы alembic_version. Для них ревизия определяется
+по структуре базы и проставляется (stamp), после чего применяются недостающие миграции.
+"""
+
+import os
+
+from sqlalchemy import inspect
+
+from app.models.database import engine as default_engine
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "alembic.ini")
+
+BASELINE_REVISION = "0001"
+STORAGE_REVISION = "0002"
+INDEXES_REVISION = "0003"
+HEAD_REVISION = "head"
+
+
+def get_alembic_config(connection=None):
+    from alembic.config import Config
+
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "alembic"))
+    config.attributes["configure_logger"] = False
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+
+def detect_revision(connection):
+    """Ревизия базы без alembic_version (None — база пустая, миграции с нуля)"""
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+
+    if "alembic_version" in tables or "volumes" not in tables:
+        return None
+
+    if "file_blobs" not in tables:
+        return BASELINE_REVISION
+
+    # database_schema.sql уже содержит ограничения 0003; следующие миграции идемпотентны
+    page_text_uniques = {c["name"] for c in inspector.get_unique_constraints("page_texts")} if "page_texts" in tables else set()
+    if "uq_page_texts_run_page" in page_text_uniques:
+        return INDEXES_REVISION
+
+    return STORAGE_REVISION
+
+
+def upgrade_database(engine=None):
+    """Привести схему базы к последней миграции"""
+    from alembic import command
+
+    engine = engine or default_engine
+
+    with engine.begin() as connection:
+        config = get_alembic_config(connection)
+
+        legacy_revision = detect_revision(connection)
+        if legacy_revision:
+            print(f"[MIGRATIONS] База без истории миграций, ревизия {legacy_revision}")
+            command.stamp(config, legacy_revision)
+
+        command.upgrade(config, HEAD_REVISION)
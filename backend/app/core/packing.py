@@ -0,0 +1,286 @@
+"""
+Компактное хранение текста страниц и координат слов
+
+Координаты слов (word boxes) хранятся не JSON, а колонками фиксированной ширины:
+left, top, width, height — int16, conf — uint8, слово — смещение и длина в тексте
+страницы (сам текст слова не повторяется). ~15 байт на слово вместо ~80 в JSON.
+Разбор ленивый: WordBoxes только размечает колонки в blob, словари строятся при обращении.
+
+Формат blob: заголовок <BBII> (версия, флаги, число слов, длина хвоста в байтах), колонки,
+хвост — UTF-8 слова, которых нет в тексте страницы (их смещения отсчитываются от конца текста).
+Флаг 1 — тело сжато zstd.
+
+Текст страницы может храниться сжатым zstd (PAGE_TEXT_ZSTD, только SQLite: PostgreSQL
+сжимает длинный текст сам, TOAST). Тогда page_texts.text = NULL, текст — в text_zstd.
+
+Векторы chunks (text_chunks.embedding_packed): заголовок <BBHf> (версия, тип, размерность,
+масштаб) и значения float32, float16 или int8 (int8 — значение / масштаб, масштаб = max|x| / 127).
+Чтение — np.frombuffer, без разбора JSON.
+"""
+
+import sys
+import struct
+from array import array
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.responses import dumps, loads
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+# ============================================================
+# НАСТРОЙКИ
+# ============================================================
+FORMAT_VERSION = 1
+FLAG_ZSTD = 1
+HEADER = struct.Struct("<BBII")
+INT16_COLUMNS = ("left", "top", "width", "height")
+BYTES_PER_WORD = 2 * len(INT16_COLUMNS) + 1 + 4 + 2  # координаты, conf, смещение, длина
+ZSTD_LEVEL = 3
+ZSTD_MIN_BYTES = 256  # меньшие данные не сжимаются — выигрыш съедает заголовок zstd
+
+LITTLE_ENDIAN = sys.byteorder == "little"
+
+VECTOR_VERSION = 1
+VECTOR_HEADER = struct.Struct("<BBHf")
+VECTOR_DTYPES = {"float32": (1, "<f4"), "float16": (2, "<f2"), "int8": (3, "i1")}
+VECTOR_CODES = {code: dtype for code, dtype in VECTOR_DTYPES.values()}
+
+_compressor = None
+_decompressor = None
+
+
+class PackingError(ValueError):
+    pass
+
+
+def compress(data: bytes) -> bytes:
+    global _compressor
+    if _compressor is None:
+        _compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+    return _compressor.compress(data)
+
+
+def decompress(data: bytes) -> bytes:
+    global _decompressor
+    if not HAS_ZSTD:
+        raise PackingError("Данные сжаты zstd, а пакет zstandard не установлен")
+    if _decompressor is None:
+        _decompressor = zstandard.ZstdDecompressor()
+    return _decompressor.decompress(data)
+
+
+# ============================================================
+# ТЕКСТ СТРАНИЦЫ
+# ============================================================
+
+def pack_text(text: Optional[str], use_zstd: bool) -> Tuple[Optional[str], Optional[bytes]]:
+    """Значения колонок (text, text_zstd) для записи страницы"""
+    if not text or not use_zstd or not HAS_ZSTD:
+        return text, None
+    raw = text.encode("utf-8")
+    if len(raw) < ZSTD_MIN_BYTES:
+        return text, None
+    return None, compress(raw)
+
+
+def page_text_of(page) -> Optional[str]:
+    """Текст страницы (ORM-объект или строка запроса с колонками text и text_zstd)"""
+    if page.text is not None:
+        return page.text
+    packed = getattr(page, "text_zstd", None)
+    return decompress(packed).decode("utf-8") if packed else None
+
+
+# ============================================================
+# КООРДИНАТЫ СЛОВ
+# ============================================================
+
+def clamp_int16(value) -> int:
+    return max(-32768, min(32767, int(value)))
+
+
+def pack_word_boxes(boxes: Iterable[dict], page_text: Optional[str], use_zstd: bool = True) -> Optional[bytes]:
+    """
+    Упаковать слова {"text", "left", "top", "width", "height", "conf"}.
+    Слово ищется в тексте страницы после предыдущего; не найденное уходит в хвост.
+    """
+    boxes = list(boxes)
+    if not boxes:
+        return None
+
+    page_text = page_text or ""
+    columns = {name: array("h") for name in INT16_COLUMNS}
+    conf = bytearray()
+    starts = array("I")
+    lengths = array("H")
+    tail: List[str] = []
+    tail_offset = len(page_text)
+    cursor = 0
+
+    for box in boxes:
+        word = box.get("text") or ""
+        position = page_text.find(word, cursor) if word else cursor
+        if position < 0:
+            position = tail_offset
+            tail.append(word)
+            tail_offset += len(word)
+        else:
+            cursor = position + len(word)
+        for name in INT16_COLUMNS:
+            columns[name].append(clamp_int16(box.get(name, 0)))
+        conf.append(max(0, min(255, int(box.get("conf", 0) or 0))))
+        starts.append(position)
+        lengths.append(min(len(word), 65535))
+
+    numeric = [columns[name] for name in INT16_COLUMNS] + [starts, lengths]
+    if not LITTLE_ENDIAN:
+        for column in numeric:
+            column.byteswap()
+
+    tail_bytes = "".join(tail).encode("utf-8")
+    body = b"".join([
+        *(columns[name].tobytes() for name in INT16_COLUMNS),
+        bytes(conf), starts.tobytes(), lengths.tobytes(), tail_bytes
+    ])
+
+    flags = 0
+    if use_zstd and HAS_ZSTD and len(body) >= ZSTD_MIN_BYTES:
+        body = compress(body)
+        flags |= FLAG_ZSTD
+    return HEADER.pack(FORMAT_VERSION, flags, len(boxes), len(tail_bytes)) + body
+
+
+class WordBoxes:
+    """
+    Упакованные координаты слов страницы.
+    Колонки — представления blob (array), слово и словарь строятся только при обращении.
+    """
+
+    def __init__(self, blob: bytes, page_text: Optional[str]):
+        version, flags, count, tail_size = HEADER.unpack_from(blob)
+        if version != FORMAT_VERSION:
+            raise PackingError(f"Неизвестная версия формата word boxes: {version}")
+        body = blob[HEADER.size:]
+        if flags & FLAG_ZSTD:
+            body = decompress(body)
+        if len(body) != count * BYTES_PER_WORD + tail_size:
+            raise PackingError("Повреждённые word boxes: размер не совпадает с заголовком")
+
+        self.count = count
+        self._body = body
+        self._page_text = page_text or ""
+        self._tail_size = tail_size
+        self._columns = None
+
+    def _column(self, typecode: str, offset: int, size: int) -> array:
+        column = array(typecode)
+        column.frombytes(self._body[offset:offset + size * self.count])
+        if not LITTLE_ENDIAN:
+            column.byteswap()
+        return column
+
+    @property
+    def columns(self) -> dict:
+        """Колонки left/top/width/height/conf/start/length (разбираются при первом обращении)"""
+        if self._columns is None:
+            n = self.count
+            columns = {}
+            offset = 0
+            for name in INT16_COLUMNS:
+                columns[name] = self._column("h", offset, 2)
+                offset += 2 * n
+            columns["conf"] = self._body[offset:offset + n]
+            offset += n
+            columns["start"] = self._column("I", offset, 4)
+            offset += 4 * n
+            columns["length"] = self._column("H", offset, 2)
+            offset += 2 * n
+            self._full_text = self._page_text + self._body[offset:].decode("utf-8")
+            self._columns = columns
+        return self._columns
+
+    def __len__(self) -> int:
+        return self.count
+
+    def word(self, index: int) -> str:
+        columns = self.columns
+        start = columns["start"][index]
+        return self._full_text[start:start + columns["length"][index]]
+
+    def __getitem__(self, index: int) -> dict:
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        columns = self.columns
+        box = {"text": self.word(index)}
+        for name in INT16_COLUMNS:
+            box[name] = columns[name][index]
+        box["conf"] = columns["conf"][index]
+        return box
+
+    def to_list(self) -> List[dict]:
+        """Слова в формате API (тот же, что у JSON word_boxes)"""
+        if not self.count:
+            return []
+        c = self.columns
+        text = self._full_text
+        return [
+            {"text": text[s:s + n], "left": l, "top": t, "width": w, "height": h, "conf": cf}
+            for s, n, l, t, w, h, cf in zip(c["start"], c["length"], c["left"], c["top"], c["width"], c["height"], c["conf"])
+        ]
+
+    def to_json(self) -> str:
+        return dumps(self.to_list())
+
+
+def word_boxes_of(page, page_text: Optional[str] = None) -> List[dict]:
+    """Слова страницы: упакованные (word_boxes_packed) или старый JSON (word_boxes)"""
+    packed = getattr(page, "word_boxes_packed", None)
+    if packed:
+        return WordBoxes(packed, page_text if page_text is not None else page_text_of(page)).to_list()
+    legacy = getattr(page, "word_boxes", None)
+    return loads(legacy) if legacy else []
+
+
+def word_boxes_json_of(page, page_text: Optional[str] = None) -> str:
+    """То же, сразу JSON-строкой (старый JSON отдаётся без разбора)"""
+    packed = getattr(page, "word_boxes_packed", None)
+    if packed:
+        return WordBoxes(packed, page_text if page_text is not None else page_text_of(page)).to_json()
+    return getattr(page, "word_boxes", None) or "[]"
+
+
+# ============================================================
+# ВЕКТОРЫ
+# ============================================================
+
+def pack_vector(vector, dtype: str = "float32") -> bytes:
+    """Вектор chunk -> blob (float32, float16 или int8 с масштабом)"""
+    if dtype not in VECTOR_DTYPES:
+        raise PackingError(f"Неизвестный тип вектора: {dtype}")
+    code, numpy_dtype = VECTOR_DTYPES[dtype]
+    values = np.asarray(vector, dtype=np.float32).ravel()
+    scale = 1.0
+    if dtype == "int8":
+        peak = float(np.abs(values).max()) if values.size else 0.0
+        scale = peak / 127 if peak > 0 else 1.0
+        values = np.rint(values / scale)
+    return VECTOR_HEADER.pack(VECTOR_VERSION, code, values.size, scale) + values.astype(numpy_dtype).tobytes()
+
+
+def unpack_vector(blob: bytes) -> np.ndarray:
+    """blob -> вектор float32"""
+    version, code, dim, scale = VECTOR_HEADER.unpack_from(blob)
+    if version != VECTOR_VERSION or code not in VECTOR_CODES:
+        raise PackingError(f"Неизвестный формат вектора: версия {version}, тип {code}")
+    values = np.frombuffer(blob, dtype=VECTOR_CODES[code], count=dim, offset=VECTOR_HEADER.size)
+    if code == VECTOR_DTYPES["int8"][0]:
+        return values.astype(np.float32) * np.float32(scale)
+    return values.astype(np.float32)
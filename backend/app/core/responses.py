@@ -0,0 +1,46 @@
+"""
+Сериализация ответов API
+
+orjson в несколько раз быстрее стандартного json и сразу отдаёт UTF-8 (кириллица
+не превращается в \\uXXXX — ответы меньше). Если orjson не установлен — стандартный json.
+"""
+
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+def dumps(data: Any) -> str:
+    """JSON-строка (компактная, UTF-8 без экранирования)"""
+    if HAS_ORJSON:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def loads(data):
+    return orjson.loads(data) if HAS_ORJSON else json.loads(data)
+
+
+def sse_event(data: Any) -> str:
+    """Событие Server-Sent Events"""
+    return f"data: {dumps(data)}\n\n"
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Ответ по умолчанию для всех роутеров.
+    Endpoints с большими ответами возвращают его напрямую — тогда FastAPI
+    не прогоняет данные через jsonable_encoder (данные должны быть уже простыми типами).
+    """
+
+    def render(self, content: Any) -> bytes:
+        if HAS_ORJSON:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
@@ -9,7 +9,16 @@ from fastapi.responses import JSONResponse
 import time
 
 from app.core.config import settings
-from app.api.v1 import auth, cases, documents, analysis, strategy
+from app.core.responses import FastJSONResponse
+from app.core.compression import CompressionMiddleware
+from app.core.migrations import upgrade_database
+from app.models.database import SessionLocal, async_engine
+from app.services.storage_service import cleanup_expired_upload_sessions
+from app.services import jobs
+from app.services.ingest_service import recover_unfinished
+from app.services.search_service import schedule_backfill
+from app.services import retention_service
+from app.api.v1 import auth, cases, documents, analysis, strategy, uploads
 
 # Создание FastAPI приложения
 app = FastAPI(
@@ -18,6 +27,7 @@ app = FastAPI(
     version="2.0.0",
     docs_url="/api/docs",
     redoc_url="/api/redoc",
+    default_response_class=FastJSONResponse,
 )
 
 # CORS middleware
@@ -38,6 +48,16 @@ async def add_process_time_header(request: Request, call_next):
     response.headers["X-Process-Time"] = str(process_time)
     return response
 
+# Сжатие ответов (внешний слой — сжимается уже готовый ответ)
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_SIZE,
+        gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+        thread_min_size=settings.COMPRESSION_THREAD_MIN_SIZE
+    )
+
 # Обработка ошибок
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -74,6 +94,9 @@ app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(cases.router, prefix="/api/v1/cases", tags=["Cases"])
 app.include_router(cases.router, prefix="/api/cases", tags=["Cases"])
 
+app.include_router(uploads.router, prefix="/api/v1/uploads", tags=["Uploads"])
+app.include_router(uploads.router, prefix="/api/uploads", tags=["Uploads"])
+
 app.include_router(documents.router, prefix="/api/v1/documents", tags=["Documents"])
 app.include_router(documents.router, prefix="/api/documents", tags=["Documents"])
 
@@ -90,9 +113,46 @@ async def startup_event():
     print(f"📝 Документация: http://localhost:8000/api/docs")
     print(f"🔧 Режим: {'DEBUG' if settings.DEBUG else 'PRODUCTION'}")
 
+    # Схема базы — через миграции Alembic
+    if settings.AUTO_MIGRATE:
+        upgrade_database()
+
+    # Удаляем брошенные возобновляемые загрузки
+    db = SessionLocal()
+    try:
+        cleanup_expired_upload_sessions(db)
+    except Exception as e:
+        print(f"⚠️ Не удалось очистить просроченные загрузки: {e}")
+    finally:
+        db.close()
+
+    # Продолжаем подготовку томов, прерванную перезапуском
+    db = SessionLocal()
+    try:
+        recovered = recover_unfinished(db)
+        if recovered:
+            print(f"🔄 Подготовка томов возобновлена: {recovered}")
+    except Exception as e:
+        print(f"⚠️ Не удалось возобновить подготовку томов: {e}")
+    finally:
+        db.close()
+
+    # Индексируем для поиска страницы, записанные до появления индекса
+    try:
+        if schedule_backfill():
+            print("🔎 Индексация страниц для поиска запущена")
+    except Exception as e:
+        print(f"⚠️ Не удалось запустить индексацию для поиска: {e}")
+
+    # Удаляем запуски OCR и выделения сверх политики хранения
+    if settings.RETENTION_ON_STARTUP:
+        retention_service.schedule_all()
+
 # Shutdown event
 @app.on_event("shutdown")
 async def shutdown_event():
+    jobs.shutdown()
+    await async_engine.dispose()
     print("🛑 Starec-Advocat API остановлен")
 
 if __name__ == "__main__":
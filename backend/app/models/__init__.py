@@ -2,17 +2,20 @@
 Модели базы данных
 """
 
-from app.models.database import Base, get_db
+from app.models.database import Base, get_db, get_async_db
 from app.models.user import User
-from app.models.case import Case, Volume, Document, ExtractionRun, PageText, OcrRun, TextChunk
+from app.models.case import Case, FileBlob, Volume, UploadSession, Document, ExtractionRun, PageText, OcrRun, TextChunk
 from app.models.analysis import Entity, DocumentAnalysis, CaseAnalysis, DefenseStrategy
 
 __all__ = [
     "Base",
     "get_db",
+    "get_async_db",
     "User",
     "Case",
+    "FileBlob",
     "Volume",
+    "UploadSession",
     "Document",
     "ExtractionRun",
     "PageText",
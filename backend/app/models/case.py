@@ -2,7 +2,7 @@
 Модель дела
 """
 
-from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, ForeignKey, Text, LargeBinary, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -27,6 +27,7 @@ class Case(Base):
 
     # Метаданные
     notes = Column(Text)
+    run_retention = Column(Integer)  # сколько предыдущих запусков OCR/выделения хранить (NULL — RUN_RETENTION_PREVIOUS)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -38,22 +39,51 @@ class Case(Base):
     strategies = relationship("DefenseStrategy", back_populates="case", cascade="all, delete-orphan")
 
 
+class FileBlob(Base):
+    """Содержимое PDF файла, адресуемое по SHA-256 (одна копия на диске для всех томов)"""
+    __tablename__ = "file_blobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True, index=True, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    storage_path = Column(String(1000), nullable=False)
+
+    # Сколько томов ссылается на файл (0 = файл можно удалить)
+    ref_count = Column(Integer, default=0, nullable=False)
+
+    # Метаданные
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Связи
+    volumes = relationship("Volume", back_populates="blob")
+
+
 class Volume(Base):
     __tablename__ = "volumes"
+    __table_args__ = (
+        # Список томов дела, следующий номер тома
+        Index("ix_volumes_case_number", "case_id", "volume_number"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     case_id = Column(Integer, ForeignKey("cases.id"), nullable=False)
+    blob_id = Column(Integer, ForeignKey("file_blobs.id"), nullable=True, index=True)
 
     # Информация о томе
     volume_number = Column(Integer, nullable=False)
-    gdrive_file_id = Column(String(255))
+    gdrive_file_id = Column(String(255), index=True)
+    gdrive_md5 = Column(String(32))  # md5Checksum из Drive на момент синхронизации
+    gdrive_modified_time = Column(String(40))  # modifiedTime из Drive (RFC 3339)
     file_name = Column(String(500))
     file_size = Column(Integer)  # в байтах
+    file_hash = Column(String(64), index=True)  # SHA-256 содержимого
     page_count = Column(Integer)
+    page_manifest = Column(Text)  # JSON: размер, поворот, текстовый слой, скан, пустая — по каждой странице
+    normalization = Column(Text)  # JSON: размер и время открытия до/после нормализации PDF
 
     # OCR качество
     ocr_quality = Column(Integer)  # 0-100%
-    processing_status = Column(String(50), default="pending")  # pending, processing, completed, error
+    processing_status = Column(String(50), default="pending")  # pending, processing, ingested, ocr_queued, ocr_running, ocr_completed, failed
 
     # Метаданные
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -61,6 +91,7 @@ class Volume(Base):
 
     # Связи
     case = relationship("Case", back_populates="volumes")
+    blob = relationship("FileBlob", back_populates="volumes")
     documents = relationship("Document", back_populates="volume", cascade="all, delete-orphan")
     extraction_runs = relationship("ExtractionRun", back_populates="volume", cascade="all, delete-orphan")
     page_texts = relationship("PageText", back_populates="volume", cascade="all, delete-orphan")
@@ -68,9 +99,36 @@ class Volume(Base):
     text_chunks = relationship("TextChunk", back_populates="volume", cascade="all, delete-orphan")
 
 
+class UploadSession(Base):
+    """Возобновляемая загрузка тома чанками"""
+    __tablename__ = "upload_sessions"
+
+    id = Column(String(32), primary_key=True)  # uuid4 hex
+    case_id = Column(Integer, ForeignKey("cases.id"), nullable=False, index=True)
+
+    # Файл
+    file_name = Column(String(500), nullable=False)
+    total_size = Column(BigInteger, nullable=False)
+    committed_offset = Column(BigInteger, default=0, nullable=False)  # сколько байт записано на диск
+
+    # Статус
+    status = Column(String(20), default="active")  # active, finalized, expired, aborted
+    volume_id = Column(Integer, ForeignKey("volumes.id"), nullable=True)
+
+    # Время
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
 class ExtractionRun(Base):
     """История выделений документов (версии)"""
     __tablename__ = "extraction_runs"
+    __table_args__ = (
+        UniqueConstraint("volume_id", "version", name="uq_extraction_runs_volume_version"),
+        # Текущее выделение тома
+        Index("ix_extraction_runs_volume_current", "volume_id", "is_current"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     volume_id = Column(Integer, ForeignKey("volumes.id"), nullable=False)
@@ -99,6 +157,13 @@ class ExtractionRun(Base):
 
 class Document(Base):
     __tablename__ = "documents"
+    __table_args__ = (
+        # Документы выделения по порядку страниц
+        Index("ix_documents_run_start", "extraction_run_id", "start_page"),
+        # Старые документы без версии, вырезка по тому
+        Index("ix_documents_volume_run_start", "volume_id", "extraction_run_id", "start_page"),
+        Index("ix_documents_case", "case_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     case_id = Column(Integer, ForeignKey("cases.id"), nullable=False)
@@ -137,6 +202,14 @@ class Document(Base):
 class PageText(Base):
     """OCR текст страницы"""
     __tablename__ = "page_texts"
+    __table_args__ = (
+        # Одна страница на запуск OCR
+        UniqueConstraint("ocr_run_id", "page_number", name="uq_page_texts_run_page"),
+        # Страницы запуска тома по порядку (all-pages-text, ocr-run pages)
+        Index("ix_page_texts_volume_run_page", "volume_id", "ocr_run_id", "page_number"),
+        # Текст конкретной страницы тома
+        Index("ix_page_texts_volume_page", "volume_id", "page_number"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     volume_id = Column(Integer, ForeignKey("volumes.id"), nullable=False)
@@ -145,9 +218,12 @@ class PageText(Base):
 
     # OCR результат
     ocr_engine = Column(String(50), default="tesseract")
-    text = Column(Text)
+    text = Column(Text)  # NULL, если текст сжат (text_zstd)
+    text_zstd = Column(LargeBinary)  # текст, сжатый zstd (PAGE_TEXT_ZSTD)
+    text_hash = Column(String(32))  # app.core.chunking.page_hash — сравнение запусков при векторизации
     confidence = Column(Integer)  # 0-100%
-    word_boxes = Column(Text)  # JSON с координатами слов
+    word_boxes = Column(Text)  # JSON с координатами слов (старые записи)
+    word_boxes_packed = Column(LargeBinary)  # координаты слов колонками (app.core.packing)
 
     # Метаданные
     processed_at = Column(DateTime, default=datetime.utcnow)
@@ -160,6 +236,10 @@ class PageText(Base):
 class OcrRun(Base):
     """История запусков OCR"""
     __tablename__ = "ocr_runs"
+    __table_args__ = (
+        # Последний (завершённый) запуск тома
+        Index("ix_ocr_runs_volume_status", "volume_id", "status", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     volume_id = Column(Integer, ForeignKey("volumes.id"), nullable=False)
@@ -178,6 +258,10 @@ class OcrRun(Base):
     started_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime)
 
+    # Выполнение: процесс-владелец и время записи последней страницы (восстановление после перезапуска)
+    owner = Column(String(100))  # хост:pid:токен, см. jobs.worker_id()
+    heartbeat_at = Column(DateTime)
+
     # Связи
     volume = relationship("Volume", back_populates="ocr_runs")
     page_texts = relationship("PageText", back_populates="ocr_run", cascade="all, delete-orphan")
@@ -187,20 +271,36 @@ class OcrRun(Base):
 class TextChunk(Base):
     """Чанки текста с векторами для семантического поиска"""
     __tablename__ = "text_chunks"
+    __table_args__ = (
+        # chunk_index нумеруется в пределах страницы
+        UniqueConstraint("ocr_run_id", "page_number", "chunk_index", name="uq_text_chunks_run_page_chunk"),
+        # Чанки тома по порядку (с фильтром по запуску OCR и без)
+        Index("ix_text_chunks_volume_run_page_chunk", "volume_id", "ocr_run_id", "page_number", "chunk_index"),
+        Index("ix_text_chunks_volume_page_chunk", "volume_id", "page_number", "chunk_index"),
+        # Сверка матрицы векторов дела (app.services.vector_store) без чтения строк
+        Index("ix_text_chunks_run_model", "ocr_run_id", "embedding_model"),
+        # Переиспользование векторов по тексту chunk между запусками и томами
+        Index("ix_text_chunks_text_hash", "text_hash"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     ocr_run_id = Column(Integer, ForeignKey("ocr_runs.id"), nullable=False)
     volume_id = Column(Integer, ForeignKey("volumes.id"), nullable=False)
     page_number = Column(Integer, nullable=False)
 
-    # Текст чанка
+    # Текст чанка: смещения в страницах запуска OCR (app.core.chunking) —
+    # с page_number/char_start по page_end/char_end; text заполнен только у старых chunks
     chunk_index = Column(Integer, nullable=False)
-    text = Column(Text, nullable=False)
+    text = Column(Text)
+    page_end = Column(Integer)
     char_start = Column(Integer)
     char_end = Column(Integer)
+    text_hash = Column(String(32))  # app.core.chunking.chunk_hash
 
-    # Вектор (хранится как JSON строка)
+    # Вектор: embedding_packed — float32/float16/int8 (app.core.packing),
+    # embedding — старый JSON (миграция 0007 переносит его в embedding_packed)
     embedding = Column(Text)
+    embedding_packed = Column(LargeBinary)
     embedding_model = Column(String(100))
 
     # Метаданные
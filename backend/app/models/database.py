@@ -2,23 +2,82 @@
 Подключение к базе данных
 """
 
-from sqlalchemy import create_engine
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Callable
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
 
-# PostgreSQL Engine
+IS_SQLITE = settings.DATABASE_URL.startswith("sqlite")
+
+# SQLite: соединения используются из разных потоков (to_thread, фоновые задачи)
+connect_args = {"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000} if IS_SQLITE else {}
+
+pool_args = dict(
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE
+)
+
+# PostgreSQL Engine (или SQLite для локальной разработки)
 engine = create_engine(
     settings.DATABASE_URL,
     pool_pre_ping=True,
-    echo=settings.DEBUG
+    echo=settings.DEBUG,
+    connect_args=connect_args,
+    **pool_args
 )
 
+# Асинхронный движок для endpoints (asyncpg / aiosqlite): запросы не блокируют event loop.
+# Для aiosqlite SQLAlchemy по умолчанию не держит пул — без него каждый запрос открывал бы файл заново
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    echo=settings.DEBUG,
+    connect_args=connect_args,
+    **({"poolclass": AsyncAdaptedQueuePool} if IS_SQLITE else {}),
+    **pool_args
+)
+
+
+if IS_SQLITE:
+    @event.listens_for(engine, "connect")
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        """
+        Профиль SQLite для конкурентной работы:
+        WAL — читатели не ждут писателя, synchronous=NORMAL — без fsync на каждый коммит
+        (в WAL это безопасно при сбое приложения), кеш страниц и mmap — меньше системных вызовов,
+        busy_timeout — писатель ждёт блокировку вместо ошибки "database is locked".
+        """
+        cursor = dbapi_connection.cursor()
+        # Действует для новой базы (до первой таблицы); существующая переключается полным VACUUM
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# expire_on_commit=False: после commit атрибуты не перечитываются (ленивая загрузка в async недоступна)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 # Dependency для получения сессии БД
 def get_db():
     db = SessionLocal()
@@ -26,3 +85,114 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Dependency для асинхронной сессии БД
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# ============================================================
+# ОЧЕРЕДЬ ЗАПИСИ
+# ============================================================
+
+class DatabaseWriter:
+    """
+    Единственный поток-писатель для потоковых записей (страницы OCR, прогресс).
+    SQLite допускает одного писателя: вместо борьбы за блокировку записи идут в очередь,
+    а накопившиеся в очереди записи коммитятся одной транзакцией.
+
+    Функция записи получает сессию писателя первым аргументом и не должна делать commit.
+    """
+
+    def __init__(self, session_factory, max_batch: int = 100):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="starec-db-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Поставить запись в очередь, Future завершится после коммита"""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """Записать и дождаться коммита (из синхронного кода)"""
+        return self.submit(fn, *args, **kwargs).result()
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Записать и дождаться коммита (из async-кода, event loop не блокируется)"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        session = self.session_factory()
+        try:
+            results = [fn(session, *args, **kwargs) for fn, args, kwargs, _ in batch]
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            session.close()
+            if len(batch) > 1:
+                # Ищем виновника: каждая запись отдельной транзакцией
+                for item in batch:
+                    self._write_batch([item])
+                return
+            batch[0][3].set_exception(e)
+            return
+
+        session.close()
+        for (_, _, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+class DirectWriter:
+    """Без очереди (PostgreSQL): запись в отдельной сессии в вызывающем потоке"""
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            future.set_result(self.call(fn, *args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def call(self, fn: Callable, *args, **kwargs):
+        session = self.session_factory()
+        try:
+            result = fn(session, *args, **kwargs)
+            session.commit()
+            return result
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        return await asyncio.to_thread(self.call, fn, *args, **kwargs)
+
+
+db_writer = DatabaseWriter(SessionLocal) if IS_SQLITE and settings.SQLITE_SINGLE_WRITER else DirectWriter(SessionLocal)
@@ -0,0 +1,461 @@
+"""
+Перенос дела между развёртываниями: потоковый экспорт и импорт архива
+
+Архив — tar без сжатия (PDF уже сжаты, сжатие упёрлось бы в процессор, а не в диск):
+  manifest.json                   — формат, исходное дело, список таблиц
+  blobs/<sha256>.pdf              — файлы томов, каждый файл один раз
+  rows/<таблица>.<часть>.ndjson   — строки таблиц: первая строка — имена колонок,
+                                    дальше по строке-массиву значений на запись
+
+Экспорт формирует tar-поток сам (заголовок, данные блоками, выравнивание): архив не
+собирается ни в памяти, ни на диске. Строки таблиц режутся на части по ROWS_PART_BYTES —
+размер члена tar нужен до его данных, часть помещается в память целиком.
+
+Импорт читает tar последовательно (режим r|). Файлы пишутся во временную зону хранилища
+с проверкой SHA-256, строки вставляются пакетами через db_writer (insert ... returning),
+id переназначаются по картам "старый id -> новый". Дело создаётся со статусом importing
+и становится активным в конце; при ошибке всё импортированное удаляется.
+"""
+
+import os
+import re
+import time
+import uuid
+import base64
+import hashlib
+import tarfile
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import select, insert, Date, DateTime, LargeBinary
+
+from app.core.responses import dumps, loads
+from app.models import (
+    Case, FileBlob, Volume, OcrRun, PageText, TextChunk, ExtractionRun, Document,
+    Entity, DocumentAnalysis, CaseAnalysis, DefenseStrategy
+)
+from app.models.database import SessionLocal, db_writer
+from app.services import search_service
+from app.services.storage_service import (
+    blob_dir, blob_path, staging_path, get_volume_file_path, hash_file, release_volume_file
+)
+
+# ============================================================
+# НАСТРОЙКИ
+# ============================================================
+ARCHIVE_FORMAT = "starec-case"
+ARCHIVE_VERSION = 1
+COPY_CHUNK_SIZE = 4 * 1024 * 1024  # 4 MB — чтение и запись файлов томов
+ROWS_PART_BYTES = 8 * 1024 * 1024  # часть дампа таблицы в памяти при экспорте
+EXPORT_BATCH_SIZE = 1000  # строк из курсора БД за одно чтение
+IMPORT_BATCH_SIZE = 1000  # строк в одном insert при импорте
+TAR_BLOCK = 512
+
+BLOB_MEMBER_RE = re.compile(r"^blobs/([0-9a-f]{64})\.pdf$")
+ROWS_MEMBER_RE = re.compile(r"^rows/([a-z_]+)\.(\d+)\.ndjson$")
+BLOB_COLUMN = "_blob_sha256"  # вместо volumes.blob_id: файл ищется по хешу
+
+
+class CaseArchiveError(ValueError):
+    pass
+
+
+# Таблицы дела в порядке зависимостей: (таблица, модель, внешние ключи -> таблица карты id)
+TABLES = [
+    ("cases", Case, {}),
+    ("volumes", Volume, {"case_id": "cases"}),
+    ("ocr_runs", OcrRun, {"volume_id": "volumes"}),
+    ("page_texts", PageText, {"volume_id": "volumes", "ocr_run_id": "ocr_runs"}),
+    ("text_chunks", TextChunk, {"volume_id": "volumes", "ocr_run_id": "ocr_runs"}),
+    ("extraction_runs", ExtractionRun, {"volume_id": "volumes"}),
+    ("documents", Document, {"case_id": "cases", "volume_id": "volumes", "extraction_run_id": "extraction_runs"}),
+    ("entities", Entity, {"document_id": "documents"}),
+    ("document_analyses", DocumentAnalysis, {"document_id": "documents"}),
+    ("case_analyses", CaseAnalysis, {"case_id": "cases"}),
+    ("defense_strategies", DefenseStrategy, {"case_id": "cases"}),
+]
+TABLE_MODELS = {name: model for name, model, _ in TABLES}
+TABLE_REFERENCES = {name: references for name, _, references in TABLES}
+TABLE_ORDER = {name: index for index, (name, _, _) in enumerate(TABLES)}
+# На id этих таблиц ссылаются другие — при вставке нужны новые id
+MAPPED_TABLES = {table for references in TABLE_REFERENCES.values() for table in references.values()}
+
+
+def case_rows_filter(table: str, case_id: int):
+    """Условие отбора строк таблицы, принадлежащих делу"""
+    volume_ids = select(Volume.id).where(Volume.case_id == case_id)
+    document_ids = select(Document.id).where(Document.case_id == case_id)
+    model = TABLE_MODELS[table]
+    if table == "cases":
+        return Case.id == case_id
+    if hasattr(model, "case_id"):
+        return model.case_id == case_id
+    if hasattr(model, "volume_id"):
+        return model.volume_id.in_(volume_ids)
+    return model.document_id.in_(document_ids)
+
+
+# ============================================================
+# ЗНАЧЕНИЯ КОЛОНОК
+# ============================================================
+
+def dump_value(value):
+    """bytes -> base64 (orjson не сериализует bytes), остальное orjson умеет сам"""
+    if isinstance(value, (bytes, memoryview)):
+        return base64.b64encode(bytes(value)).decode("ascii")
+    return value
+
+
+def column_loaders(model) -> dict:
+    """Преобразование значений из архива обратно в типы колонок"""
+    loaders = {}
+    for column in model.__table__.columns:
+        if isinstance(column.type, LargeBinary):
+            loaders[column.name] = base64.b64decode
+        elif isinstance(column.type, DateTime):
+            loaders[column.name] = datetime.fromisoformat
+        elif isinstance(column.type, Date):
+            loaders[column.name] = date.fromisoformat
+    return loaders
+
+
+# ============================================================
+# ЭКСПОРТ
+# ============================================================
+
+def tar_member(name: str, size: int, chunks) -> Iterator[bytes]:
+    """Член tar: заголовок, данные, выравнивание до блока"""
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(time.time())
+    info.mode = 0o644
+    yield info.tobuf(format=tarfile.PAX_FORMAT)
+    written = 0
+    for chunk in chunks:
+        written += len(chunk)
+        yield chunk
+    if written != size:
+        raise CaseArchiveError(f"{name}: записано {written} байт вместо {size}")
+    if size % TAR_BLOCK:
+        yield b"\0" * (TAR_BLOCK - size % TAR_BLOCK)
+
+
+def read_file_chunks(path: str) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def volume_file(volume: Volume):
+    """(путь, SHA-256) файла тома или (None, None), если файла нет на диске"""
+    path = get_volume_file_path(volume)
+    if not os.path.exists(path):
+        return None, None
+    return path, volume.file_hash or hash_file(path)
+
+
+def table_parts(db, table: str, case_id: int, volume_hashes: Dict[int, str]) -> Iterator[bytes]:
+    """Дамп таблицы частями не больше ROWS_PART_BYTES (каждая часть — с заголовком колонок)"""
+    model = TABLE_MODELS[table]
+    columns = [column.name for column in model.__table__.columns]
+    header = dumps(columns + ([BLOB_COLUMN] if table == "volumes" else [])).encode() + b"\n"
+
+    result = db.execute(
+        select(model.__table__).where(case_rows_filter(table, case_id)).order_by(model.__table__.c.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    part, size = [header], len(header)
+    for row in result:
+        values = [dump_value(value) for value in row]
+        if table == "volumes":
+            values.append(volume_hashes.get(row.id))
+        line = dumps(values).encode() + b"\n"
+        part.append(line)
+        size += len(line)
+        if size >= ROWS_PART_BYTES:
+            yield b"".join(part)
+            part, size = [header], len(header)
+    if len(part) > 1:
+        yield b"".join(part)
+
+
+def export_case_stream(case_id: int) -> Iterator[bytes]:
+    """
+    tar-архив дела потоком байтов (синхронный генератор — StreamingResponse крутит его в потоке).
+    Память не зависит от размера дела: файлы читаются блоками, строки — частями.
+    """
+    db = SessionLocal()
+    try:
+        case = db.get(Case, case_id)
+        if not case:
+            raise CaseArchiveError("Дело не найдено")
+
+        volumes = db.query(Volume).filter(Volume.case_id == case_id).order_by(Volume.volume_number).all()
+        volume_hashes, blob_files = {}, {}
+        for volume in volumes:
+            path, sha256 = volume_file(volume)
+            if path:
+                volume_hashes[volume.id] = sha256
+                blob_files.setdefault(sha256, path)
+
+        manifest = dumps({
+            "format": ARCHIVE_FORMAT,
+            "version": ARCHIVE_VERSION,
+            "exported_at": datetime.utcnow().isoformat(),
+            "case_id": case.id,
+            "case_number": case.case_number,
+            "volumes": len(volumes),
+            "blobs": {sha256: os.path.getsize(path) for sha256, path in blob_files.items()},
+            "tables": [table for table, _, _ in TABLES],
+        }).encode()
+        yield from tar_member("manifest.json", len(manifest), [manifest])
+
+        for sha256, path in blob_files.items():
+            yield from tar_member(f"blobs/{sha256}.pdf", os.path.getsize(path), read_file_chunks(path))
+
+        for table, _, _ in TABLES:
+            for index, part in enumerate(table_parts(db, table, case_id, volume_hashes), start=1):
+                yield from tar_member(f"rows/{table}.{index:05d}.ndjson", len(part), [part])
+
+        yield b"\0" * (TAR_BLOCK * 2)  # конец архива
+    finally:
+        db.close()
+
+
+# ============================================================
+# ИМПОРТ
+# ============================================================
+
+def stage_blob(fileobj, sha256: str, size: int) -> str:
+    """Файл тома из архива во временную зону хранилища, с проверкой размера и хеша"""
+    path = staging_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    hasher = hashlib.sha256()
+    written = 0
+    try:
+        with open(path, "wb") as f:
+            while True:
+                chunk = fileobj.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                f.write(chunk)
+                written += len(chunk)
+        if written != size or hasher.hexdigest() != sha256:
+            raise CaseArchiveError(f"Файл {sha256[:12]}… в архиве повреждён")
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return path
+
+
+def attach_blob(session, sha256: str, staged: Dict[str, str]) -> Optional[int]:
+    """FileBlob для тома: существующий (файл уже есть на этом узле) или из временной зоны"""
+    blob = session.query(FileBlob).filter(FileBlob.sha256 == sha256).first()
+    staged_file = staged.get(sha256)
+    if blob is None:
+        if not staged_file or not os.path.exists(staged_file):
+            return None
+        final_path = blob_path(sha256)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(staged_file, final_path)
+        blob = FileBlob(sha256=sha256, size=os.path.getsize(final_path), storage_path=final_path, ref_count=0)
+        session.add(blob)
+        session.flush()
+    elif not os.path.exists(blob.storage_path) and staged_file and os.path.exists(staged_file):
+        # Файл пропал с диска — восстанавливаем из архива
+        os.makedirs(os.path.dirname(blob.storage_path), exist_ok=True)
+        os.replace(staged_file, blob.storage_path)
+    blob.ref_count = (blob.ref_count or 0) + 1
+    return blob.id
+
+
+def insert_rows(session, table: str, rows: List[dict], staged: Dict[str, str]) -> Optional[List[int]]:
+    """Вставка пакета строк (через db_writer), возвращает новые id для таблиц с картой"""
+    model = TABLE_MODELS[table]
+    if table == "volumes":
+        for row in rows:
+            sha256 = row.pop(BLOB_COLUMN, None)
+            row["blob_id"] = attach_blob(session, sha256, staged) if sha256 else None
+    if table in MAPPED_TABLES:
+        return list(session.scalars(insert(model).returning(model.id, sort_by_parameter_order=True), rows))
+    session.execute(insert(model), rows)
+    return None
+
+
+class CaseImporter:
+    """Состояние одного импорта: карты id, временные файлы, счётчики"""
+
+    def __init__(self):
+        self.id_maps: Dict[str, Dict[int, int]] = {table: {} for table in MAPPED_TABLES}
+        self.staged: Dict[str, str] = {}
+        self.manifest: Optional[dict] = None
+        self.case_id: Optional[int] = None
+        self.case_status = "active"
+        self.last_table = -1
+        self.report = {"rows": {}, "blobs": 0, "bytes": 0, "orphans_skipped": 0}
+
+    def read_manifest(self, fileobj):
+        manifest = loads(fileobj.read())
+        if manifest.get("format") != ARCHIVE_FORMAT:
+            raise CaseArchiveError("Это не архив дела")
+        if manifest.get("version", 0) > ARCHIVE_VERSION:
+            raise CaseArchiveError(f"Архив версии {manifest['version']} новее поддерживаемой ({ARCHIVE_VERSION})")
+        self.manifest = manifest
+
+    def read_blob(self, fileobj, sha256: str, size: int):
+        self.staged[sha256] = stage_blob(fileobj, sha256, size)
+        self.report["blobs"] += 1
+        self.report["bytes"] += size
+
+    def prepare_row(self, table: str, row: dict, loaders: dict) -> Optional[dict]:
+        """Перевести строку на новые id; None — родитель не попал в архив (строка пропускается)"""
+        old_id = row.pop("id", None)
+        for column, value in row.items():
+            if value is not None and column in loaders:
+                row[column] = loaders[column](value)
+        for column, parent in TABLE_REFERENCES[table].items():
+            value = row.get(column)
+            if value is None:
+                continue
+            new_value = self.id_maps[parent].get(value)
+            if new_value is None:
+                return None
+            row[column] = new_value
+        if table == "cases":
+            self.case_status = row.get("status") or "active"
+            row["status"] = "importing"
+            row["user_id"] = 1  # TODO: владелец — текущий пользователь, когда появится аутентификация
+        return {"__old_id": old_id, **row}
+
+    def flush(self, table: str, batch: List[dict]):
+        old_ids = [row.pop("__old_id") for row in batch]
+        new_ids = db_writer.call(insert_rows, table, batch, self.staged)
+        if new_ids is not None:
+            self.id_maps[table].update(zip(old_ids, new_ids))
+            if table == "cases":
+                self.case_id = new_ids[0]
+        self.report["rows"][table] = self.report["rows"].get(table, 0) + len(batch)
+
+    def read_rows(self, fileobj, table: str):
+        if table not in TABLE_MODELS:
+            return  # таблица из более новой версии — пропускаем
+        order = TABLE_ORDER[table]
+        if order < self.last_table:
+            raise CaseArchiveError(f"Нарушен порядок таблиц в архиве: {table}")
+        self.last_table = order
+        if table != "cases" and self.case_id is None:
+            raise CaseArchiveError("В архиве нет строки дела")
+
+        model = TABLE_MODELS[table]
+        known_columns = {column.name for column in model.__table__.columns} | {BLOB_COLUMN}
+        loaders = column_loaders(model)
+        columns = loads(fileobj.readline())
+
+        batch = []
+        for line in fileobj:
+            values = dict(zip(columns, loads(line)))
+            row = self.prepare_row(table, {k: v for k, v in values.items() if k in known_columns}, loaders)
+            if row is None:
+                self.report["orphans_skipped"] += 1
+                continue
+            batch.append(row)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                self.flush(table, batch)
+                batch = []
+        if batch:
+            self.flush(table, batch)
+
+    def finish(self):
+        def activate(session, case_id: int, status: str):
+            session.query(Case).filter(Case.id == case_id).update({"status": status}, synchronize_session=False)
+
+        db_writer.call(activate, self.case_id, self.case_status)
+
+    def rollback(self):
+        """Удалить частично импортированное дело (файлы томов освобождаются как при удалении)"""
+        if self.case_id is None:
+            return
+        db = SessionLocal()
+        try:
+            case = db.get(Case, self.case_id)
+            if case:
+                for volume in case.volumes:
+                    search_service.remove_volume(db, volume.id)
+                    release_volume_file(db, volume)
+                db.delete(case)
+                db.commit()
+        finally:
+            db.close()
+
+    def cleanup(self):
+        for path in self.staged.values():
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def import_case(fileobj) -> dict:
+    """
+    Импортировать дело из tar-потока (файловый объект, читается последовательно).
+    Возвращает отчёт: новый id дела, строки по таблицам, файлы, время.
+    """
+    started = time.monotonic()
+    importer = CaseImporter()
+    try:
+        with tarfile.open(fileobj=fileobj, mode="r|") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                data = tar.extractfile(member)
+                if member.name == "manifest.json":
+                    importer.read_manifest(data)
+                    continue
+                if importer.manifest is None:
+                    raise CaseArchiveError("Архив должен начинаться с manifest.json")
+
+                blob_match = BLOB_MEMBER_RE.match(member.name)
+                rows_match = ROWS_MEMBER_RE.match(member.name)
+                if blob_match:
+                    importer.read_blob(data, blob_match.group(1), member.size)
+                elif rows_match:
+                    importer.read_rows(data, rows_match.group(1))
+
+        if importer.case_id is None:
+            raise CaseArchiveError("В архиве нет строки дела")
+        importer.finish()
+    except tarfile.TarError as e:
+        importer.rollback()
+        raise CaseArchiveError(f"Архив повреждён: {e}")
+    except BaseException:
+        importer.rollback()
+        raise
+    finally:
+        importer.cleanup()
+
+    # Поисковый индекс для импортированных страниц — фоновой индексацией
+    search_service.schedule_backfill()
+
+    report = importer.report
+    report.update({
+        "case_id": importer.case_id,
+        "source_case_id": importer.manifest.get("case_id"),
+        "case_number": importer.manifest.get("case_number"),
+        "seconds": round(time.monotonic() - started, 2),
+    })
+    print(f"[ARCHIVE] Дело импортировано: {report['case_id']} (из {report['source_case_id']}), "
+          f"{report['blobs']} файлов, {sum(report['rows'].values())} строк за {report['seconds']} с")
+    return report
+
+
+def import_case_file(path: str) -> dict:
+    with open(path, "rb") as f:
+        return import_case(f)
+
+
+def new_import_path() -> str:
+    """Временный файл для архива, принимаемого по HTTP"""
+    return os.path.join(blob_dir(), "staging", f"import-{uuid.uuid4().hex}.tar")
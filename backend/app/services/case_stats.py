@@ -0,0 +1,112 @@
+"""
+Сводные показатели дел
+
+Количество томов, документов, страниц и прогресс OCR считаются одним запросом
+с агрегирующими подзапросами (GROUP BY case_id) — число запросов не зависит
+от количества дел на странице. Запросы выполняются через асинхронную сессию.
+"""
+
+from typing import Optional
+
+from sqlalchemy import func, select, and_, or_, not_, exists, Select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.models import Case, Volume, Document, ExtractionRun, OcrRun, PageText
+
+
+def _current_ocr_runs():
+    """Текущий запуск OCR каждого тома — последний завершённый (как в search_service.CURRENT_RUN_SQL)"""
+    return select(
+        OcrRun.volume_id.label("volume_id"),
+        func.max(OcrRun.id).label("id")
+    ).where(OcrRun.status == "completed").group_by(OcrRun.volume_id).subquery("current_ocr_runs")
+
+
+def _recognized_pages(current):
+    """По тому: страниц, сохранённых текущим запуском OCR"""
+    return select(
+        current.c.volume_id.label("volume_id"),
+        func.count(PageText.id).label("pages")
+    ).select_from(current).join(
+        PageText, PageText.ocr_run_id == current.c.id
+    ).group_by(current.c.volume_id).subquery("recognized_pages")
+
+
+def _volume_totals():
+    """По делу: томов, страниц, распознанных страниц (строки PageText текущего запуска OCR тома)"""
+    current = _current_ocr_runs()
+    recognized = _recognized_pages(current)
+    return select(
+        Volume.case_id.label("case_id"),
+        func.count(Volume.id).label("volumes_count"),
+        func.sum(func.coalesce(Volume.page_count, OcrRun.pages_total, 0)).label("pages_count"),
+        func.sum(func.coalesce(recognized.c.pages, 0)).label("recognized_pages")
+    ).select_from(Volume).outerjoin(
+        current, current.c.volume_id == Volume.id
+    ).outerjoin(
+        OcrRun, OcrRun.id == current.c.id
+    ).outerjoin(
+        recognized, recognized.c.volume_id == Volume.id
+    ).group_by(Volume.case_id).subquery("volume_totals")
+
+
+def _document_totals():
+    """
+    По делу: документов текущих выделений.
+    Документы без версии учитываются только у томов, где ещё нет текущего выделения.
+    """
+    current_run = aliased(ExtractionRun)
+    has_current_run = exists().where(and_(
+        current_run.volume_id == Document.volume_id,
+        current_run.is_current == 1
+    )).correlate(Document)
+    return select(
+        Document.case_id.label("case_id"),
+        func.count(Document.id).label("documents_count")
+    ).select_from(Document).outerjoin(
+        ExtractionRun, ExtractionRun.id == Document.extraction_run_id
+    ).where(or_(
+        ExtractionRun.is_current == 1,
+        and_(Document.extraction_run_id.is_(None), not_(has_current_run))
+    )).group_by(Document.case_id).subquery("document_totals")
+
+
+def cases_with_stats() -> Select:
+    """
+    Запрос строк (Case, volumes_count, documents_count, pages_count, recognized_pages).
+    К нему можно добавлять фильтры и offset/limit как к обычному select(Case).
+    """
+    volumes = _volume_totals()
+    documents = _document_totals()
+    return select(
+        Case,
+        func.coalesce(volumes.c.volumes_count, 0).label("volumes_count"),
+        func.coalesce(documents.c.documents_count, 0).label("documents_count"),
+        func.coalesce(volumes.c.pages_count, 0).label("pages_count"),
+        func.coalesce(volumes.c.recognized_pages, 0).label("recognized_pages")
+    ).outerjoin(
+        volumes, volumes.c.case_id == Case.id
+    ).outerjoin(
+        documents, documents.c.case_id == Case.id
+    )
+
+
+def stats_from_row(row) -> dict:
+    pages_count = int(row.pages_count or 0)
+    recognized_pages = min(int(row.recognized_pages or 0), pages_count)
+    return {
+        "volumes_count": int(row.volumes_count or 0),
+        "documents_count": int(row.documents_count or 0),
+        "pages_count": pages_count,
+        "recognized_pages": recognized_pages,
+        "processing_progress": int(recognized_pages / pages_count * 100) if pages_count else 0
+    }
+
+
+async def get_case_with_stats(db: AsyncSession, case_id: int) -> Optional[tuple]:
+    """(Case, показатели) или None если дела нет"""
+    row = (await db.execute(cases_with_stats().where(Case.id == case_id))).first()
+    if not row:
+        return None
+    return row.Case, stats_from_row(row)
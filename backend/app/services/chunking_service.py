@@ -0,0 +1,289 @@
+"""
+Chunks запуска OCR: разбиение (app.core.chunking) и восстановление текста
+
+Новые chunks хранят не текст, а смещения в страницах запуска OCR
+(page_number/char_start — page_end/char_end, text = NULL). Текст собирается из
+page_texts при чтении: страницы, нужные порции chunks, читаются одним запросом.
+Старые chunks (text заполнен) отдаются как есть.
+
+Инкрементальное разбиение (rechunk_run): страницы сравниваются по хешам
+(page_texts.text_hash) с запуском, из которого построены текущие chunks, — тем же
+или предыдущим запуском тома. Заново разбиваются окна вокруг изменённых страниц,
+пока новое разбиение не сойдётся со старым (app.core.chunking.rechunk_spans);
+результат совпадает с полным разбиением. Остальные chunks сохраняются (для нового
+запуска — копируются вместе с векторами). Векторы новых chunks берутся у удалённых
+chunks с тем же text_hash; остальные переиспользует embedding_service.
+"""
+
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.chunking import chunk_pages, chunk_text, page_hash, chunk_hash, rechunk_spans
+from app.core.config import settings
+from app.core.packing import page_text_of
+from app.models import PageText, TextChunk, OcrRun
+
+# ============================================================
+# НАСТРОЙКИ
+# ============================================================
+PAGE_BATCH = 500  # номеров страниц в одном запросе IN (...)
+INSERT_BATCH = 1000
+
+# Колонки chunk, нужные для восстановления текста (chunk_texts)
+CHUNK_TEXT_COLUMNS = (
+    TextChunk.id, TextChunk.ocr_run_id, TextChunk.page_number, TextChunk.page_end,
+    TextChunk.char_start, TextChunk.char_end, TextChunk.text
+)
+
+
+def build_chunks(pages: List[Tuple[int, str]]) -> List[dict]:
+    """Разбить страницы запуска [(номер, текст)] по настройкам CHUNK_*"""
+    return chunk_pages(
+        pages,
+        max_tokens=settings.CHUNK_MAX_TOKENS,
+        min_tokens=settings.CHUNK_MIN_TOKENS,
+        overlap_tokens=settings.CHUNK_OVERLAP_TOKENS
+    )
+
+
+def load_pages(db, ocr_run_id: int, page_numbers: Iterable[int]) -> Dict[int, str]:
+    """Тексты страниц запуска по номерам"""
+    pages = {}
+    numbers = sorted(page_numbers)
+    for start in range(0, len(numbers), PAGE_BATCH):
+        for row in db.execute(pages_query(ocr_run_id, numbers[start:start + PAGE_BATCH])):
+            pages[row.page_number] = page_text_of(row) or ""
+    return pages
+
+
+def page_hashes(db, ocr_run_id: int) -> Dict[int, str]:
+    """Номер страницы -> хеш текста; недостающие хеши (старые записи) считаются и сохраняются"""
+    rows = db.execute(
+        select(PageText.id, PageText.page_number, PageText.text_hash)
+        .where(PageText.ocr_run_id == ocr_run_id)
+    ).all()
+    hashes = {row.page_number: row.text_hash for row in rows}
+    missing = [row for row in rows if row.text_hash is None]
+    if missing:
+        texts = load_pages(db, ocr_run_id, [row.page_number for row in missing])
+        updates = []
+        for row in missing:
+            hashes[row.page_number] = page_hash(texts.get(row.page_number))
+            updates.append({"id": row.id, "text_hash": hashes[row.page_number]})
+        db.execute(update(PageText), updates)
+    return hashes
+
+
+def run_chunks(db, ocr_run_id: int) -> list:
+    return db.execute(
+        select(*CHUNK_TEXT_COLUMNS, TextChunk.chunk_index, TextChunk.text_hash)
+        .where(TextChunk.ocr_run_id == ocr_run_id)
+        .order_by(TextChunk.page_number, TextChunk.char_start)
+    ).all()
+
+
+def chunk_hashes(db, chunks: list) -> Dict[int, str]:
+    """id -> text_hash chunks; недостающие считаются по тексту и сохраняются"""
+    hashes = {chunk.id: chunk.text_hash for chunk in chunks}
+    missing = [chunk for chunk in chunks if chunk.text_hash is None]
+    if missing:
+        texts = chunk_texts(db, missing)
+        for chunk in missing:
+            hashes[chunk.id] = chunk_hash(texts[chunk.id])
+        db.execute(update(TextChunk), [{"id": chunk.id, "text_hash": hashes[chunk.id]} for chunk in missing])
+    return hashes
+
+
+def embeddings_of(db, chunk_ids: List[int]) -> Dict[int, tuple]:
+    """id -> (embedding_packed, embedding_model) chunks с вектором"""
+    found = {}
+    for start in range(0, len(chunk_ids), PAGE_BATCH):
+        for row in db.execute(
+            select(TextChunk.id, TextChunk.embedding_packed, TextChunk.embedding_model)
+            .where(TextChunk.id.in_(chunk_ids[start:start + PAGE_BATCH]), TextChunk.embedding_packed.isnot(None))
+        ):
+            found[row.id] = (row.embedding_packed, row.embedding_model)
+    return found
+
+
+def previous_chunked_run(db, volume_id: int, ocr_run_id: int) -> Optional[int]:
+    """Последний другой запуск тома, у которого есть chunks"""
+    return db.scalar(
+        select(OcrRun.id)
+        .where(OcrRun.volume_id == volume_id, OcrRun.id != ocr_run_id)
+        .where(select(TextChunk.id).where(TextChunk.ocr_run_id == OcrRun.id).exists())
+        .order_by(OcrRun.id.desc()).limit(1)
+    )
+
+
+# ============================================================
+# ИНКРЕМЕНТАЛЬНОЕ РАЗБИЕНИЕ
+# ============================================================
+
+def hash_chunks(pages: Dict[int, str], chunks: List[dict]):
+    """text_hash новых chunks по текстам страниц"""
+    for chunk in chunks:
+        chunk["text_hash"] = chunk_hash(chunk_text(
+            pages, chunk["page_number"], chunk["char_start"], chunk["page_end"], chunk["char_end"]
+        ))
+
+
+def rechunk_run(db, volume_id: int, ocr_run_id: int, full: bool = False) -> dict:
+    """
+    Обновить chunks запуска OCR по изменённым страницам (commit делает вызывающий).
+    full — разбить весь запуск заново (например, после смены CHUNK_*).
+    """
+    started = time.perf_counter()
+    target = page_hashes(db, ocr_run_id)
+    numbers = sorted(target)
+
+    existing = run_chunks(db, ocr_run_id)
+    source_run_id = ocr_run_id if existing else previous_chunked_run(db, volume_id, ocr_run_id)
+    source = existing if existing else (run_chunks(db, source_run_id) if source_run_id else [])
+    hashes = chunk_hashes(db, source)
+
+    pages: Dict[int, str] = {}
+
+    def load(page_numbers: List[int]) -> Dict[int, str]:
+        pages.update(load_pages(db, ocr_run_id, [number for number in page_numbers if number not in pages]))
+        return pages
+
+    if full or not source or any(chunk.page_end is None for chunk in source):
+        # Всё заново; старые chunks (с текстом, без page_end) по смещениям не делятся
+        changed = sorted(set(numbers) | {chunk.page_number for chunk in source})
+        kept, created = [], build_chunks([(number, text) for number, text in sorted(load(numbers).items())])
+    else:
+        if source_run_id == ocr_run_id:
+            changed = []  # текст страниц запуска не меняется после записи
+        else:
+            previous = page_hashes(db, source_run_id)
+            changed = sorted(
+                number for number in set(target) | set(previous)
+                if target.get(number) != previous.get(number)
+            )
+        kept_indices, created = rechunk_spans(
+            [(chunk.page_number, chunk.char_start, chunk.page_end, chunk.char_end) for chunk in source],
+            changed, numbers, load,
+            settings.CHUNK_MAX_TOKENS, settings.CHUNK_MIN_TOKENS, settings.CHUNK_OVERLAP_TOKENS
+        )
+        kept = [source[i] for i in kept_indices]
+    hash_chunks(pages, created)
+    kept_ids = {chunk.id for chunk in kept}
+    removed = [chunk for chunk in existing if chunk.id not in kept_ids]
+
+    # Векторы переносятся с удаляемых (свой запуск) или со всех chunks источника
+    copied = source_run_id != ocr_run_id and bool(source)
+    donors = [chunk for chunk in source if copied or chunk.id not in kept_ids]
+    donor_embeddings = embeddings_of(db, [chunk.id for chunk in donors])
+    carried = {hashes[chunk.id]: donor_embeddings[chunk.id] for chunk in donors if chunk.id in donor_embeddings}
+
+    # Итоговый порядок и chunk_index (номер среди chunks, начинающихся на той же странице)
+    final = [
+        (chunk.page_number, chunk.char_start, chunk.page_end, chunk.char_end, hashes[chunk.id], chunk)
+        for chunk in kept
+    ] + [
+        (chunk["page_number"], chunk["char_start"], chunk["page_end"], chunk["char_end"], chunk["text_hash"], None)
+        for chunk in created
+    ]
+    final.sort(key=lambda item: item[:2])
+    index_on_page: Dict[int, int] = {}
+    renumbered, rows = [], []
+    for page_number, char_start, page_end, char_end, text_hash, old in final:
+        chunk_index = index_on_page.get(page_number, 0)
+        index_on_page[page_number] = chunk_index + 1
+        if old is None or copied:
+            embedding = donor_embeddings.get(old.id) if old is not None else carried.get(text_hash)
+            packed, model = embedding or (None, None)
+            rows.append({
+                "ocr_run_id": ocr_run_id, "volume_id": volume_id,
+                "page_number": page_number, "page_end": page_end, "chunk_index": chunk_index,
+                "char_start": char_start, "char_end": char_end,
+                "text": None, "text_hash": text_hash,
+                "embedding_packed": packed, "embedding_model": model
+            })
+        elif old.chunk_index != chunk_index:
+            renumbered.append({"id": old.id, "chunk_index": chunk_index})
+
+    for start in range(0, len(removed), INSERT_BATCH):
+        db.execute(delete(TextChunk).where(TextChunk.id.in_([chunk.id for chunk in removed[start:start + INSERT_BATCH]])))
+    # Уникальность (запуск, страница, chunk_index): сначала временные отрицательные номера
+    if renumbered:
+        db.execute(update(TextChunk), [{"id": row["id"], "chunk_index": -1 - row["chunk_index"]} for row in renumbered])
+    for start in range(0, len(rows), INSERT_BATCH):
+        db.execute(insert(TextChunk), rows[start:start + INSERT_BATCH])
+    if renumbered:
+        db.execute(update(TextChunk), renumbered)
+
+    stats = {
+        "pages": len(target),
+        "pages_changed": len(changed),
+        "source_ocr_run_id": source_run_id,
+        "chunks": len(final),
+        "chunks_reused": len(kept),
+        "chunks_created": len(created),
+        "chunks_deleted": len(removed),
+        "embeddings_carried": sum(1 for row in rows if row["embedding_packed"] is not None),
+        "cross_page_chunks": sum(1 for item in final if item[2] != item[0]),
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+    if changed or copied:
+        print(f"[CHUNKS] Запуск {ocr_run_id}: изменено страниц {len(changed)} из {len(target)}, "
+              f"chunks: {len(kept)} сохранено, {len(created)} заново, {len(removed)} удалено за {stats['seconds']} с")
+    return stats
+
+
+# ============================================================
+# ТЕКСТ CHUNKS
+# ============================================================
+
+def needed_pages(chunks: Iterable) -> Dict[int, set]:
+    """ocr_run_id -> номера страниц, нужные chunks без сохранённого текста"""
+    needed = defaultdict(set)
+    for chunk in chunks:
+        if chunk.text is None:
+            needed[chunk.ocr_run_id].update(range(chunk.page_number, (chunk.page_end or chunk.page_number) + 1))
+    return needed
+
+
+def pages_query(ocr_run_id: int, page_numbers: List[int]):
+    return select(PageText.page_number, PageText.text, PageText.text_zstd).where(
+        PageText.ocr_run_id == ocr_run_id,
+        PageText.page_number.in_(page_numbers)
+    )
+
+
+def assemble(chunks: Iterable, pages: Dict[int, Dict[int, str]]) -> Dict[int, str]:
+    return {
+        chunk.id: chunk.text if chunk.text is not None else chunk_text(
+            pages.get(chunk.ocr_run_id, {}), chunk.page_number, chunk.char_start or 0,
+            chunk.page_end, chunk.char_end or 0
+        )
+        for chunk in chunks
+    }
+
+
+def chunk_texts(db, chunks: List) -> Dict[int, str]:
+    """
+    id -> текст для строк chunks (нужны колонки id, ocr_run_id, page_number,
+    page_end, char_start, char_end, text)
+    """
+    pages = {
+        ocr_run_id: load_pages(db, ocr_run_id, numbers)
+        for ocr_run_id, numbers in needed_pages(chunks).items()
+    }
+    return assemble(chunks, pages)
+
+
+async def chunk_texts_async(db: AsyncSession, chunks: List) -> Dict[int, str]:
+    """То же для асинхронной сессии"""
+    pages: Dict[int, Dict[int, str]] = defaultdict(dict)
+    for ocr_run_id, numbers in needed_pages(chunks).items():
+        numbers = sorted(numbers)
+        for start in range(0, len(numbers), PAGE_BATCH):
+            for row in await db.execute(pages_query(ocr_run_id, numbers[start:start + PAGE_BATCH])):
+                pages[ocr_run_id][row.page_number] = page_text_of(row) or ""
+    return assemble(chunks, pages)
@@ -0,0 +1,350 @@
+"""
+Векторы (embeddings) для chunks текста
+
+Бэкенды (EMBEDDING_BACKEND):
+- hashing — локальный, без модели и сети: хеширование основ слов (Snowball) и
+  символьных триграмм в вектор фиксированной длины. Триграммы сглаживают ошибки OCR.
+  Работает всегда, качество ниже нейросетевой модели.
+- onnx — локальная sentence-модель на CPU: каталог EMBEDDING_MODEL_PATH с model.onnx
+  и tokenizer.json (нужны пакеты onnxruntime и tokenizers, они необязательные).
+- openai — удалённый API (OPENAI_API_KEY), только если выбран явно.
+- auto (по умолчанию) — onnx, если модель есть, иначе hashing.
+
+Тексты считаются порциями по EMBEDDING_BATCH_SIZE в пуле из EMBEDDING_THREADS потоков.
+Векторы нормированы (L2), в TextChunk.embedding_packed пишутся бинарно
+(EMBEDDING_STORAGE_DTYPE: float32, float16 или int8), в embedding_model — имя бэкенда:
+при смене модели векторы тома пересчитываются. Для поиска векторы дела собираются
+в матрицу на диске (app.services.vector_store).
+
+Векторы переиспользуются по text_hash (app.core.chunking.chunk_hash): chunk с тем же
+текстом в любом запуске или томе, уже посчитанный той же моделью, отдаёт свой вектор;
+одинаковые тексты внутри окна считаются один раз.
+"""
+
+import os
+import re
+import time
+import zlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select, update
+
+from app.core.chunking import chunk_hash
+from app.core.config import settings
+from app.core.packing import pack_vector
+from app.models import TextChunk, Volume
+from app.models.database import SessionLocal, db_writer
+from app.services import vector_index, vector_store
+from app.services.chunking_service import CHUNK_TEXT_COLUMNS, chunk_texts
+from app.services.search_service import stem
+
+try:
+    import onnxruntime
+    from tokenizers import Tokenizer
+    HAS_ONNX = True
+except ImportError:
+    HAS_ONNX = False
+
+try:
+    from openai import OpenAI
+    HAS_OPENAI = True
+except ImportError:
+    HAS_OPENAI = False
+
+# ============================================================
+# НАСТРОЙКИ
+# ============================================================
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+TRIGRAM_WEIGHT = 0.5  # вес символьной триграммы относительно основы слова
+WORD_CACHE_SIZE = 200_000  # признаки слов кешируются — слова в деле повторяются
+WINDOW_BATCHES = 8  # порций на одно окно чтения chunks из базы
+REUSE_BATCH = 500  # хешей в одном запросе переиспользования векторов
+
+# Последняя статистика векторизации по тому (в памяти процесса)
+last_stats: Dict[int, dict] = {}
+
+_executor: Optional[ThreadPoolExecutor] = None
+_backend = None
+_backend_lock = threading.Lock()
+
+
+class EmbeddingError(RuntimeError):
+    pass
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+# ============================================================
+# БЭКЕНДЫ
+# ============================================================
+
+class HashingBackend:
+    """Хеширование признаков (feature hashing) — без модели, полностью офлайн"""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.name = f"hashing-v1-{dim}"
+        self._features = lru_cache(maxsize=WORD_CACHE_SIZE)(self._word_features)
+
+    def _word_features(self, word: str) -> Tuple[Tuple[int, ...], Tuple[float, ...]]:
+        """Индексы и веса признаков слова: основа + триграммы ("^пр", "про", ... "ла$")"""
+        base = stem(word)
+        features = [base]
+        padded = f"^{word.lower().replace('ё', 'е')}$"
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+
+        indices, weights = [], []
+        for position, feature in enumerate(features):
+            digest = zlib.crc32(feature.encode("utf-8"))
+            weight = 1.0 if position == 0 else TRIGRAM_WEIGHT
+            indices.append(digest % self.dim)
+            weights.append(weight if digest & 0x80000000 else -weight)
+        return tuple(indices), tuple(weights)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        indices: List[int] = []
+        weights: List[float] = []
+        for row, text in enumerate(texts):
+            offset = row * self.dim
+            for word in WORD_RE.findall(text or ""):
+                word_indices, word_weights = self._features(word)
+                indices.extend(index + offset for index in word_indices)
+                weights.extend(word_weights)
+
+        matrix = np.bincount(
+            np.asarray(indices, dtype=np.int64),
+            weights=np.asarray(weights, dtype=np.float64),
+            minlength=len(texts) * self.dim
+        ).reshape(len(texts), self.dim)
+        # Сублинейная частота: повторы слова не забивают вектор
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        return normalize_rows(matrix)
+
+
+class OnnxBackend:
+    """Sentence-модель в ONNX на CPU: mean pooling по токенам, L2-нормировка"""
+
+    def __init__(self, model_dir: str, threads: int):
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=settings.EMBEDDING_MAX_TOKENS)
+        self.tokenizer.enable_padding()
+
+        options = onnxruntime.SessionOptions()
+        # Параллельность — порциями в пуле, внутри порции модель делит ядра между потоками
+        options.intra_op_num_threads = max(1, (os.cpu_count() or 1) // max(1, threads))
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, "model.onnx"), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {item.name for item in self.session.get_inputs()}
+        self.name = f"onnx:{os.path.basename(os.path.normpath(model_dir))}"[:100]
+        self.dim = None
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch([text or "" for text in texts])
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feed = {"input_ids": input_ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feed["token_type_ids"] = np.zeros_like(input_ids)
+
+        output = self.session.run(None, feed)[0]
+        if output.ndim == 3:
+            weights = mask[:, :, None].astype(np.float32)
+            output = (output * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        self.dim = output.shape[1]
+        return normalize_rows(output)
+
+
+class OpenAIBackend:
+    """Удалённый API OpenAI (только при явном EMBEDDING_BACKEND=openai)"""
+
+    def __init__(self, model: str):
+        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.model = model
+        self.name = f"openai:{model}"[:100]
+        self.dim = None
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        response = self.client.embeddings.create(model=self.model, input=[text or " " for text in texts])
+        matrix = np.array([item.embedding for item in sorted(response.data, key=lambda item: item.index)], dtype=np.float32)
+        self.dim = matrix.shape[1]
+        return normalize_rows(matrix)
+
+
+def create_backend(kind: str):
+    model_dir = settings.EMBEDDING_MODEL_PATH
+    has_model = bool(model_dir) and os.path.exists(os.path.join(model_dir, "model.onnx"))
+
+    if kind == "auto":
+        kind = "onnx" if HAS_ONNX and has_model else "hashing"
+
+    if kind == "hashing":
+        return HashingBackend(settings.EMBEDDING_DIM)
+    if kind == "onnx":
+        if not HAS_ONNX:
+            raise EmbeddingError("Для EMBEDDING_BACKEND=onnx нужны пакеты onnxruntime и tokenizers")
+        if not has_model:
+            raise EmbeddingError(f"Модель не найдена: {model_dir or 'EMBEDDING_MODEL_PATH не задан'}")
+        return OnnxBackend(model_dir, settings.EMBEDDING_THREADS)
+    if kind == "openai":
+        if not HAS_OPENAI or not settings.OPENAI_API_KEY:
+            raise EmbeddingError("Для EMBEDDING_BACKEND=openai нужны пакет openai и OPENAI_API_KEY")
+        return OpenAIBackend(settings.EMBEDDING_OPENAI_MODEL)
+    raise EmbeddingError(f"Неизвестный EMBEDDING_BACKEND: {kind}")
+
+
+def get_backend():
+    """Бэкенд по настройкам (создаётся один раз — загрузка модели дорогая)"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend(settings.EMBEDDING_BACKEND.lower())
+            print(f"[EMBED] Бэкенд: {_backend.name}")
+        return _backend
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=max(1, settings.EMBEDDING_THREADS), thread_name_prefix="embed")
+    return _executor
+
+
+# ============================================================
+# ВЕКТОРИЗАЦИЯ
+# ============================================================
+
+def embed_texts(texts: List[str], backend=None) -> np.ndarray:
+    """Векторы текстов (float32, строки нормированы), порции считаются в пуле потоков"""
+    backend = backend or get_backend()
+    if not texts:
+        return np.zeros((0, backend.dim or 0), dtype=np.float32)
+
+    size = max(1, settings.EMBEDDING_BATCH_SIZE)
+    batches = [texts[i:i + size] for i in range(0, len(texts), size)]
+    if len(batches) == 1:
+        return backend.embed(batches[0])
+    return np.vstack(list(get_executor().map(backend.embed, batches)))
+
+
+def store_embeddings(session, rows: List[dict]):
+    """Записать векторы chunks (выполняется в db_writer)"""
+    session.execute(update(TextChunk), rows)
+
+
+def pending_chunks(db, volume_id: int, ocr_run_id: Optional[int], model: str, force: bool, after_id: int, limit: int):
+    query = db.query(*CHUNK_TEXT_COLUMNS, TextChunk.text_hash).filter(
+        TextChunk.volume_id == volume_id,
+        TextChunk.id > after_id
+    )
+    if ocr_run_id is not None:
+        query = query.filter(TextChunk.ocr_run_id == ocr_run_id)
+    if not force:
+        query = query.filter(
+            TextChunk.embedding_packed.is_(None) | TextChunk.embedding_model.is_(None) | (TextChunk.embedding_model != model)
+        )
+    return query.order_by(TextChunk.id).limit(limit).all()
+
+
+def reusable_embeddings(db, hashes: List[str], model: str) -> Dict[str, bytes]:
+    """text_hash -> вектор модели model у уже посчитанных chunks с тем же текстом"""
+    found = {}
+    for start in range(0, len(hashes), REUSE_BATCH):
+        for row in db.execute(
+            select(TextChunk.text_hash, TextChunk.embedding_packed).where(
+                TextChunk.text_hash.in_(hashes[start:start + REUSE_BATCH]),
+                TextChunk.embedding_model == model,
+                TextChunk.embedding_packed.isnot(None)
+            )
+        ):
+            found.setdefault(row.text_hash, row.embedding_packed)
+    return found
+
+
+def embed_volume(volume_id: int, ocr_run_id: Optional[int] = None, force: bool = False) -> dict:
+    """
+    Посчитать векторы chunks тома (или одного запуска OCR).
+    Без force — только chunks без вектора или с вектором другой модели; их векторы
+    сначала ищутся по text_hash (force — пересчитать всё).
+    Chunks читаются окнами, запись окна идёт в db_writer, пока считается следующее.
+    """
+    backend = get_backend()
+    window = max(1, settings.EMBEDDING_BATCH_SIZE) * max(1, settings.EMBEDDING_THREADS) * WINDOW_BATCHES
+    started = time.perf_counter()
+    embed_seconds = 0.0
+    chunks = 0
+    reused = 0
+    computed = 0
+    writes = []
+    after_id = 0
+    first_id = None
+
+    db = SessionLocal()
+    try:
+        while True:
+            rows = pending_chunks(db, volume_id, ocr_run_id, backend.name, force, after_id, window)
+            if not rows:
+                break
+            after_id = rows[-1].id
+            if first_id is None:
+                first_id = rows[0].id
+
+            texts = chunk_texts(db, rows)
+            hashes = {row.id: row.text_hash or chunk_hash(texts[row.id]) for row in rows}
+            packed = {} if force else reusable_embeddings(db, list(set(hashes.values())), backend.name)
+            missing = {}
+            for row in rows:
+                if hashes[row.id] not in packed:
+                    missing.setdefault(hashes[row.id], texts[row.id])
+
+            embed_started = time.perf_counter()
+            vectors = embed_texts(list(missing.values()), backend)
+            embed_seconds += time.perf_counter() - embed_started
+            for text_hash, vector in zip(missing, vectors):
+                packed[text_hash] = pack_vector(vector, settings.EMBEDDING_STORAGE_DTYPE)
+
+            writes.append(db_writer.submit(store_embeddings, [
+                {"id": row.id, "embedding": None, "embedding_packed": packed[hashes[row.id]],
+                 "embedding_model": backend.name, "text_hash": hashes[row.id]}
+                for row in rows
+            ]))
+            chunks += len(rows)
+            computed += len(missing)
+            reused += len(rows) - len(missing)
+        for write in writes:
+            write.result()
+        volume = db.get(Volume, volume_id)
+        if first_id is not None and volume:
+            vector_store.embeddings_changed(volume.case_id, first_id)
+            vector_index.schedule_refresh(volume.case_id, backend.name)
+    finally:
+        db.close()
+
+    seconds = time.perf_counter() - started
+    stats = {
+        "volume_id": volume_id,
+        "ocr_run_id": ocr_run_id,
+        "model": backend.name,
+        "dim": backend.dim,
+        "chunks": chunks,
+        "computed": computed,
+        "reused": reused,
+        "seconds": round(seconds, 3),
+        "embed_seconds": round(embed_seconds, 3),
+        "chunks_per_sec": round(chunks / seconds, 1) if seconds > 0 else None,
+        "batch_size": settings.EMBEDDING_BATCH_SIZE,
+        "threads": settings.EMBEDDING_THREADS
+    }
+    last_stats[volume_id] = stats
+    if chunks:
+        print(f"[EMBED] Том {volume_id}: {chunks} chunks ({computed} посчитано, {reused} переиспользовано) "
+              f"за {seconds:.2f} с ({stats['chunks_per_sec']} chunks/с, {backend.name})")
+    return stats
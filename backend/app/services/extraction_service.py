@@ -0,0 +1,123 @@
+"""
+Сервис выделения документов из томов (Claude Vision)
+
+Все функции здесь синхронные и блокирующие (рендеринг PyMuPDF, HTTP-запрос к Claude).
+Из async-эндпоинтов их нужно вызывать через asyncio.to_thread, чтобы не блокировать event loop.
+"""
+
+import io
+import re
+import json
+import base64
+from typing import List
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+# ============================================================
+# НАСТРОЙКИ
+# ============================================================
+EXTRACTION_MODEL = "claude-sonnet-4-20250514"
+EXTRACTION_CROP_RATIO = 0.9
+EXTRACTION_ZOOM = 1.2
+HISTORY_WINDOW = 10  # Последние 10 сообщений для контекста (5 страниц)
+
+SYSTEM_PROMPT = """Анализ страниц уголовного дела. Определи границы документов.
+
+ПРАВИЛА:
+1. ОПИСЬ = таблица ДОКУМЕНТОВ (№|Наименование|Листы) в НАЧАЛЕ тома — ОДИН документ!
+
+2. НАЧАЛО (is_start=true): заголовок вверху (ПОСТАНОВЛЕНИЕ/ПРОТОКОЛ/РАПОРТ) ИЛИ шапка организации ИЛИ номер/дата исх.
+
+3. ПРОДОЛЖЕНИЕ (is_start=false): нет заголовка/шапки вверху — только текст/таблицы/подписи.
+
+4. ДАТА: только из заголовка или подписи! Неразборчивая → date=""
+
+5. ФАМИЛИИ: мужское имя → муж.фамилия (-ов/-ин), женское → жен. (-ова/-ина)
+
+6. НАЗВАНИЯ организаций: незнакомое слово — прочитай ПОБУКВЕННО и запиши как видишь!
+
+7. КОНТЕКСТ: помни предыдущие страницы — документ продолжается пока нет нового заголовка!
+
+JSON: {is_start, is_end, is_opis, type, title, date}"""
+
+EMPTY_RESULT = {"is_start": False, "is_opis": False, "type": "Unknown", "title": ""}
+
+
+def get_page_image(page, crop_ratio: float = EXTRACTION_CROP_RATIO, file_hash: str = None) -> str:
+    """
+    Картинка верхней части страницы в base64 JPEG (90% чтобы видеть подписи внизу)
+    file_hash: если передан, полный рендер заодно кладётся в кеш изображений страниц
+    """
+    # Уменьшенный масштаб для экономии (1.2 вместо 1.5)
+    full_pix = page.get_pixmap(matrix=fitz.Matrix(EXTRACTION_ZOOM, EXTRACTION_ZOOM))
+    img = Image.frombytes("RGB", [full_pix.width, full_pix.height], full_pix.samples)
+
+    if file_hash:
+        from app.services.page_image_service import feed_cache
+        feed_cache(file_hash, page.number + 1, img, source_zoom=EXTRACTION_ZOOM)
+
+    # Обрезаем до нужной части
+    crop_height = int(full_pix.height * crop_ratio)
+    cropped = img.crop((0, 0, full_pix.width, crop_height))
+
+    # Конвертируем в JPEG (quality=80 для компенсации увеличенного размера)
+    buffer = io.BytesIO()
+    cropped.save(buffer, format="JPEG", quality=80, optimize=True)
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+def parse_vision_response(content: str) -> dict:
+    """Достать JSON из ответа модели (с ```json обёрткой или без)"""
+    if content.startswith("```"):
+        content = re.sub(r'^```json?\s*', '', content)
+        content = re.sub(r'\s*```$', '', content)
+
+    json_match = re.search(r'\{[^}]+\}', content)
+    if json_match:
+        content = json_match.group(0)
+
+    return json.loads(content)
+
+
+def analyze_page(client, page, page_num: int, history: List[dict], log_prefix: str = "[DEBUG]", file_hash: str = None) -> dict:
+    """
+    Анализирует страницу с учётом истории предыдущих страниц.
+    Блокирующий вызов: рендер страницы + запрос к Claude.
+    """
+    try:
+        img_base64 = get_page_image(page, file_hash=file_hash)
+
+        # Добавляем новую страницу в историю
+        history.append({
+            "role": "user",
+            "content": [
+                {"type": "image", "source": {"type": "base64", "media_type": "image/jpeg", "data": img_base64}},
+                {"type": "text", "text": f"Страница {page_num + 1}. Это НАЧАЛО нового документа (есть заголовок вверху)? JSON: {{is_start, is_end, is_opis, type, title, date}}"}
+            ]
+        })
+
+        response = client.messages.create(
+            model=EXTRACTION_MODEL,
+            max_tokens=300,
+            system=SYSTEM_PROMPT,
+            messages=history[-HISTORY_WINDOW:]
+        )
+
+        content = response.content[0].text.strip()
+        print(f"{log_prefix} Page {page_num + 1}: {content[:80]}")
+
+        # Добавляем ответ в историю
+        history.append({"role": "assistant", "content": content})
+
+        return parse_vision_response(content)
+
+    except Exception as e:
+        print(f"{log_prefix} Error page {page_num + 1}: {e}")
+        return dict(EMPTY_RESULT)
+
+
+def analyze_pdf_page(client, doc, page_num: int, history: List[dict], log_prefix: str = "[DEBUG]", file_hash: str = None) -> dict:
+    """Загрузить страницу из открытого PDF и проанализировать её (для asyncio.to_thread)"""
+    page = doc.load_page(page_num)
+    return analyze_page(client, page, page_num, history, log_prefix=log_prefix, file_hash=file_hash)
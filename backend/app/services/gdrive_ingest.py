@@ -0,0 +1,308 @@
+"""
+Сервис загрузки томов из Google Drive
+
+- листинг папки с пагинацией по nextPageToken
+- потоковое скачивание на диск (без загрузки файла в память) в content-addressed хранилище
+- несколько файлов параллельно с ограничением GDRIVE_DOWNLOAD_CONCURRENCY
+- инкрементальная синхронизация: файлы, чьи md5Checksum или modifiedTime совпадают
+  с уже существующим томом дела, пропускаются; изменившиеся файлы томов дела
+  не скачиваются, а возвращаются в списке changed
+- автоматическое создание записей Volume и фоновая подготовка томов
+
+Работает через Drive API v3 (REST, httpx). Адрес API задаётся GDRIVE_API_BASE,
+поэтому сервис можно проверять на локальном фейковом сервере.
+"""
+
+import os
+import asyncio
+from typing import AsyncIterator, List, Optional, Tuple
+
+import httpx
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import Volume
+from app.services.storage_service import (
+    save_stream, staging_path, commit_blob, register_volume, FileTooLargeError, UPLOAD_CHUNK_SIZE
+)
+from app.services.ingest_service import schedule_ingest_on_upload
+
+# ============================================================
+# НАСТРОЙКИ
+# ============================================================
+LIST_PAGE_SIZE = 1000
+LIST_FIELDS = "nextPageToken, files(id, name, mimeType, size, md5Checksum, modifiedTime)"
+FILE_FIELDS = "id, name, mimeType, size, md5Checksum, modifiedTime"
+PDF_MIME_TYPE = "application/pdf"
+
+
+class DriveIngestError(Exception):
+    """Ошибка загрузки из Google Drive (сообщение показывается пользователю)"""
+
+
+class DriveClient:
+    """Минимальный клиент Drive API v3: OAuth токен или API ключ (для публичных файлов)"""
+
+    def __init__(
+        self,
+        http: httpx.AsyncClient,
+        access_token: str = None,
+        api_key: str = None,
+        api_base: str = None
+    ):
+        self.http = http
+        self.access_token = access_token
+        self.api_key = api_key
+        self.api_base = (api_base or settings.GDRIVE_API_BASE).rstrip("/")
+
+    def _params(self, **params) -> dict:
+        if self.api_key and not self.access_token:
+            params["key"] = self.api_key
+        return params
+
+    def _headers(self) -> dict:
+        if self.access_token:
+            return {"Authorization": f"Bearer {self.access_token}"}
+        return {}
+
+    async def get_metadata(self, file_id: str) -> dict:
+        response = await self.http.get(
+            f"{self.api_base}/files/{file_id}",
+            params=self._params(fields=FILE_FIELDS, supportsAllDrives="true"),
+            headers=self._headers()
+        )
+        if response.status_code != 200:
+            raise DriveIngestError(
+                "Файл не найден или недоступен. Убедитесь что файл публично доступен "
+                "(настройки доступа: 'Все у кого есть ссылка')"
+            )
+        return response.json()
+
+    async def list_folder(self, folder_id: str) -> List[dict]:
+        """Все PDF файлы папки (проходит по всем страницам nextPageToken)"""
+        files = []
+        page_token = None
+
+        while True:
+            params = self._params(
+                q=f"'{folder_id}' in parents and mimeType='{PDF_MIME_TYPE}' and trashed=false",
+                pageSize=LIST_PAGE_SIZE,
+                fields=LIST_FIELDS,
+                supportsAllDrives="true",
+                includeItemsFromAllDrives="true"
+            )
+            if page_token:
+                params["pageToken"] = page_token
+
+            response = await self.http.get(f"{self.api_base}/files", params=params, headers=self._headers())
+            if response.status_code != 200:
+                raise DriveIngestError(
+                    f"Не удалось получить список файлов папки (статус {response.status_code}). "
+                    "Убедитесь что папка публично доступна"
+                )
+
+            data = response.json()
+            files.extend(data.get("files", []))
+
+            page_token = data.get("nextPageToken")
+            if not page_token:
+                break
+
+        return files
+
+    def stream_file(self, file_id: str):
+        """Контекстный менеджер потокового скачивания содержимого файла"""
+        return self.http.stream(
+            "GET",
+            f"{self.api_base}/files/{file_id}",
+            params=self._params(alt="media", supportsAllDrives="true"),
+            headers=self._headers()
+        )
+
+
+async def _checked_pdf_chunks(response: httpx.Response) -> AsyncIterator[bytes]:
+    """Чанки ответа; первый проверяется на то, что это PDF, а не HTML страница Google"""
+    first = True
+    async for chunk in response.aiter_bytes(UPLOAD_CHUNK_SIZE):
+        if first:
+            first = False
+            head = chunk[:1024]
+            if b'<!DOCTYPE html>' in head or b'<html' in head:
+                raise DriveIngestError(
+                    "Не удалось скачать файл. Google Drive вернул HTML страницу вместо PDF. "
+                    "Скачайте файл вручную и загрузите через 'С компьютера'."
+                )
+        yield chunk
+
+
+async def download_to_staging(client: DriveClient, file_meta: dict) -> dict:
+    """Скачать файл потоково во временную зону хранилища"""
+    async with client.stream_file(file_meta["id"]) as response:
+        if response.status_code != 200:
+            raise DriveIngestError(f"Не удалось скачать файл {file_meta.get('name')}. Статус: {response.status_code}")
+
+        path = staging_path()
+        size, sha256 = await save_stream(_checked_pdf_chunks(response), path, max_size=settings.MAX_FILE_SIZE)
+
+    return {"meta": file_meta, "staged_path": path, "size": size, "sha256": sha256}
+
+
+def sync_state(existing: List[Volume], file_meta: dict) -> Tuple[str, Optional[Volume]]:
+    """
+    Состояние файла относительно томов дела с тем же gdrive_file_id:
+    ("new", None) — тома нет; ("synced", том) — совпадает md5Checksum или modifiedTime;
+    ("changed", том) — том есть, но файл в Drive с тех пор изменился
+    """
+    md5 = file_meta.get("md5Checksum")
+    modified = file_meta.get("modifiedTime")
+    found = None
+    for volume in existing:
+        if volume.gdrive_file_id != file_meta["id"]:
+            continue
+        if (md5 and volume.gdrive_md5 == md5) or (modified and volume.gdrive_modified_time == modified):
+            return "synced", volume
+        found = found or volume
+    return ("changed", found) if found else ("new", None)
+
+
+async def ingest_files(
+    db: Session,
+    case_id: int,
+    client: DriveClient,
+    files: List[dict],
+    concurrency: int = None
+) -> dict:
+    """
+    Скачать файлы параллельно (не больше concurrency одновременно) и создать тома.
+    Уже синхронизированные файлы пропускаются, изменённые с прошлой синхронизации —
+    возвращаются в changed (том не заменяется и не дублируется).
+    """
+    concurrency = concurrency or settings.GDRIVE_DOWNLOAD_CONCURRENCY
+
+    # Работа с БД (синхронная сессия) выполняется в потоках, event loop только скачивает
+    def load_existing() -> List[Volume]:
+        """Тома дела, загруженные из Google Drive (выполняется в потоке)"""
+        return db.query(Volume).filter(
+            Volume.case_id == case_id,
+            Volume.gdrive_file_id.isnot(None)
+        ).all()
+
+    existing = await asyncio.to_thread(load_existing)
+
+    to_download = []
+    skipped = []
+    changed = []
+    for file_meta in files:
+        state, volume = sync_state(existing, file_meta)
+        if state == "synced":
+            skipped.append({"id": file_meta["id"], "name": file_meta.get("name")})
+        elif state == "changed":
+            # Второй том для того же файла не создаём: распознавание и документы тома
+            # относятся к прежнему содержимому — замену решает пользователь
+            changed.append({
+                "id": file_meta["id"],
+                "name": file_meta.get("name"),
+                "volume_id": volume.id,
+                "volume_number": volume.volume_number
+            })
+        else:
+            to_download.append(file_meta)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited_download(file_meta: dict) -> dict:
+        async with semaphore:
+            return await download_to_staging(client, file_meta)
+
+    results = await asyncio.gather(*(limited_download(f) for f in to_download), return_exceptions=True)
+
+    def register_downloads() -> Tuple[List[dict], List[dict]]:
+        """
+        Создать тома скачанных файлов (выполняется в потоке).
+        Тома создаём последовательно — номера томов идут по порядку. При ошибке
+        временные копии ещё не зарегистрированных файлов удаляются.
+        """
+        downloaded = []
+        failed = []
+        try:
+            for file_meta, result in zip(to_download, results):
+                if isinstance(result, (DriveIngestError, FileTooLargeError, httpx.HTTPError)):
+                    print(f"Ошибка при загрузке файла {file_meta.get('name')}: {result}")
+                    failed.append({"id": file_meta["id"], "name": file_meta.get("name"), "error": str(result)})
+                    continue
+                if isinstance(result, BaseException):
+                    raise result
+
+                blob = commit_blob(db, result["staged_path"], result["sha256"], result["size"])
+                file_name = os.path.basename(file_meta.get("name") or f"Том_{file_meta['id']}.pdf")
+
+                volume, reused = register_volume(db, case_id, blob, file_name, gdrive_file_id=file_meta["id"])
+                volume.gdrive_md5 = file_meta.get("md5Checksum")
+                volume.gdrive_modified_time = file_meta.get("modifiedTime")
+                db.commit()
+
+                downloaded.append({
+                    "id": file_meta["id"],
+                    "filename": file_name,
+                    "path": blob.storage_path,
+                    "size": result["size"],
+                    "sha256": result["sha256"],
+                    "reused_results": reused,
+                    "volume_id": volume.id,
+                    "volume_number": volume.volume_number
+                })
+        finally:
+            for result in results:
+                if isinstance(result, dict) and os.path.exists(result["staged_path"]):
+                    os.remove(result["staged_path"])
+        return downloaded, failed
+
+    downloaded, failed = await asyncio.to_thread(register_downloads)
+
+    schedule_ingest_on_upload(item["volume_id"] for item in downloaded)
+
+    if changed:
+        print(f"[GDRIVE] Дело {case_id}: изменены в Google Drive, тома не обновлены: {len(changed)}")
+
+    return {
+        "total_files": len(files),
+        "downloaded": downloaded,
+        "skipped": skipped,
+        "changed": changed,
+        "failed": failed
+    }
+
+
+def make_http_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    return httpx.AsyncClient(follow_redirects=True, timeout=300.0, transport=transport)
+
+
+async def ingest_folder(
+    db: Session,
+    case_id: int,
+    folder_id: str,
+    access_token: str = None,
+    api_key: str = None,
+    concurrency: int = None,
+    transport: Optional[httpx.AsyncBaseTransport] = None
+) -> dict:
+    """Синхронизировать папку Google Drive с томами дела"""
+    async with make_http_client(transport) as http:
+        client = DriveClient(http, access_token=access_token, api_key=api_key)
+        files = await client.list_folder(folder_id)
+        return await ingest_files(db, case_id, client, files, concurrency=concurrency)
+
+
+async def ingest_file(
+    db: Session,
+    case_id: int,
+    file_id: str,
+    access_token: str = None,
+    api_key: str = None,
+    transport: Optional[httpx.AsyncBaseTransport] = None
+) -> dict:
+    """Загрузить один файл Google Drive как том дела"""
+    async with make_http_client(transport) as http:
+        client = DriveClient(http, access_token=access_token, api_key=api_key)
+        file_meta = await client.get_metadata(file_id)
+        return await ingest_files(db, case_id, client, [file_meta], concurrency=1)
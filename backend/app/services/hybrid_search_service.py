@@ -0,0 +1,213 @@
+"""
+Гибридный поиск по делу: полнотекстовый (BM25) + векторный с объединением рангов (RRF)
+
+Юридический запрос смешивает точные токены ("ст. 159", фамилии, даты) со смыслом;
+ветви ранжируют их по-разному, Reciprocal Rank Fusion складывает ранги:
+score = Σ 1 / (RRF_K + rank) по ветвям, где страница нашлась.
+
+Ветви выполняются одновременно, задержка — максимум из двух, а не сумма:
+- лексическая — страничный индекс search_service (FTS5 bm25 / GIN) в режиме
+  "хотя бы одно слово", запрос в своей асинхронной сессии;
+- векторная — матрица и индекс IVF дела (semantic_search_service) в потоке.
+Единица выдачи — страница тома: chunk засчитывается каждой странице, которую
+покрывает (page_number..page_end), у страницы берётся лучший ранг её chunks. Фильтры по тому, типу и дате документа
+(документы текущего выделения) применяются в обеих ветвях до ранжирования.
+"""
+
+import time
+import asyncio
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.packing import page_text_of
+from app.models.database import AsyncSessionLocal, SessionLocal
+from app.services import embedding_service, search_service
+from app.services import semantic_search_service as semantic_search
+
+# ============================================================
+# НАСТРОЙКИ
+# ============================================================
+RRF_K = 60  # сглаживание рангов (стандартное значение из статьи о RRF)
+CANDIDATES = 100  # кандидатов из каждой ветви
+MAX_HYBRID_LIMIT = 100
+MAX_QUERY_LENGTH = 2000
+
+# chunks текущих запусков OCR дела, попадающие в документы по фильтрам
+FILTERED_CHUNKS_SQL = """
+    SELECT tc.id FROM text_chunks tc
+    JOIN volumes v ON v.id = tc.volume_id
+    WHERE v.case_id = :case_id AND (CAST(:volume_id AS INTEGER) IS NULL OR tc.volume_id = :volume_id)
+    {filters}
+"""
+
+
+class InvalidHybridQueryError(ValueError):
+    pass
+
+
+class PageAnchor:
+    """Страница тома — для поиска документа (search_service.find_documents)"""
+    __slots__ = ("volume_id", "page_number")
+
+    def __init__(self, volume_id: int, page_number: int):
+        self.volume_id = volume_id
+        self.page_number = page_number
+
+
+def filtered_chunk_ids(case_id: int, volume_id: Optional[int], filters: Tuple[str, dict]) -> List[int]:
+    filter_sql, params = filters
+    db = SessionLocal()
+    try:
+        return list(db.execute(
+            text(FILTERED_CHUNKS_SQL.format(filters=filter_sql)),
+            {"case_id": case_id, "volume_id": volume_id, **params}
+        ).scalars())
+    finally:
+        db.close()
+
+
+# ============================================================
+# ВЕТВИ
+# ============================================================
+
+async def lexical_leg(case_id: int, query: str, terms: List[str], volume_id: Optional[int],
+                      filters: tuple) -> Tuple[list, float]:
+    """Страницы по bm25 (своя сессия — выполняется параллельно с векторной ветвью)"""
+    started = time.perf_counter()
+    if not terms:
+        return [], 0.0
+    async with AsyncSessionLocal() as db:
+        hits = await search_service.ranked_pages(
+            db, case_id, query, terms, volume_id, CANDIDATES, any_term=True,
+            filters=search_service.document_filter("pt.volume_id", "pt.page_number", *filters)
+        )
+    return hits, time.perf_counter() - started
+
+
+def nearest_chunks(case_id: int, query: str, volume_id: Optional[int], filters: tuple) -> Tuple[list, dict]:
+    """Ближайшие chunks; с фильтрами по документам — только среди их chunks"""
+    chunk_ids = None
+    document_filter = search_service.document_filter("tc.volume_id", "tc.page_number", *filters)
+    if document_filter[0]:
+        chunk_ids = filtered_chunk_ids(case_id, volume_id, document_filter)
+    return semantic_search.nearest_chunks(
+        case_id, query, CANDIDATES, [volume_id] if volume_id is not None else None, chunk_ids
+    )
+
+
+async def semantic_leg(case_id: int, query: str, volume_id: Optional[int],
+                       filters: tuple) -> Tuple[list, dict, float, Optional[str]]:
+    """Векторная ветвь в потоке; без бэкенда векторов поиск остаётся лексическим (ошибка в ответе)"""
+    started = time.perf_counter()
+    try:
+        hits, info = await asyncio.to_thread(nearest_chunks, case_id, query, volume_id, filters)
+    except embedding_service.EmbeddingError as e:
+        return [], {"model": None, "method": None, "vectors": 0}, 0.0, f"Векторизация недоступна: {e}"
+    return hits, info, time.perf_counter() - started, None
+
+
+# ============================================================
+# ОБЪЕДИНЕНИЕ
+# ============================================================
+
+def fuse(lexical: list, semantic: list) -> List[tuple]:
+    """
+    RRF по страницам: [(ключ страницы, score, ранг в bm25, ранг в векторах)].
+    lexical и semantic — ключи (volume_id, page_number) по убыванию релевантности, с повторами.
+    """
+    ranks: Dict[tuple, list] = {}
+    for leg, keys in enumerate((lexical, semantic)):
+        rank = 0
+        for key in keys:
+            entry = ranks.setdefault(key, [None, None])
+            if entry[leg] is None:
+                rank += 1
+                entry[leg] = rank
+    fused = [
+        (key, sum(1 / (RRF_K + rank) for rank in entry if rank is not None), entry[0], entry[1])
+        for key, entry in ranks.items()
+    ]
+    fused.sort(key=lambda item: -item[1])
+    return fused
+
+
+async def search_case(db: AsyncSession, case_id: int, query: str, volume_id: Optional[int] = None,
+                      doc_types: Optional[List[str]] = None, date_from: Optional[date] = None,
+                      date_to: Optional[date] = None, limit: int = 20) -> dict:
+    """Гибридный поиск по делу: страницы с документом, фрагментом и лучшим chunk"""
+    query = (query or "").strip()
+    if not query:
+        raise InvalidHybridQueryError("Пустой поисковый запрос")
+    if len(query) > MAX_QUERY_LENGTH:
+        raise InvalidHybridQueryError(f"Запрос длиннее {MAX_QUERY_LENGTH} символов")
+    if not 1 <= limit <= MAX_HYBRID_LIMIT:
+        raise InvalidHybridQueryError(f"limit должен быть от 1 до {MAX_HYBRID_LIMIT}")
+    if date_from and date_to and date_from > date_to:
+        raise InvalidHybridQueryError("date_from позже date_to")
+
+    started = time.perf_counter()
+    terms = search_service.query_terms(query)
+    filters = (doc_types, date_from, date_to)
+    (page_hits, lexical_seconds), (chunk_hits, info, semantic_seconds, semantic_error) = await asyncio.gather(
+        lexical_leg(case_id, query, terms, volume_id, filters),
+        semantic_leg(case_id, query, volume_id, filters)
+    )
+
+    chunks, texts = await semantic_search.load_chunks(db, [chunk_id for chunk_id, _ in chunk_hits])
+    found_chunks = [(chunks[chunk_id], score) for chunk_id, score in chunk_hits if chunk_id in chunks]
+
+    # Страницы chunks в порядке выдачи векторной ветви; лучший chunk страницы — первый покрывший её.
+    # С фильтром по документам проверена только страница начала chunk — засчитывается она одна.
+    filtered = bool(doc_types) or date_from is not None or date_to is not None
+    chunk_pages, best_chunk = [], {}
+    for chunk, score in found_chunks:
+        last_page = chunk.page_number if filtered else (chunk.page_end or chunk.page_number)
+        for page_number in range(chunk.page_number, last_page + 1):
+            key = (chunk.volume_id, page_number)
+            chunk_pages.append(key)
+            best_chunk.setdefault(key, (chunk, score))
+    pages = {(hit.volume_id, hit.page_number): hit for hit in page_hits}
+
+    fused = fuse([(hit.volume_id, hit.page_number) for hit in page_hits], chunk_pages)[:limit]
+
+    volume_numbers = {hit.volume_id: hit.volume_number for hit in page_hits}
+    volume_numbers.update((chunk.volume_id, chunk.volume_number) for chunk, _ in found_chunks)
+    anchors = [PageAnchor(volume_id, page_number) for (volume_id, page_number), *_ in fused]
+    documents = await search_service.find_documents(db, anchors)
+
+    results = []
+    for key, score, lexical_rank, semantic_rank in fused:
+        page = pages.get(key)
+        chunk, chunk_score = best_chunk.get(key, (None, None))
+        snippet_text = page_text_of(page) if page is not None else texts[chunk.id]
+        results.append({
+            "volume_id": key[0],
+            "volume_number": volume_numbers[key[0]],
+            "page_number": key[1],
+            "score": round(score, 6),
+            "lexical_rank": lexical_rank,
+            "lexical_score": float(page.score) if page is not None else None,
+            "semantic_rank": semantic_rank,
+            "chunk": {
+                "id": chunk.id,
+                "chunk_index": chunk.chunk_index,
+                "page_end": chunk.page_end or chunk.page_number,
+                "score": round(chunk_score, 4),
+                "text": texts[chunk.id]
+            } if chunk is not None else None,
+            "snippet": search_service.make_snippet(snippet_text, terms),
+            "document": documents.get(key)
+        })
+
+    return {
+        "query": query,
+        "terms": terms,
+        **info,
+        "took_ms": round((time.perf_counter() - started) * 1000, 1),
+        "lexical": {"hits": len(page_hits), "took_ms": round(lexical_seconds * 1000, 1)},
+        "semantic": {"hits": len(found_chunks), "took_ms": round(semantic_seconds * 1000, 1), "error": semantic_error},
+        "results": results
+    }
@@ -0,0 +1,381 @@
+"""
+Сервис подготовки томов (ingest)
+
+Запускается в фоне для каждого нового тома (загрузка с компьютера, возобновляемая загрузка,
+Google Drive). За один проход по PDF:
+- пишет нормализованную копию для просмотра (если включена PDF_NORMALIZE)
+- считает страницы (Volume.page_count)
+- строит манифест страниц: размер, поворот, есть ли текстовый слой, только скан, пустая
+- считает SHA-256 файла (если ещё не посчитан)
+- ставит OCR в очередь согласно INGEST_OCR_POLICY
+
+Статус виден в Volume.processing_status:
+pending -> processing -> ingested | ocr_queued -> ocr_running -> ocr_completed; ошибка -> failed
+Страницы, которые не удалось распознать, отмечаются в манифесте (ocr_error), запуск продолжается.
+"""
+
+import os
+import json
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+import fitz  # PyMuPDF
+
+from app.core.chunking import page_hash
+from app.core.config import settings
+from app.core.packing import pack_text, pack_word_boxes
+from app.models import Volume, OcrRun, PageText
+from app.models.database import SessionLocal, db_writer, IS_SQLITE
+from app.services import jobs, search_service, retention_service
+from app.services.storage_service import get_volume_view_path, ensure_volume_hash
+from app.services.pdf_normalize_service import normalize_volume
+
+# ============================================================
+# НАСТРОЙКИ
+# ============================================================
+MIN_TEXT_CHARS = 20  # меньше символов в текстовом слое — считаем что слоя нет
+BLANK_PROBE_ZOOM = 0.1  # масштаб рендера для проверки пустой страницы
+BLANK_DARK_LEVEL = 200  # пиксель темнее — считаем "чернилами"
+BLANK_MAX_INK_RATIO = 0.003  # доля тёмных пикселей, ниже которой страница пустая
+WORD_BOX_DPI = 300  # координаты слов текстового слоя — в пикселях того же масштаба, что у OCR
+
+OCR_POLICIES = ("auto", "all", "none")
+
+# Статусы тома, при которых подготовка или OCR не доведены до конца
+UNFINISHED_STATUSES = ("processing", "ocr_queued", "ocr_running")
+
+
+# ============================================================
+# МАНИФЕСТ СТРАНИЦ
+# ============================================================
+
+def is_blank_page(page) -> bool:
+    """Пустая страница: почти нет тёмных пикселей на маленьком рендере"""
+    pix = page.get_pixmap(matrix=fitz.Matrix(BLANK_PROBE_ZOOM, BLANK_PROBE_ZOOM), colorspace=fitz.csGRAY)
+    samples = pix.samples
+    if not samples:
+        return True
+    ink = sum(1 for value in samples if value < BLANK_DARK_LEVEL)
+    return ink / len(samples) < BLANK_MAX_INK_RATIO
+
+
+def describe_page(page) -> dict:
+    """Описание одной страницы для манифеста"""
+    text_chars = len(page.get_text("text").strip())
+    has_text = text_chars >= MIN_TEXT_CHARS
+    has_images = bool(page.get_images(full=False))
+
+    blank = False
+    if not has_text:
+        blank = is_blank_page(page)
+
+    return {
+        "page": page.number + 1,
+        "width": round(page.rect.width, 1),
+        "height": round(page.rect.height, 1),
+        "rotation": page.rotation,
+        "text_chars": text_chars,
+        "has_text": has_text,
+        "image_only": not has_text and has_images and not blank,
+        "blank": blank
+    }
+
+
+def build_page_manifest(pdf_path: str) -> List[dict]:
+    """Манифест всех страниц PDF (одно открытие файла)"""
+    doc = fitz.open(pdf_path)
+    try:
+        return [describe_page(page) for page in doc]
+    finally:
+        doc.close()
+
+
+def get_page_manifest(volume: Volume) -> List[dict]:
+    return json.loads(volume.page_manifest) if volume.page_manifest else []
+
+
+def manifest_summary(manifest: List[dict]) -> dict:
+    return {
+        "pages": len(manifest),
+        "text_layer": sum(1 for p in manifest if p["has_text"]),
+        "image_only": sum(1 for p in manifest if p["image_only"]),
+        "blank": sum(1 for p in manifest if p["blank"]),
+        "rotated": sum(1 for p in manifest if p["rotation"]),
+        "ocr_failed": sum(1 for p in manifest if p.get("ocr_error"))
+    }
+
+
+def pages_needing_ocr(manifest: List[dict], policy: str) -> List[int]:
+    """Страницы, которые нужно распознавать движком OCR (остальные берутся из текстового слоя)"""
+    if policy == "all":
+        return [p["page"] for p in manifest]
+    return [p["page"] for p in manifest if not p["has_text"] and not p["blank"]]
+
+
+def text_layer_words(page) -> List[dict]:
+    """Слова текстового слоя PDF в формате word boxes (conf 100)"""
+    scale = WORD_BOX_DPI / 72
+    return [
+        {
+            "text": word,
+            "left": round(x0 * scale),
+            "top": round(y0 * scale),
+            "width": round((x1 - x0) * scale),
+            "height": round((y1 - y0) * scale),
+            "conf": 100
+        }
+        for x0, y0, x1, y1, word, *_ in page.get_text("words")
+    ]
+
+
+def save_page_text(session, ocr_run_id: int, volume_id: int, page_number: int,
+                   text: str, confidence: int, engine: str, word_boxes: Optional[List[dict]] = None):
+    """Запись страницы OCR и прогресса запуска (через db_writer, commit делает писатель)"""
+    stored_text, text_zstd = pack_text(text, settings.PAGE_TEXT_ZSTD and IS_SQLITE)
+    page = PageText(
+        volume_id=volume_id,
+        ocr_run_id=ocr_run_id,
+        page_number=page_number,
+        text=stored_text,
+        text_zstd=text_zstd,
+        text_hash=page_hash(text),
+        confidence=confidence,
+        ocr_engine=engine,
+        word_boxes_packed=pack_word_boxes(word_boxes or [], text)
+    )
+    session.add(page)
+    search_service.index_page(session, page)
+    session.query(OcrRun).filter(OcrRun.id == ocr_run_id).update(
+        {"pages_processed": page_number, "heartbeat_at": datetime.utcnow()}, synchronize_session=False
+    )
+
+
+def is_abandoned(ocr_run: OcrRun, now: datetime) -> bool:
+    """
+    Запуск OCR брошен: процесс-владелец завершён, либо (владельца нельзя проверить:
+    другой хост, не записан, pid занят другим процессом) страницы не пишутся
+    дольше OCR_RUN_STALE_SECONDS
+    """
+    alive = jobs.owner_alive(ocr_run.owner)
+    if alive is not None:
+        return not alive
+    last_seen = ocr_run.heartbeat_at or ocr_run.started_at
+    return last_seen is None or now - last_seen > timedelta(seconds=settings.OCR_RUN_STALE_SECONDS)
+
+
+def has_completed_ocr(db, volume_id: int) -> bool:
+    return db.query(OcrRun.id).filter(
+        OcrRun.volume_id == volume_id,
+        OcrRun.status == "completed"
+    ).first() is not None
+
+
+# ============================================================
+# ЗАДАЧИ
+# ============================================================
+
+def ingest_volume(volume_id: int):
+    """Подготовка тома (выполняется в фоновом потоке со своей сессией БД)"""
+    db = SessionLocal()
+    try:
+        volume = db.get(Volume, volume_id)
+        if not volume:
+            return
+
+        volume.processing_status = "processing"
+        db.commit()
+
+        try:
+            ensure_volume_hash(db, volume)
+            if settings.PDF_NORMALIZE:
+                normalize_volume(db, volume)
+
+            file_path = get_volume_view_path(volume)
+            if not os.path.exists(file_path):
+                raise FileNotFoundError(file_path)
+            manifest = build_page_manifest(file_path)
+        except Exception as e:
+            print(f"[INGEST] Том {volume_id}: ошибка подготовки: {e}")
+            volume.processing_status = "failed"
+            db.commit()
+            return
+
+        volume.page_count = len(manifest)
+        volume.page_manifest = json.dumps(manifest, ensure_ascii=False)
+
+        # OCR уже есть (например, скопирован из тома с тем же файлом)
+        if has_completed_ocr(db, volume_id):
+            volume.processing_status = "ocr_completed"
+            db.commit()
+            print(f"[INGEST] Том {volume_id}: {len(manifest)} стр., OCR уже есть")
+            return
+
+        policy = settings.INGEST_OCR_POLICY
+        if policy == "none" or not manifest:
+            volume.processing_status = "ingested"
+            db.commit()
+            print(f"[INGEST] Том {volume_id}: {len(manifest)} стр., OCR не запускается")
+            return
+
+        volume.processing_status = "ocr_queued"
+        db.commit()
+        print(f"[INGEST] Том {volume_id}: {manifest_summary(manifest)}, OCR в очереди ({policy})")
+
+    finally:
+        db.close()
+
+    jobs.submit(f"ocr:{volume_id}", run_background_ocr, volume_id, policy)
+
+
+def run_background_ocr(volume_id: int, policy: str):
+    """
+    OCR тома в фоне (Tesseract).
+    Политика auto: страницы с текстовым слоем берутся из PDF, пустые сохраняются пустыми,
+    распознаются только сканы. Политика all: распознаются все страницы.
+    """
+    db = SessionLocal()
+    try:
+        volume = db.get(Volume, volume_id)
+        if not volume:
+            return
+
+        # Пользователь уже запустил OCR вручную
+        running = db.query(OcrRun.id).filter(
+            OcrRun.volume_id == volume_id,
+            OcrRun.status == "running"
+        ).first()
+        if running:
+            print(f"[INGEST] Том {volume_id}: OCR уже выполняется, фоновый запуск пропущен")
+            return
+
+        file_path = get_volume_view_path(volume)
+        manifest = get_page_manifest(volume)
+        ocr_pages = set(pages_needing_ocr(manifest, policy))
+
+        ocr_pdf_page_words = None
+        if ocr_pages:
+            try:
+                from app.services.ocr_service import ocr_pdf_page_words
+            except ImportError as e:
+                print(f"[INGEST] Том {volume_id}: OCR недоступен ({e})")
+                volume.processing_status = "ingested"
+                db.commit()
+                return
+
+        ocr_run = OcrRun(
+            volume_id=volume_id,
+            engine="tesseract",
+            pages_total=len(manifest),
+            pages_processed=0,
+            status="running",
+            owner=jobs.worker_id()
+        )
+        db.add(ocr_run)
+        volume.processing_status = "ocr_running"
+        db.commit()
+
+        total_confidence = 0
+        saved_pages = 0
+        pending_writes = []
+        doc = fitz.open(file_path)
+        try:
+            for page_info in manifest:
+                page_number = page_info["page"]
+                page_info.pop("ocr_error", None)
+
+                # Ошибка одной страницы не прерывает запуск: страница отмечается в манифесте
+                try:
+                    words = None
+                    if page_number in ocr_pages:
+                        text, confidence, words = ocr_pdf_page_words(file_path, page_number, file_hash=volume.file_hash)
+                        engine = "tesseract"
+                    elif page_info["blank"]:
+                        text, confidence, engine = "", 100, "blank"
+                    else:
+                        page = doc.load_page(page_number - 1)
+                        text = page.get_text("text").strip()
+                        words = text_layer_words(page)
+                        confidence, engine = 100, "text_layer"
+                except Exception as e:
+                    print(f"[INGEST] Том {volume_id}: страница {page_number} не распознана: {e}")
+                    page_info["ocr_error"] = str(e)[:500]
+                    continue
+
+                # Не ждём коммита каждой страницы: писатель объединит их в пакеты
+                pending_writes.append(db_writer.submit(
+                    save_page_text, ocr_run.id, volume_id, page_number, text, confidence, engine, words
+                ))
+                total_confidence += confidence
+                saved_pages += 1
+
+            for future in pending_writes:
+                future.result()
+
+            if manifest and not saved_pages:
+                raise RuntimeError("не распознана ни одна страница")
+        except Exception as e:
+            print(f"[INGEST] Том {volume_id}: ошибка OCR: {e}")
+            db.rollback()
+            ocr_run.status = "failed"
+            volume.processing_status = "failed"
+            volume.page_manifest = json.dumps(manifest, ensure_ascii=False)
+            db.commit()
+            return
+        finally:
+            doc.close()
+
+        failed_pages = len(manifest) - saved_pages
+        avg_confidence = int(total_confidence / saved_pages) if saved_pages else 0
+        volume.page_manifest = json.dumps(manifest, ensure_ascii=False)
+        ocr_run.status = "completed"
+        ocr_run.avg_confidence = avg_confidence
+        ocr_run.completed_at = datetime.utcnow()
+        volume.ocr_quality = avg_confidence
+        volume.processing_status = "ocr_completed"
+        volume.processed_at = datetime.utcnow()
+        db.commit()
+        print(
+            f"[INGEST] Том {volume_id}: OCR завершён, распознано движком {len(ocr_pages)} из {len(manifest)} стр."
+            + (f", с ошибкой {failed_pages} стр." if failed_pages else "")
+        )
+        retention_service.schedule_volume(volume_id)
+
+    finally:
+        db.close()
+
+
+def schedule_ingest(volume_ids: Iterable[int]) -> List[int]:
+    """Поставить подготовку томов в фоновую очередь, возвращает поставленные id"""
+    scheduled = []
+    for volume_id in volume_ids:
+        if jobs.submit(f"ingest:{volume_id}", ingest_volume, volume_id):
+            scheduled.append(volume_id)
+    return scheduled
+
+
+def schedule_ingest_on_upload(volume_ids: Iterable[int]) -> List[int]:
+    """Автоматическая подготовка после загрузки (если включена INGEST_ON_UPLOAD)"""
+    if not settings.INGEST_ON_UPLOAD:
+        return []
+    return schedule_ingest(volume_ids)
+
+
+def recover_unfinished(db) -> int:
+    """
+    После перезапуска: брошенные OCR (процесс-владелец завершён или пульс устарел)
+    помечаются failed, недоготовленные тома снова ставятся в очередь.
+    Запуски, которые выполняют другие процессы (в том числе SSE), не трогаются.
+    """
+    now = datetime.utcnow()
+    running = db.query(OcrRun).filter(OcrRun.status == "running").all()
+    for ocr_run in running:
+        if is_abandoned(ocr_run, now):
+            ocr_run.status = "failed"
+
+    volumes = db.query(Volume.id).filter(
+        (Volume.processing_status.in_(UNFINISHED_STATUSES)) |
+        ((Volume.processing_status == "pending") & Volume.page_count.is_(None))
+    ).all()
+    db.commit()
+
+    return len(schedule_ingest_on_upload(v.id for v in volumes))
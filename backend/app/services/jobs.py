@@ -0,0 +1,121 @@
+"""
+Фоновые задачи в процессе приложения
+
+Пул потоков для обработки вне запроса (подготовка томов, OCR).
+Задача с тем же ключом не ставится повторно, пока предыдущая не завершилась.
+Процесс помечает свои длительные записи (запуски OCR) идентификатором worker_id(),
+по нему после перезапуска отличаются брошенные записи от выполняемых другими процессами.
+"""
+
+import os
+import uuid
+import socket
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Dict, List, Optional
+
+from app.core.config import settings
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Ключ задачи -> Future (только незавершённые)
+_active: Dict[str, Future] = {}
+
+# Идентификатор процесса: (pid, "хост:pid:токен"); токен отличает перезапуск с тем же pid
+_worker = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BACKGROUND_WORKERS,
+                thread_name_prefix="starec-job"
+            )
+        return _executor
+
+
+def _run(key: str, fn: Callable, args: tuple, kwargs: dict):
+    try:
+        return fn(*args, **kwargs)
+    except Exception:
+        print(f"[JOBS] Задача {key} завершилась с ошибкой:\n{traceback.format_exc()}")
+        raise
+    finally:
+        with _executor_lock:
+            _active.pop(key, None)
+
+
+def submit(key: str, fn: Callable, *args, **kwargs) -> Optional[Future]:
+    """
+    Поставить задачу в очередь. Возвращает None, если задача с таким ключом уже выполняется
+    или ждёт в очереди.
+    """
+    executor = get_executor()
+    with _executor_lock:
+        if key in _active:
+            return None
+        future = executor.submit(_run, key, fn, args, kwargs)
+        _active[key] = future
+    return future
+
+
+def is_active(key: str) -> bool:
+    with _executor_lock:
+        return key in _active
+
+
+def active_jobs() -> List[str]:
+    with _executor_lock:
+        return list(_active)
+
+
+def shutdown():
+    """Остановить пул: задачи в очереди отменяются, выполняемые дорабатывают в фоне"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+        _active.clear()
+    if executor:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ============================================================
+# ВЛАДЕЛЕЦ ЗАПИСЕЙ
+# ============================================================
+
+def worker_id() -> str:
+    """Идентификатор текущего процесса (после fork считается заново)"""
+    global _worker
+    with _executor_lock:
+        if _worker is None or _worker[0] != os.getpid():
+            _worker = (os.getpid(), f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}")
+        return _worker[1]
+
+
+def owner_alive(owner: Optional[str]) -> Optional[bool]:
+    """
+    Жив ли процесс-владелец записи. True — только текущий процесс, False — процесс
+    точно завершён. None — проверить нельзя (владелец не записан, другой хост или
+    процесс с этим pid существует: pid переиспользуются, это может быть другой процесс) —
+    решает возраст пульса записи.
+    """
+    if not owner or owner.count(":") < 2:
+        return None
+    host, pid, _ = owner.rsplit(":", 2)
+    if host != socket.gethostname() or not pid.isdigit():
+        return None
+    if owner == worker_id():
+        return True
+    if int(pid) == os.getpid():
+        return False  # тот же pid у нового запуска процесса (контейнер перезапущен)
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return None
@@ -32,8 +32,11 @@ def preprocess_image_simple(image: Image.Image) -> Image.Image:
     return image
 
 
-def extract_page_image_for_ocr(pdf_path: str, page_number: int, dpi: int = OCR_DPI) -> Image.Image:
-    """Извлечь страницу PDF как изображение"""
+def extract_page_image_for_ocr(pdf_path: str, page_number: int, dpi: int = OCR_DPI, file_hash: str = None) -> Image.Image:
+    """
+    Извлечь страницу PDF как изображение
+    file_hash: если передан, рендер заодно кладётся в кеш изображений страниц
+    """
     doc = fitz.open(pdf_path)
     page = doc.load_page(page_number - 1)
     mat = fitz.Matrix(dpi / 72, dpi / 72)
@@ -41,6 +44,11 @@ def extract_page_image_for_ocr(pdf_path: str, page_number: int, dpi: int = OCR_D
     img_data = pix.tobytes("png")
     img = Image.open(io.BytesIO(img_data))
     doc.close()
+
+    if file_hash:
+        from app.services.page_image_service import feed_cache
+        feed_cache(file_hash, page_number, img, source_zoom=dpi / 72)
+
     return img
 
 
@@ -58,8 +66,30 @@ def image_to_base64(image: Image.Image) -> str:
 # TESSERACT OCR (бесплатно)
 # ============================================================
 
+def tesseract_words(data: Dict) -> List[Dict]:
+    """Слова из image_to_data: координаты в пикселях рендера OCR_DPI"""
+    return [
+        {
+            "text": word,
+            "left": data['left'][i],
+            "top": data['top'][i],
+            "width": data['width'][i],
+            "height": data['height'][i],
+            "conf": max(int(float(data['conf'][i])), 0)
+        }
+        for i, word in enumerate(data['text'])
+        if word and word.strip()
+    ]
+
+
 def ocr_tesseract(image: Image.Image) -> Tuple[str, int]:
     """OCR с помощью Tesseract"""
+    text, avg_confidence, _ = ocr_tesseract_words(image)
+    return text, avg_confidence
+
+
+def ocr_tesseract_words(image: Image.Image) -> Tuple[str, int, List[Dict]]:
+    """OCR с помощью Tesseract: текст, уверенность и координаты слов"""
     processed_image = preprocess_image_simple(image)
 
     try:
@@ -77,19 +107,25 @@ def ocr_tesseract(image: Image.Image) -> Tuple[str, int]:
         # Получаем текст
         text = pytesseract.image_to_string(processed_image, lang=OCR_LANG, config=TESSERACT_CONFIG)
 
-        return text.strip(), avg_confidence
+        return text.strip(), avg_confidence, tesseract_words(data)
 
     except Exception as e:
         print(f"Ошибка Tesseract OCR: {e}")
-        return "", 0
+        return "", 0, []
 
 
-def ocr_pdf_page_tesseract(pdf_path: str, page_number: int) -> Tuple[str, int]:
+def ocr_pdf_page_tesseract(pdf_path: str, page_number: int, file_hash: str = None) -> Tuple[str, int]:
     """OCR страницы PDF с Tesseract"""
-    image = extract_page_image_for_ocr(pdf_path, page_number, dpi=OCR_DPI)
+    image = extract_page_image_for_ocr(pdf_path, page_number, dpi=OCR_DPI, file_hash=file_hash)
     return ocr_tesseract(image)
 
 
+def ocr_pdf_page_words(pdf_path: str, page_number: int, file_hash: str = None) -> Tuple[str, int, List[Dict]]:
+    """OCR страницы PDF с Tesseract вместе с координатами слов"""
+    image = extract_page_image_for_ocr(pdf_path, page_number, dpi=OCR_DPI, file_hash=file_hash)
+    return ocr_tesseract_words(image)
+
+
 # ============================================================
 # CLAUDE VISION OCR (платно, лучше качество)
 # ============================================================
@@ -170,10 +206,10 @@ def ocr_claude(image: Image.Image, api_key: str = None, max_retries: int = 3, mo
     return "", 0
 
 
-def ocr_pdf_page_claude(pdf_path: str, page_number: int, api_key: str = None, model: str = None) -> Tuple[str, int]:
+def ocr_pdf_page_claude(pdf_path: str, page_number: int, api_key: str = None, model: str = None, file_hash: str = None) -> Tuple[str, int]:
     """OCR страницы PDF с Claude Vision"""
     # Используем низкий DPI для экономии токенов
-    image = extract_page_image_for_ocr(pdf_path, page_number, dpi=CLAUDE_OCR_DPI)
+    image = extract_page_image_for_ocr(pdf_path, page_number, dpi=CLAUDE_OCR_DPI, file_hash=file_hash)
     return ocr_claude(image, api_key=api_key, model=model)
 
 
@@ -181,17 +217,18 @@ def ocr_pdf_page_claude(pdf_path: str, page_number: int, api_key: str = None, mo
 # УНИВЕРСАЛЬНЫЕ ФУНКЦИИ
 # ============================================================
 
-def ocr_pdf_page(pdf_path: str, page_number: int, engine: str = "tesseract", api_key: str = None, model: str = None) -> Tuple[str, int]:
+def ocr_pdf_page(pdf_path: str, page_number: int, engine: str = "tesseract", api_key: str = None, model: str = None, file_hash: str = None) -> Tuple[str, int]:
     """
     OCR страницы PDF
     engine: "tesseract" или "claude"
     api_key: нужен только для Claude
     model: модель Claude (например "claude-haiku-4-5-20251001" или "claude-sonnet-4-20250514")
+    file_hash: SHA-256 тома — рендер страницы попадёт в кеш изображений страниц
     """
     if engine == "claude":
-        return ocr_pdf_page_claude(pdf_path, page_number, api_key=api_key, model=model)
+        return ocr_pdf_page_claude(pdf_path, page_number, api_key=api_key, model=model, file_hash=file_hash)
     else:
-        return ocr_pdf_page_tesseract(pdf_path, page_number)
+        return ocr_pdf_page_tesseract(pdf_path, page_number, file_hash=file_hash)
 
 
 def get_pdf_page_count(pdf_path: str) -> int:
@@ -0,0 +1,253 @@
+"""
+Сервис изображений страниц (миниатюры и масштабируемые картинки для просмотрщика)
+
+Страницы рендерятся в WebP/PNG на фиксированных масштабах и хранятся в LRU кеше на диске:
+PROCESSED_DIR/page_images/<sha256 тома>/<страница>_<масштаб>.<формат>.
+Кеш ограничен PAGE_IMAGE_CACHE_MAX_BYTES, при переполнении удаляются давно не использованные файлы.
+Рендеры, сделанные для OCR и выделения документов, тоже попадают в кеш (feed_cache),
+поэтому последующий просмотр уже распознанного тома ничего не стоит.
+"""
+
+import io
+import os
+import uuid
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from app.core.config import settings
+
+# ============================================================
+# НАСТРОЙКИ
+# ============================================================
+ZOOM_LEVELS = (0.25, 0.5, 1.0, 2.0)  # 1.0 = 72 DPI
+IMAGE_FORMATS = ("webp", "png")
+DEFAULT_FORMAT = "webp"
+THUMBNAIL_ZOOM = 0.25
+WEBP_QUALITY = 80
+
+MEDIA_TYPES = {"webp": "image/webp", "png": "image/png"}
+
+
+class PageImageError(Exception):
+    """Неверный масштаб, формат или номер страницы"""
+
+
+# ============================================================
+# LRU КЕШ НА ДИСКЕ
+# ============================================================
+
+class DiskLRUCache:
+    """
+    LRU кеш файлов с ограничением суммарного размера.
+    Порядок использования держится в памяти, при старте восстанавливается по mtime файлов.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries = None  # OrderedDict: относительный путь -> размер
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        found = []
+        if os.path.isdir(self.root):
+            for dirpath, _, filenames in os.walk(self.root):
+                for name in filenames:
+                    if name.endswith(".part"):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    stat = os.stat(path)
+                    found.append((stat.st_mtime, os.path.relpath(path, self.root), stat.st_size))
+        found.sort()
+        self._entries = OrderedDict((key, size) for _, key, size in found)
+        self._total = sum(size for _, _, size in found)
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def get(self, key: str) -> Optional[str]:
+        """Путь к файлу если он в кеше (и отметить как недавно использованный)"""
+        path = self.path_for(key)
+        with self._lock:
+            self._load()
+            if key not in self._entries:
+                return None
+            # Отметка под блокировкой: файл не может быть вытеснен между проверкой и utime
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                # Удалён вне кеша — промах
+                self._total -= self._entries.pop(key)
+                return None
+            self._entries.move_to_end(key)
+        return path
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            self._load()
+            return key in self._entries
+
+    def put(self, key: str, data: bytes) -> str:
+        """Записать файл атомарно и вытеснить старые записи при переполнении"""
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._load()
+            self._total -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._total += len(data)
+            self._evict()
+        return path
+
+    def _evict(self):
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            old_key, size = self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(self.path_for(old_key))
+            except FileNotFoundError:
+                pass
+
+    def discard_prefix(self, prefix: str) -> int:
+        """Удалить все записи каталога prefix (например, все файлы тома), возвращает сколько удалено"""
+        with self._lock:
+            self._load()
+            keys = [key for key in self._entries if key.startswith(prefix + os.sep)]
+            for key in keys:
+                self._total -= self._entries.pop(key)
+            shutil.rmtree(self.path_for(prefix), ignore_errors=True)
+        return len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._load()
+            return {"files": len(self._entries), "bytes": self._total, "max_bytes": self.max_bytes}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> DiskLRUCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskLRUCache(
+                os.path.join(settings.PROCESSED_DIR, "page_images"),
+                settings.PAGE_IMAGE_CACHE_MAX_BYTES
+            )
+        return _cache
+
+
+# ============================================================
+# РЕНДЕРИНГ
+# ============================================================
+
+def validate(zoom: float, fmt: str):
+    if zoom not in ZOOM_LEVELS:
+        raise PageImageError(f"Масштаб должен быть одним из {list(ZOOM_LEVELS)}")
+    if fmt not in IMAGE_FORMATS:
+        raise PageImageError(f"Формат должен быть одним из {list(IMAGE_FORMATS)}")
+
+
+def cache_key(file_hash: str, page_number: int, zoom: float, fmt: str) -> str:
+    return os.path.join(file_hash, f"{page_number}_{zoom:g}.{fmt}")
+
+
+def encode_image(image: Image.Image, fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == "webp":
+        image.save(buffer, format="WEBP", quality=WEBP_QUALITY, method=4)
+    else:
+        image.save(buffer, format="PNG", optimize=False)
+    return buffer.getvalue()
+
+
+def render_page(doc, page_number: int, zoom: float) -> Image.Image:
+    """Отрендерить страницу открытого PDF (нумерация с 1)"""
+    if page_number < 1 or page_number > len(doc):
+        raise PageImageError(f"Страница {page_number} вне тома ({len(doc)} стр.)")
+    page = doc.load_page(page_number - 1)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+    return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+
+def get_page_image(pdf_path: str, file_hash: str, page_number: int, zoom: float, fmt: str = DEFAULT_FORMAT) -> str:
+    """Путь к картинке страницы: из кеша или рендер с записью в кеш (блокирующий вызов)"""
+    validate(zoom, fmt)
+    cache = get_cache()
+    key = cache_key(file_hash, page_number, zoom, fmt)
+
+    path = cache.get(key)
+    if path:
+        return path
+
+    doc = fitz.open(pdf_path)
+    try:
+        image = render_page(doc, page_number, zoom)
+    finally:
+        doc.close()
+
+    return cache.put(key, encode_image(image, fmt))
+
+
+def prefetch_pages(pdf_path: str, file_hash: str, page_numbers: Iterable[int],
+                   zoom: float = THUMBNAIL_ZOOM, fmt: str = DEFAULT_FORMAT) -> int:
+    """Отрендерить в кеш список страниц одним открытием PDF, возвращает сколько отрендерено"""
+    validate(zoom, fmt)
+    cache = get_cache()
+    rendered = 0
+
+    doc = fitz.open(pdf_path)
+    try:
+        for page_number in sorted(set(page_numbers)):
+            key = cache_key(file_hash, page_number, zoom, fmt)
+            if cache.contains(key) or page_number < 1 or page_number > len(doc):
+                continue
+            cache.put(key, encode_image(render_page(doc, page_number, zoom), fmt))
+            rendered += 1
+    finally:
+        doc.close()
+
+    return rendered
+
+
+def feed_cache(file_hash: Optional[str], page_number: int, image: Image.Image, source_zoom: float) -> List[float]:
+    """
+    Положить в кеш уменьшенные копии уже отрендеренной страницы (рендер для OCR/выделения).
+    Используются только масштабы не больше исходного. Ошибки не мешают основной обработке.
+    """
+    if not file_hash or not settings.PAGE_IMAGE_FEED_FROM_PROCESSING:
+        return []
+
+    stored = []
+    try:
+        cache = get_cache()
+        rgb = image if image.mode == "RGB" else image.convert("RGB")
+        for zoom in ZOOM_LEVELS:
+            if zoom > source_zoom + 1e-6:
+                continue
+            key = cache_key(file_hash, page_number, zoom, DEFAULT_FORMAT)
+            if cache.contains(key):
+                continue
+            scale = zoom / source_zoom
+            size = (max(1, round(rgb.width * scale)), max(1, round(rgb.height * scale)))
+            cache.put(key, encode_image(rgb.resize(size, Image.LANCZOS), DEFAULT_FORMAT))
+            stored.append(zoom)
+    except Exception as e:
+        print(f"[PAGE_IMAGES] Не удалось сохранить рендер страницы {page_number}: {e}")
+
+    return stored
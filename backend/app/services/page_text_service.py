@@ -0,0 +1,189 @@
+"""
+Выдача текста страниц и chunks большими томами
+
+Keyset-пагинация: следующая порция начинается после последней выданной страницы
+(WHERE page_number > :after_page ORDER BY page_number LIMIT :limit) — индекс
+(volume_id, ocr_run_id, page_number), без OFFSET, стоимость порции не растёт к концу тома.
+
+NDJSON: одна строка JSON на страницу, строки читаются из курсора БД порциями
+(yield_per) и сразу отдаются клиенту — память сервера не зависит от размера тома.
+Текст и word boxes хранятся упакованными (app.core.packing) и распаковываются
+при формировании ответа; формат ответа тот же, что у JSON word_boxes.
+Текст chunks восстанавливается по смещениям в страницах (chunking_service) —
+порциями, одним запросом страниц на порцию.
+"""
+
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import select, func, and_, or_, Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.packing import page_text_of, word_boxes_of, word_boxes_json_of
+from app.core.responses import dumps
+from app.models import PageText, TextChunk, OcrRun
+from app.models.database import AsyncSessionLocal
+from app.services.chunking_service import CHUNK_TEXT_COLUMNS, chunk_texts_async
+
+# ============================================================
+# НАСТРОЙКИ
+# ============================================================
+MAX_PAGE_LIMIT = 1000  # страниц или chunks в одной порции
+STREAM_BATCH_SIZE = 100  # строк из курсора БД за одно чтение
+CHUNK_PREVIEW_CHARS = 200
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+class InvalidPageLimitError(ValueError):
+    pass
+
+
+def validate_limit(limit: Optional[int]) -> Optional[int]:
+    if limit is not None and not 1 <= limit <= MAX_PAGE_LIMIT:
+        raise InvalidPageLimitError(f"limit должен быть от 1 до {MAX_PAGE_LIMIT}")
+    return limit
+
+
+# ============================================================
+# ЗАПРОСЫ
+# ============================================================
+
+def page_columns(include_word_boxes: bool) -> list:
+    columns = [PageText.page_number, PageText.text, PageText.text_zstd, PageText.confidence]
+    if include_word_boxes:
+        columns += [PageText.word_boxes, PageText.word_boxes_packed]
+    return columns
+
+
+def select_pages(volume_id: int, ocr_run_id: Optional[int], include_word_boxes: bool = True,
+                 after_page: Optional[int] = None, limit: Optional[int] = None) -> Select:
+    """Страницы OCR run по порядку (ocr_run_id=None — старые записи без run)"""
+    query = select(*page_columns(include_word_boxes)).where(
+        PageText.volume_id == volume_id,
+        PageText.ocr_run_id == ocr_run_id
+    )
+    if after_page is not None:
+        query = query.where(PageText.page_number > after_page)
+    query = query.order_by(PageText.page_number)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def select_chunks(volume_id: int, ocr_run_id: Optional[int] = None,
+                  after_page: Optional[int] = None, after_chunk: Optional[int] = None,
+                  limit: Optional[int] = None) -> Select:
+    """Chunks тома по порядку (page_number, chunk_index), продолжение после (after_page, after_chunk)"""
+    query = select(*CHUNK_TEXT_COLUMNS, TextChunk.chunk_index).where(TextChunk.volume_id == volume_id)
+    if ocr_run_id:
+        query = query.where(TextChunk.ocr_run_id == ocr_run_id)
+    if after_page is not None:
+        if after_chunk is None:
+            query = query.where(TextChunk.page_number > after_page)
+        else:
+            query = query.where(or_(
+                TextChunk.page_number > after_page,
+                and_(TextChunk.page_number == after_page, TextChunk.chunk_index > after_chunk)
+            ))
+    query = query.order_by(TextChunk.page_number, TextChunk.chunk_index)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+async def count_pages(db: AsyncSession, volume_id: int, ocr_run_id: Optional[int]) -> int:
+    return await db.scalar(select(func.count(PageText.id)).where(
+        PageText.volume_id == volume_id,
+        PageText.ocr_run_id == ocr_run_id
+    ))
+
+
+async def count_chunks(db: AsyncSession, volume_id: int, ocr_run_id: Optional[int] = None) -> int:
+    query = select(func.count(TextChunk.id)).where(TextChunk.volume_id == volume_id)
+    if ocr_run_id:
+        query = query.where(TextChunk.ocr_run_id == ocr_run_id)
+    return await db.scalar(query)
+
+
+async def latest_completed_run_id(db: AsyncSession, volume_id: int) -> Optional[int]:
+    return await db.scalar(select(OcrRun.id).where(
+        OcrRun.volume_id == volume_id,
+        OcrRun.status == "completed"
+    ).order_by(OcrRun.id.desc()).limit(1))
+
+
+# ============================================================
+# ФОРМАТ ОТВЕТА
+# ============================================================
+
+def page_to_dict(row, include_word_boxes: bool = True) -> dict:
+    text = page_text_of(row)
+    page = {
+        "page_number": row.page_number,
+        "text": text,
+        "confidence": row.confidence
+    }
+    if include_word_boxes:
+        page["word_boxes"] = word_boxes_of(row, text)
+    return page
+
+
+def chunk_to_dict(row, text: str, preview: bool = True) -> dict:
+    """Chunk для ответа; text — восстановленный текст (chunk_texts_async)"""
+    if preview and len(text) > CHUNK_PREVIEW_CHARS:
+        text = text[:CHUNK_PREVIEW_CHARS] + "..."
+    return {
+        "id": row.id,
+        "page_number": row.page_number,
+        "page_end": row.page_end or row.page_number,
+        "chunk_index": row.chunk_index,
+        "text": text,
+        "char_start": row.char_start,
+        "char_end": row.char_end
+    }
+
+
+async def chunks_to_dicts(db: AsyncSession, rows, preview: bool = True) -> list:
+    texts = await chunk_texts_async(db, rows)
+    return [chunk_to_dict(row, texts[row.id], preview) for row in rows]
+
+
+def page_to_ndjson(row, include_word_boxes: bool = True) -> str:
+    """Строка NDJSON страницы; JSON word_boxes вставляется в строку готовым"""
+    text = page_text_of(row)
+    line = dumps({
+        "page_number": row.page_number,
+        "text": text,
+        "confidence": row.confidence
+    })
+    if include_word_boxes:
+        line = f'{line[:-1]},"word_boxes":{word_boxes_json_of(row, text)}}}'
+    return line + "\n"
+
+
+def chunk_to_ndjson(row, text: str) -> str:
+    return dumps(chunk_to_dict(row, text, preview=False)) + "\n"
+
+
+# ============================================================
+# ПОТОКОВАЯ ВЫДАЧА
+# ============================================================
+
+async def stream_ndjson(query: Select, to_line) -> AsyncIterator[str]:
+    """
+    Строки запроса в NDJSON через курсор БД.
+    Сессия своя: генератор работает после того, как endpoint уже вернул ответ.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield "".join(to_line(row) for row in rows)
+
+
+async def stream_chunks_ndjson(query: Select) -> AsyncIterator[str]:
+    """Chunks в NDJSON: текст порции курсора собирается из страниц той же сессией"""
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for rows in result.partitions():
+            texts = await chunk_texts_async(db, rows)
+            yield "".join(chunk_to_ndjson(row, texts[row.id]) for row in rows)
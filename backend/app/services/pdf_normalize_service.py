@@ -0,0 +1,114 @@
+"""
+Сервис нормализации PDF томов
+
+Сканерные PDF часто не оптимизированы: нет линеаризации, дублирующиеся объекты,
+несжатые потоки. Нормализация пишет копию с garbage collection, deflate и линеаризацией
+в PROCESSED_DIR/normalized/<ab>/<sha256>.pdf. Оригинал в хранилище не меняется
+(нужен как доказательство), просмотрщик и рендеринг используют копию.
+
+Экономия размера и времени открытия сохраняется в Volume.normalization (JSON).
+"""
+
+import os
+import json
+import time
+import uuid
+from typing import Optional
+
+import fitz  # PyMuPDF
+from sqlalchemy.orm import Session
+
+from app.models import Volume
+from app.services.storage_service import get_volume_file_path, ensure_volume_hash, normalized_path
+
+# ============================================================
+# НАСТРОЙКИ
+# ============================================================
+SAVE_OPTIONS = dict(garbage=4, deflate=True, deflate_images=True, deflate_fonts=True, clean=True)
+PROBE_ZOOM = 0.5  # рендер первой страницы для замера времени открытия
+
+
+def probe_load_ms(path: str) -> int:
+    """Время открытия PDF и рендера первой страницы (примерно как первая отрисовка в просмотрщике)"""
+    started = time.perf_counter()
+    doc = fitz.open(path)
+    try:
+        if len(doc):
+            doc.load_page(0).get_pixmap(matrix=fitz.Matrix(PROBE_ZOOM, PROBE_ZOOM))
+    finally:
+        doc.close()
+    return int((time.perf_counter() - started) * 1000)
+
+
+def write_normalized(src_path: str, dest_path: str) -> bool:
+    """
+    Записать нормализованную копию (атомарно). Возвращает True если удалось линеаризовать —
+    новые версии MuPDF линеаризацию не поддерживают, тогда копия пишется без неё.
+    """
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    tmp_path = f"{dest_path}.{uuid.uuid4().hex}.part"
+
+    doc = fitz.open(src_path)
+    try:
+        try:
+            doc.save(tmp_path, linear=True, **SAVE_OPTIONS)
+            linearized = True
+        except Exception as e:
+            print(f"[NORMALIZE] Линеаризация недоступна ({e}), сохраняем без неё")
+            doc.save(tmp_path, **SAVE_OPTIONS)
+            linearized = False
+    finally:
+        doc.close()
+
+    os.replace(tmp_path, dest_path)
+    return linearized
+
+
+def normalize_volume(db: Session, volume: Volume) -> Optional[dict]:
+    """
+    Нормализовать файл тома (блокирующий вызов). Копия общая для всех томов с тем же файлом.
+    Если копия не меньше оригинала и не линеаризована — она не нужна и удаляется.
+    """
+    src_path = get_volume_file_path(volume)
+    if not os.path.exists(src_path):
+        return None
+
+    file_hash = ensure_volume_hash(db, volume)
+    dest_path = normalized_path(file_hash)
+
+    started = time.perf_counter()
+    if os.path.exists(dest_path):
+        linearized = None  # копия уже сделана для другого тома
+    else:
+        linearized = write_normalized(src_path, dest_path)
+    duration_ms = int((time.perf_counter() - started) * 1000)
+
+    original_size = os.path.getsize(src_path)
+    normalized_size = os.path.getsize(dest_path)
+
+    kept = linearized is not False or normalized_size < original_size
+    if not kept:
+        os.remove(dest_path)
+
+    stats = {
+        "original_size": original_size,
+        "normalized_size": normalized_size,
+        "saved_bytes": original_size - normalized_size,
+        "saved_percent": round((original_size - normalized_size) / original_size * 100, 1) if original_size else 0,
+        "linearized": linearized,
+        "duration_ms": duration_ms,
+        "load_ms_original": probe_load_ms(src_path),
+        "load_ms_normalized": probe_load_ms(dest_path) if kept else None,
+        "used": kept
+    }
+
+    volume.normalization = json.dumps(stats)
+    db.commit()
+
+    print(f"[NORMALIZE] Том {volume.id}: {original_size} -> {normalized_size} байт за {duration_ms} мс"
+          f"{'' if kept else ' (копия не нужна, используется оригинал)'}")
+    return stats
+
+
+def get_normalization_stats(volume: Volume) -> Optional[dict]:
+    return json.loads(volume.normalization) if volume.normalization else None
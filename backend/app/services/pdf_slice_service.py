@@ -0,0 +1,115 @@
+"""
+Сервис вырезки документов из томов
+
+Документ тома (start_page..end_page) отдаётся отдельным PDF, собранным через insert_pdf.
+Готовые вырезки кешируются на диске по хешу файла тома и диапазону страниц:
+PROCESSED_DIR/slices/<sha256>/<start>-<end>.pdf — содержимое неизменно, поэтому
+ETag строится из тех же данных и проверяется до сборки вырезки.
+Кеш ограничен DOCUMENT_SLICE_CACHE_MAX_BYTES (LRU), вырезки тома удаляются
+вместе с его файлом (release_blob).
+"""
+
+import os
+import threading
+from typing import Tuple
+
+import fitz  # PyMuPDF
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import Document
+from app.services.page_image_service import DiskLRUCache
+from app.services.storage_service import get_volume_view_path, ensure_volume_hash
+
+
+class SliceError(Exception):
+    """Документ нельзя вырезать (нет файла, неверный диапазон страниц)"""
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> DiskLRUCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskLRUCache(
+                os.path.join(settings.PROCESSED_DIR, "slices"),
+                settings.DOCUMENT_SLICE_CACHE_MAX_BYTES
+            )
+        return _cache
+
+
+def slice_cache_key(file_hash: str, start_page: int, end_page: int) -> str:
+    return os.path.join(file_hash, f"{start_page}-{end_page}.pdf")
+
+
+def drop_slices(file_hash: str) -> int:
+    """Удалить все вырезки тома (файл тома удалён), возвращает сколько файлов удалено"""
+    return get_cache().discard_prefix(file_hash)
+
+
+def slice_etag(file_hash: str, start_page: int, end_page: int) -> str:
+    return f'"{file_hash[:32]}-{start_page}-{end_page}"'
+
+
+def build_slice(src_path: str, start_page: int, end_page: int) -> bytes:
+    """Собрать PDF из страниц start_page..end_page (нумерация с 1)"""
+    src = fitz.open(src_path)
+    try:
+        total_pages = len(src)
+        if start_page < 1 or start_page > total_pages:
+            raise SliceError(f"Страница {start_page} вне тома ({total_pages} стр.)")
+        end_page = min(end_page, total_pages)
+
+        out = fitz.open()
+        try:
+            out.insert_pdf(src, from_page=start_page - 1, to_page=end_page - 1)
+            return out.tobytes(garbage=3, deflate=True)
+        finally:
+            out.close()
+    finally:
+        src.close()
+
+
+def document_range(document: Document) -> Tuple[int, int]:
+    """Диапазон страниц документа в томе"""
+    if not document.start_page:
+        raise SliceError("У документа не определены страницы")
+    start_page = document.start_page
+    return start_page, max(document.end_page or start_page, start_page)
+
+
+def document_slice_etag(db: Session, document: Document) -> str:
+    """
+    ETag PDF документа: хеш файла тома и диапазон страниц, вырезка не собирается.
+    Блокирующий вызов (хеш может считаться при первом обращении).
+    """
+    volume = document.volume
+    start_page, end_page = document_range(document)
+    if not volume.file_hash and not os.path.exists(get_volume_view_path(volume)):
+        raise SliceError("Файл тома не найден на сервере")
+    return slice_etag(ensure_volume_hash(db, volume), start_page, end_page)
+
+
+def get_document_slice(db: Session, document: Document) -> str:
+    """
+    Путь к PDF документа. Из кеша, либо собирается и кладётся в кеш.
+    Блокирующий вызов — из async-кода через asyncio.to_thread.
+    """
+    volume = document.volume
+    src_path = get_volume_view_path(volume)
+    if not os.path.exists(src_path):
+        raise SliceError("Файл тома не найден на сервере")
+
+    start_page, end_page = document_range(document)
+    file_hash = ensure_volume_hash(db, volume)
+    cache = get_cache()
+    key = slice_cache_key(file_hash, start_page, end_page)
+
+    path = cache.get(key)
+    if path:
+        return path
+
+    return cache.put(key, build_slice(src_path, start_page, end_page))
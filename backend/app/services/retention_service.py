@@ -0,0 +1,356 @@
+"""
+Хранение старых запусков OCR и выделения документов (retention)
+
+Каждый повторный OCR добавляет полную копию текста тома (page_texts, text_chunks),
+каждое повторное выделение — новый набор документов. Политика: хранится текущий запуск
+и N предыдущих (RUN_RETENTION_PREVIOUS, для дела — Case.run_retention), остальные
+удаляются компактором в фоне.
+
+Удаление идёт порциями по RETENTION_BATCH_SIZE строк через db_writer: каждая порция —
+короткая транзакция, записи OCR между порциями не ждут. Выделения, по документам которых
+уже есть анализ или сущности, не удаляются.
+RETENTION_MODE=archive — перед удалением запуск выгружается в
+PROCESSED_DIR/archive/volume_<id>/<запуск>.ndjson.gz.
+
+После удаления (SQLite): освобождённые страницы возвращаются файлу через incremental_vacuum
+(база с auto_vacuum=INCREMENTAL) или полный VACUUM (RETENTION_VACUUM=full, блокирует базу),
+статистика планировщика обновляется выборочным ANALYZE. PostgreSQL: VACUUM (ANALYZE).
+"""
+
+import os
+import gzip
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.packing import page_text_of, word_boxes_of
+from app.core.responses import dumps
+from app.models import Case, Volume, OcrRun, PageText, TextChunk, ExtractionRun, Document, Entity, DocumentAnalysis
+from app.models.database import SessionLocal, engine, db_writer, IS_SQLITE
+from app.services import jobs, search_service
+
+# ============================================================
+# НАСТРОЙКИ
+# ============================================================
+INCREMENTAL_VACUUM_PAGES = 2000  # страниц файла за один шаг incremental_vacuum
+ANALYZE_LIMIT = 1000  # строк на индекс для выборочного ANALYZE (SQLite)
+COMPACTED_TABLES = ("page_texts", "text_chunks", "documents")
+
+# Последний отчёт компактора по делу (в памяти процесса)
+last_reports: Dict[int, dict] = {}
+
+
+def keep_previous(case: Case) -> int:
+    """Сколько предыдущих запусков хранить для дела"""
+    if case.run_retention is not None:
+        return case.run_retention
+    return settings.RUN_RETENTION_PREVIOUS
+
+
+# ============================================================
+# ВЫБОР ЗАПУСКОВ
+# ============================================================
+
+def superseded_ocr_runs(db, volume_id: int, keep: int) -> List[int]:
+    """
+    Запуски OCR тома сверх политики. Текущий — последний завершённый,
+    выполняющиеся не трогаются, из остальных хранятся keep самых новых.
+    """
+    runs = db.query(OcrRun.id, OcrRun.status).filter(
+        OcrRun.volume_id == volume_id
+    ).order_by(OcrRun.id.desc()).all()
+
+    current = next((run.id for run in runs if run.status == "completed"), None)
+    previous = [run.id for run in runs if run.id != current and run.status != "running"]
+    return previous[keep:]
+
+
+def superseded_extraction_runs(db, volume_id: int, keep: int) -> List[int]:
+    """Архивные выделения тома сверх политики, кроме тех, по документам которых есть анализ"""
+    runs = db.query(ExtractionRun.id).filter(
+        ExtractionRun.volume_id == volume_id,
+        ExtractionRun.is_current != 1
+    ).order_by(ExtractionRun.version.desc()).all()
+
+    prunable = []
+    for run in runs[keep:]:
+        documents = db.query(Document.id).filter(Document.extraction_run_id == run.id)
+        analyzed = db.query(Entity.id).filter(Entity.document_id.in_(documents)).first() or \
+            db.query(DocumentAnalysis.id).filter(DocumentAnalysis.document_id.in_(documents)).first()
+        if not analyzed:
+            prunable.append(run.id)
+    return prunable
+
+
+# ============================================================
+# АРХИВ
+# ============================================================
+
+def archive_path(volume_id: int, name: str) -> str:
+    return os.path.join(settings.PROCESSED_DIR, "archive", f"volume_{volume_id}", f"{name}.ndjson.gz")
+
+
+def write_archive(path: str, rows) -> int:
+    """Строки запуска в gzip NDJSON (временный файл и атомарное переименование)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + ".tmp"
+    with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+        for row in rows:
+            f.write(dumps(row) + "\n")
+    os.replace(temp_path, path)
+    return os.path.getsize(path)
+
+
+def archive_ocr_run(db, volume_id: int, run_id: int) -> int:
+    pages = db.query(
+        PageText.page_number, PageText.ocr_engine, PageText.text, PageText.text_zstd, PageText.confidence,
+        PageText.word_boxes, PageText.word_boxes_packed
+    ).filter(PageText.ocr_run_id == run_id).order_by(PageText.page_number).yield_per(500)
+    rows = (
+        {
+            "page_number": row.page_number,
+            "ocr_engine": row.ocr_engine,
+            "text": page_text_of(row),
+            "confidence": row.confidence,
+            "word_boxes": word_boxes_of(row)
+        }
+        for row in pages
+    )
+    return write_archive(archive_path(volume_id, f"ocr_run_{run_id}"), rows)
+
+
+def archive_extraction_run(db, volume_id: int, run_id: int) -> int:
+    documents = db.query(
+        Document.doc_type, Document.title, Document.start_page, Document.end_page,
+        Document.document_date, Document.author, Document.importance_score
+    ).filter(Document.extraction_run_id == run_id).order_by(Document.start_page).yield_per(500)
+    rows = ({**row._asdict(), "document_date": str(row.document_date) if row.document_date else None}
+            for row in documents)
+    return write_archive(archive_path(volume_id, f"extraction_run_{run_id}"), rows)
+
+
+# ============================================================
+# УДАЛЕНИЕ ПОРЦИЯМИ
+# ============================================================
+
+def delete_batch(session, model, run_column, run_id: int, limit: int) -> int:
+    """Удалить порцию строк запуска (через db_writer, commit делает писатель)"""
+    ids = [row.id for row in session.query(model.id).filter(run_column == run_id).limit(limit)]
+    if not ids:
+        return 0
+    if model is PageText:
+        search_service.remove_pages(session, ids)
+    session.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+    return len(ids)
+
+
+def delete_run_row(session, model, run_id: int):
+    session.query(model).filter(model.id == run_id).delete(synchronize_session=False)
+
+
+def delete_in_batches(model, run_column, run_id: int) -> int:
+    deleted = 0
+    while True:
+        count = db_writer.call(delete_batch, model, run_column, run_id, settings.RETENTION_BATCH_SIZE)
+        deleted += count
+        if count < settings.RETENTION_BATCH_SIZE:
+            return deleted
+
+
+def prune_ocr_run(volume_id: int, run_id: int) -> dict:
+    counts = {
+        "text_chunks": delete_in_batches(TextChunk, TextChunk.ocr_run_id, run_id),
+        "page_texts": delete_in_batches(PageText, PageText.ocr_run_id, run_id),
+    }
+    db_writer.call(delete_run_row, OcrRun, run_id)
+    return counts
+
+
+def prune_extraction_run(volume_id: int, run_id: int) -> dict:
+    counts = {"documents": delete_in_batches(Document, Document.extraction_run_id, run_id)}
+    db_writer.call(delete_run_row, ExtractionRun, run_id)
+    return counts
+
+
+# ============================================================
+# ОБСЛУЖИВАНИЕ ФАЙЛА БАЗЫ
+# ============================================================
+
+def sqlite_page_stats(connection) -> dict:
+    page_size = connection.exec_driver_sql("PRAGMA page_size").scalar()
+    return {
+        "page_size": page_size,
+        "page_count": connection.exec_driver_sql("PRAGMA page_count").scalar(),
+        "freelist_count": connection.exec_driver_sql("PRAGMA freelist_count").scalar(),
+    }
+
+
+def database_size() -> dict:
+    """Размер базы: SQLite — страницы файла, PostgreSQL — размер компактируемых таблиц"""
+    with engine.connect() as connection:
+        if IS_SQLITE:
+            stats = sqlite_page_stats(connection)
+            return {
+                "file_bytes": stats["page_count"] * stats["page_size"],
+                "free_bytes": stats["freelist_count"] * stats["page_size"],
+                "auto_vacuum": connection.exec_driver_sql("PRAGMA auto_vacuum").scalar(),
+            }
+        tables = ", ".join(f"pg_total_relation_size('{table}')" for table in COMPACTED_TABLES)
+        sizes = connection.exec_driver_sql(f"SELECT {tables}").one()
+        return {"file_bytes": sum(sizes), "free_bytes": None, "auto_vacuum": None}
+
+
+def incremental_vacuum():
+    """
+    Вернуть файлу свободные страницы порциями (каждая порция — короткая блокировка записи).
+    executescript, а не execute: модуль sqlite3 делает один шаг запроса, а шаг
+    incremental_vacuum освобождает одну страницу. Поэтому отдельное соединение, не писатель.
+    """
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        while True:
+            cursor.executescript(f"PRAGMA incremental_vacuum({INCREMENTAL_VACUUM_PAGES});")
+            if not cursor.execute("PRAGMA freelist_count").fetchone()[0]:
+                break
+        cursor.close()
+    finally:
+        connection.close()
+
+
+def analyze_tables(session):
+    session.execute(text(f"PRAGMA analysis_limit={ANALYZE_LIMIT}"))
+    for table in COMPACTED_TABLES:
+        session.execute(text(f"ANALYZE {table}"))
+
+
+def reclaim_space(size_before: dict) -> str:
+    """Освободить место после удаления, возвращает применённый способ"""
+    if not IS_SQLITE:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.exec_driver_sql(f"VACUUM (ANALYZE) {', '.join(COMPACTED_TABLES)}")
+        return "vacuum_analyze"
+
+    mode = settings.RETENTION_VACUUM
+    method = "none"
+    if mode == "full":
+        # Переписывает файл целиком: база заблокирована на всё время, но включается auto_vacuum
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            connection.exec_driver_sql("VACUUM")
+        method = "full"
+    elif mode == "incremental" and size_before["auto_vacuum"] == 2:
+        incremental_vacuum()
+        method = "incremental"
+
+    db_writer.call(analyze_tables)
+    return method
+
+
+# ============================================================
+# КОМПАКТОР
+# ============================================================
+
+def compact_volume(db, volume: Volume, keep: int, report: dict):
+    for run_id in superseded_ocr_runs(db, volume.id, keep):
+        if settings.RETENTION_MODE == "archive":
+            report["archived_bytes"] += archive_ocr_run(db, volume.id, run_id)
+        for table, count in prune_ocr_run(volume.id, run_id).items():
+            report["rows_deleted"][table] += count
+        report["ocr_runs_pruned"] += 1
+
+    for run_id in superseded_extraction_runs(db, volume.id, keep):
+        if settings.RETENTION_MODE == "archive":
+            report["archived_bytes"] += archive_extraction_run(db, volume.id, run_id)
+        for table, count in prune_extraction_run(volume.id, run_id).items():
+            report["rows_deleted"][table] += count
+        report["extraction_runs_pruned"] += 1
+
+
+def compact(case_id: Optional[int] = None, volume_id: Optional[int] = None) -> dict:
+    """
+    Удалить запуски сверх политики (в фоновом потоке).
+    Без аргументов — все дела, case_id — одно дело, volume_id — один том.
+    """
+    started = time.monotonic()
+    size_before = database_size()
+    report = {
+        "ocr_runs_pruned": 0,
+        "extraction_runs_pruned": 0,
+        "rows_deleted": {table: 0 for table in COMPACTED_TABLES},
+        "archived_bytes": 0,
+    }
+
+    db = SessionLocal()
+    try:
+        query = db.query(Volume, Case).join(Case, Case.id == Volume.case_id)
+        if case_id is not None:
+            query = query.filter(Volume.case_id == case_id)
+        if volume_id is not None:
+            query = query.filter(Volume.id == volume_id)
+        for volume, case in query.order_by(Volume.id).all():
+            compact_volume(db, volume, keep_previous(case), report)
+            db.expire_all()
+    finally:
+        db.close()
+
+    pruned = report["ocr_runs_pruned"] + report["extraction_runs_pruned"]
+    report["vacuum"] = reclaim_space(size_before) if pruned else "none"
+    size_after = database_size()
+
+    report.update({
+        "file_bytes_before": size_before["file_bytes"],
+        "file_bytes_after": size_after["file_bytes"],
+        # SQLite: удалённые данные — страницы, освобождённые удалением (до возврата файлу)
+        "bytes_reclaimed": max(size_before["file_bytes"] - size_after["file_bytes"], 0) + (
+            max(size_after["free_bytes"] - size_before["free_bytes"], 0) if IS_SQLITE else 0
+        ),
+        "seconds": round(time.monotonic() - started, 2),
+    })
+
+    if case_id is not None:
+        last_reports[case_id] = report
+    if pruned:
+        print(f"[RETENTION] Удалено запусков: OCR {report['ocr_runs_pruned']}, "
+              f"выделения {report['extraction_runs_pruned']}, строк {report['rows_deleted']}, "
+              f"освобождено {report['bytes_reclaimed'] // 1024} KB за {report['seconds']} с")
+    return report
+
+
+def preview_case(db, case: Case) -> dict:
+    """Что удалит компактор по текущей политике дела"""
+    keep = keep_previous(case)
+    volumes = []
+    for volume in db.query(Volume).filter(Volume.case_id == case.id).order_by(Volume.volume_number).all():
+        ocr_runs = superseded_ocr_runs(db, volume.id, keep)
+        extraction_runs = superseded_extraction_runs(db, volume.id, keep)
+        if ocr_runs or extraction_runs:
+            volumes.append({
+                "volume_id": volume.id,
+                "volume_number": volume.volume_number,
+                "ocr_runs": ocr_runs,
+                "extraction_runs": extraction_runs,
+                "page_texts": db.query(PageText.id).filter(PageText.ocr_run_id.in_(ocr_runs)).count() if ocr_runs else 0,
+            })
+    return {
+        "keep_previous": keep,
+        "case_override": case.run_retention is not None,
+        "mode": settings.RETENTION_MODE,
+        "pending": volumes,
+        "last_report": last_reports.get(case.id),
+    }
+
+
+def schedule_case(case_id: int):
+    return jobs.submit(f"retention:case:{case_id}", compact, case_id)
+
+
+def schedule_volume(volume_id: int):
+    """После нового запуска OCR или выделения — убрать вытесненные им запуски"""
+    return jobs.submit(f"retention:volume:{volume_id}", compact, None, volume_id)
+
+
+def schedule_all():
+    return jobs.submit("retention:all", compact)
@@ -0,0 +1,407 @@
+"""
+Полнотекстовый поиск по распознанному тексту страниц
+
+SQLite: FTS5-таблица page_search (rowid = page_texts.id). В неё пишутся основы слов
+(Snowball, русский) — "протокола", "протоколом" находятся по запросу "протокол".
+Колонка scope содержит метки дела и тома ("c12 v34"): фильтр по делу выполняется
+внутри FTS-индекса, а не перебором всех совпадений по базе.
+Индекс пополняется при записи каждой страницы OCR (index_page), существующие
+страницы индексируются фоновой задачей (schedule_backfill).
+
+PostgreSQL: GIN-индекс по to_tsvector('russian', text) на page_texts
+(миграция 0004), база поддерживает его сама.
+
+Фрагменты с подсветкой строятся одинаково для обеих баз — в Python по основам слов.
+"""
+
+import re
+import html
+import threading
+from functools import lru_cache
+from datetime import date
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import text, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.chunking import ABBREVIATIONS
+from app.core.packing import page_text_of
+from app.models import Volume, Document, ExtractionRun, PageText
+from app.models.database import IS_SQLITE, SessionLocal, db_writer
+from app.services import jobs
+
+try:
+    import snowballstemmer
+    HAS_STEMMER = True
+except ImportError:
+    HAS_STEMMER = False
+
+# ============================================================
+# НАСТРОЙКИ
+# ============================================================
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+MIN_TERM_LENGTH = 2  # более короткие слова запроса не ищутся, кроме чисел и сокращений с точкой
+MAX_QUERY_TERMS = 12
+SNIPPET_WORDS = 30  # слов во фрагменте
+BACKFILL_BATCH = 1000
+MAX_SEARCH_LIMIT = 100
+STEM_CACHE_SIZE = 200_000  # основы слов кешируются — фрагменты и индексация повторяют слова дела
+
+SEARCH_TABLE = "page_search"
+
+
+# Стеммер хранит состояние разбора слова — у каждого потока свой
+_local = threading.local()
+
+
+class InvalidSearchQueryError(ValueError):
+    pass
+
+
+# ============================================================
+# ТЕРМЫ
+# ============================================================
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem(word: str) -> str:
+    word = word.lower().replace("ё", "е")
+    if not HAS_STEMMER:
+        return word
+    stemmer = getattr(_local, "stemmer", None)
+    if stemmer is None:
+        stemmer = _local.stemmer = snowballstemmer.stemmer("russian")
+    return stemmer.stemWord(word)
+
+
+def text_terms(page_text: Optional[str]) -> str:
+    """Текст страницы -> основы слов через пробел (содержимое FTS-индекса)"""
+    return " ".join(stem(word) for word in WORD_RE.findall(page_text or ""))
+
+
+def is_query_term(query: str, match: re.Match, term: str) -> bool:
+    """
+    Короткие слова запроса — шум ("в", "с"), но числа и юридические сокращения
+    с точкой ("ст. 159 ч. 4", "п. 2") отличают одну норму от другой
+    """
+    if len(term) >= MIN_TERM_LENGTH or match.group().isdigit():
+        return True
+    return match.group().lower() in ABBREVIATIONS and query[match.end():match.end() + 1] == "."
+
+
+def query_terms(query: str) -> List[str]:
+    """Основы слов запроса без повторов, в порядке появления"""
+    terms = []
+    for match in WORD_RE.finditer(query):
+        term = stem(match.group())
+        if is_query_term(query, match, term) and term not in terms:
+            terms.append(term)
+    return terms[:MAX_QUERY_TERMS]
+
+
+def scope_terms(case_id: int, volume_id: int) -> str:
+    return f"c{case_id} v{volume_id}"
+
+
+def fts_match(terms: List[str], case_id: int, volume_id: Optional[int] = None, any_term: bool = False) -> str:
+    """
+    Выражение MATCH: основы слов запроса в пределах дела (индекс и запрос через один стеммер).
+    По умолчанию нужны все слова; any_term — хотя бы одно (ранжирует bm25).
+    """
+    scope = f'"c{case_id}"' + (f' AND "v{volume_id}"' if volume_id else "")
+    words = (" OR " if any_term else " AND ").join(f'"{term}"' for term in terms)
+    return f"scope : ({scope}) AND terms : ({words})"
+
+
+# ============================================================
+# ИНДЕКСАЦИЯ (SQLite)
+# ============================================================
+
+def index_page(session, page: PageText, case_id: Optional[int] = None):
+    """Добавить или обновить страницу в индексе (в транзакции вызывающего кода)"""
+    if not IS_SQLITE:
+        return
+    if page.id is None:
+        session.flush()
+    if case_id is None:
+        case_id = session.get(Volume, page.volume_id).case_id
+    session.execute(
+        text(f"INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, terms, scope) VALUES (:id, :terms, :scope)"),
+        {"id": page.id, "terms": text_terms(page_text_of(page)), "scope": scope_terms(case_id, page.volume_id)}
+    )
+
+
+def remove_volume(session, volume_id: int):
+    """Убрать из индекса все страницы тома (перед удалением тома)"""
+    if not IS_SQLITE:
+        return
+    session.execute(
+        text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN "
+             f"(SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match)"),
+        {"match": f'scope : "v{volume_id}"'}
+    )
+
+
+def remove_pages(session, page_ids: Iterable[int]):
+    if not IS_SQLITE:
+        return
+    page_ids = list(page_ids)
+    for start in range(0, len(page_ids), BACKFILL_BATCH):
+        batch = page_ids[start:start + BACKFILL_BATCH]
+        session.execute(
+            text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({','.join(str(int(i)) for i in batch)})")
+        )
+
+
+def index_missing_batch(session) -> int:
+    """Проиндексировать порцию страниц, которых ещё нет в индексе"""
+    rows = session.execute(text(
+        f"SELECT pt.id, pt.volume_id, pt.text, pt.text_zstd, v.case_id FROM page_texts pt "
+        f"JOIN volumes v ON v.id = pt.volume_id "
+        f"WHERE pt.id NOT IN (SELECT rowid FROM {SEARCH_TABLE}) "
+        f"ORDER BY pt.id LIMIT :limit"
+    ), {"limit": BACKFILL_BATCH}).all()
+
+    for row in rows:
+        session.execute(
+            text(f"INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, terms, scope) VALUES (:id, :terms, :scope)"),
+            {"id": row.id, "terms": text_terms(page_text_of(row)), "scope": scope_terms(row.case_id, row.volume_id)}
+        )
+    return len(rows)
+
+
+def backfill_search_index():
+    """Проиндексировать все страницы, записанные до появления поиска (фоновая задача)"""
+    total = 0
+    while True:
+        indexed = db_writer.call(index_missing_batch)
+        total += indexed
+        if indexed < BACKFILL_BATCH:
+            break
+    if total:
+        print(f"[SEARCH] Проиндексировано страниц: {total}")
+
+
+def schedule_backfill() -> bool:
+    """При старте: поставить индексацию, если есть страницы вне индекса"""
+    if not IS_SQLITE:
+        return False
+    db = SessionLocal()
+    try:
+        missing = db.execute(text(
+            f"SELECT 1 FROM page_texts WHERE id NOT IN (SELECT rowid FROM {SEARCH_TABLE}) LIMIT 1"
+        )).first()
+    finally:
+        db.close()
+    if not missing:
+        return False
+    return jobs.submit("search:backfill", backfill_search_index)
+
+
+# ============================================================
+# ПОИСК
+# ============================================================
+
+# Текущий запуск OCR тома — последний завершённый: пока идёт повторный OCR,
+# в поиске остаются страницы прежнего запуска (индекс ix_ocr_runs_volume_status)
+CURRENT_RUN_SQL = "SELECT MAX(r.id) FROM ocr_runs r WHERE r.volume_id = {volume_id} AND r.status = 'completed'"
+
+# Страницы текущего запуска OCR тома и старые страницы без запуска
+CURRENT_PAGE_FILTER = f"""
+    (pt.ocr_run_id IS NULL OR pt.ocr_run_id = ({CURRENT_RUN_SQL.format(volume_id="pt.volume_id")}))
+"""
+
+SQLITE_SEARCH_SQL = f"""
+    SELECT pt.id, pt.volume_id, v.volume_number, pt.page_number, pt.text, pt.text_zstd, bm25({SEARCH_TABLE}) AS score
+    FROM {SEARCH_TABLE}
+    JOIN page_texts pt ON pt.id = {SEARCH_TABLE}.rowid
+    JOIN volumes v ON v.id = pt.volume_id
+    WHERE {SEARCH_TABLE} MATCH :match AND {CURRENT_PAGE_FILTER} {{filters}}
+    ORDER BY score
+    LIMIT :limit OFFSET :offset
+"""
+
+SQLITE_COUNT_SQL = f"""
+    SELECT COUNT(*)
+    FROM {SEARCH_TABLE}
+    JOIN page_texts pt ON pt.id = {SEARCH_TABLE}.rowid
+    WHERE {SEARCH_TABLE} MATCH :match AND {CURRENT_PAGE_FILTER} {{filters}}
+"""
+
+# Выражение должно совпадать с индексом ix_page_texts_search (миграция 0004)
+PG_VECTOR = "to_tsvector('russian', coalesce(pt.text, ''))"
+
+PG_SEARCH_SQL = f"""
+    SELECT pt.id, pt.volume_id, v.volume_number, pt.page_number, pt.text, pt.text_zstd,
+           ts_rank({PG_VECTOR}, q) AS score
+    FROM page_texts pt
+    JOIN volumes v ON v.id = pt.volume_id,
+         websearch_to_tsquery('russian', :query) q
+    WHERE v.case_id = :case_id AND (CAST(:volume_id AS INTEGER) IS NULL OR pt.volume_id = :volume_id)
+      AND {PG_VECTOR} @@ q AND {CURRENT_PAGE_FILTER} {{filters}}
+    ORDER BY score DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+PG_COUNT_SQL = f"""
+    SELECT COUNT(*)
+    FROM page_texts pt
+    JOIN volumes v ON v.id = pt.volume_id,
+         websearch_to_tsquery('russian', :query) q
+    WHERE v.case_id = :case_id AND (CAST(:volume_id AS INTEGER) IS NULL OR pt.volume_id = :volume_id)
+      AND {PG_VECTOR} @@ q AND {CURRENT_PAGE_FILTER} {{filters}}
+"""
+
+
+def document_filter(volume_column: str, page_column: str, doc_types: Optional[List[str]] = None,
+                    date_from: Optional[date] = None, date_to: Optional[date] = None) -> Tuple[str, dict]:
+    """
+    Условие SQL (AND EXISTS ...): страница входит в документ текущего выделения
+    нужного типа и с датой в диапазоне. Без фильтров — пустая строка.
+    """
+    if not doc_types and date_from is None and date_to is None:
+        return "", {}
+    conditions, params = [], {}
+    if doc_types:
+        names = [f"doc_type_{i}" for i in range(len(doc_types))]
+        conditions.append(f"d.doc_type IN ({', '.join(':' + name for name in names)})")
+        params.update(zip(names, doc_types))
+    if date_from is not None:
+        conditions.append("d.document_date >= :date_from")
+        params["date_from"] = date_from
+    if date_to is not None:
+        conditions.append("d.document_date <= :date_to")
+        params["date_to"] = date_to
+    return f"""
+        AND EXISTS (
+            SELECT 1 FROM documents d JOIN extraction_runs er ON er.id = d.extraction_run_id
+            WHERE d.volume_id = {volume_column} AND er.is_current = 1
+              AND {page_column} BETWEEN d.start_page AND d.end_page
+              AND {" AND ".join(conditions)}
+        )
+    """, params
+
+
+def search_statements(case_id: int, query: str, terms: List[str], volume_id: Optional[int] = None,
+                      any_term: bool = False, filters: Tuple[str, dict] = ("", {})) -> Tuple[str, str, dict]:
+    """SQL поиска, SQL подсчёта и параметры для базы (any_term — хотя бы одно слово запроса)"""
+    filter_sql, filter_params = filters
+    if IS_SQLITE:
+        params = {"match": fts_match(terms, case_id, volume_id, any_term)}
+        search_sql, count_sql = SQLITE_SEARCH_SQL, SQLITE_COUNT_SQL
+    else:
+        words = WORD_RE.findall(query)
+        params = {"query": " or ".join(words) if any_term else query, "case_id": case_id, "volume_id": volume_id}
+        search_sql, count_sql = PG_SEARCH_SQL, PG_COUNT_SQL
+    return search_sql.format(filters=filter_sql), count_sql.format(filters=filter_sql), {**params, **filter_params}
+
+
+async def ranked_pages(db: AsyncSession, case_id: int, query: str, terms: List[str], volume_id: Optional[int] = None,
+                       limit: int = 20, any_term: bool = False, filters: Tuple[str, dict] = ("", {})) -> list:
+    """Лучшие страницы дела: строки (id, volume_id, volume_number, page_number, text, text_zstd, score)"""
+    search_sql, _, params = search_statements(case_id, query, terms, volume_id, any_term, filters)
+    return (await db.execute(text(search_sql), {**params, "limit": limit, "offset": 0})).all()
+
+
+def make_snippet(page_text: Optional[str], terms: List[str], width: int = SNIPPET_WORDS) -> str:
+    """
+    Фрагмент страницы с наибольшим числом совпадений, совпадения в <mark>.
+    Текст экранируется (HTML) — фрагмент можно вставлять в разметку.
+    """
+    page_text = page_text or ""
+    words = list(WORD_RE.finditer(page_text))
+    if not words:
+        return ""
+
+    terms = set(terms)
+    matched = [stem(w.group()) in terms for w in words]
+
+    # Окно из width слов с наибольшим числом совпадений
+    best_start, best_count, count = 0, -1, 0
+    for i in range(len(words)):
+        count += matched[i]
+        if i >= width:
+            count -= matched[i - width]
+        if i >= width - 1 or i == len(words) - 1:
+            if count > best_count:
+                best_start, best_count = max(0, i - width + 1), count
+
+    window = range(best_start, min(best_start + width, len(words)))
+    parts = []
+    position = words[window[0]].start()
+    for i in window:
+        word = words[i]
+        parts.append(html.escape(page_text[position:word.start()]))
+        token = html.escape(word.group())
+        parts.append(f"<mark>{token}</mark>" if matched[i] else token)
+        position = word.end()
+
+    snippet = "".join(parts).strip()
+    if window[0] > 0:
+        snippet = "… " + snippet
+    if window[-1] < len(words) - 1:
+        snippet += " …"
+    return " ".join(snippet.split())
+
+
+async def find_documents(db: AsyncSession, hits: list) -> dict:
+    """(volume_id, page_number) -> документ текущего выделения, в который попадает страница"""
+    volume_ids = {hit.volume_id for hit in hits}
+    if not volume_ids:
+        return {}
+
+    documents = (await db.execute(
+        select(Document.id, Document.volume_id, Document.title, Document.doc_type,
+               Document.start_page, Document.end_page)
+        .join(ExtractionRun, ExtractionRun.id == Document.extraction_run_id)
+        .where(Document.volume_id.in_(volume_ids), ExtractionRun.is_current == 1)
+    )).all()
+
+    found = {}
+    for hit in hits:
+        for doc in documents:
+            if doc.volume_id == hit.volume_id and (doc.start_page or 0) <= hit.page_number <= (doc.end_page or 0):
+                found[(hit.volume_id, hit.page_number)] = {
+                    "id": doc.id,
+                    "title": doc.title,
+                    "doc_type": doc.doc_type,
+                    "page_start": doc.start_page,
+                    "page_end": doc.end_page
+                }
+                break
+    return found
+
+
+async def search_case(db: AsyncSession, case_id: int, query: str, volume_id: Optional[int] = None,
+                      limit: int = 20, offset: int = 0) -> dict:
+    """Поиск по страницам дела: лучшие совпадения с фрагментами, томом, страницей и документом"""
+    terms = query_terms(query)
+    if not terms:
+        raise InvalidSearchQueryError("Пустой поисковый запрос")
+    if not 1 <= limit <= MAX_SEARCH_LIMIT:
+        raise InvalidSearchQueryError(f"limit должен быть от 1 до {MAX_SEARCH_LIMIT}")
+
+    search_sql, count_sql, params = search_statements(case_id, query, terms, volume_id)
+    hits = (await db.execute(text(search_sql), {**params, "limit": limit, "offset": offset})).all()
+    if len(hits) < limit and (hits or not offset):
+        total = offset + len(hits)  # последняя порция — считать отдельно не нужно
+    else:
+        total = await db.scalar(text(count_sql), params)
+    documents = await find_documents(db, hits)
+
+    return {
+        "query": query,
+        "terms": terms,
+        "total": total,
+        "results": [
+            {
+                "volume_id": hit.volume_id,
+                "volume_number": hit.volume_number,
+                "page_number": hit.page_number,
+                "page_text_id": hit.id,
+                "score": float(hit.score),
+                "snippet": make_snippet(page_text_of(hit), terms),
+                "document": documents.get((hit.volume_id, hit.page_number))
+            }
+            for hit in hits
+        ]
+    }
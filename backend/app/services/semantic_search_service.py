@@ -0,0 +1,97 @@
+"""
+Семантический поиск по chunks дела
+
+Запрос -> вектор (embedding_service) -> ближайшие chunks по матрице векторов дела
+(vector_store, индекс IVF — vector_index) -> том, страница, chunk и документ.
+Векторная часть выполняется в потоке: она блокирует только на CPU и mmap.
+"""
+
+import time
+import asyncio
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import TextChunk, Volume
+from app.services import embedding_service, vector_store, vector_index
+from app.services.chunking_service import CHUNK_TEXT_COLUMNS, chunk_texts_async
+from app.services.search_service import find_documents
+
+# ============================================================
+# НАСТРОЙКИ
+# ============================================================
+MAX_SEMANTIC_LIMIT = 100
+MAX_QUERY_LENGTH = 2000
+
+
+class InvalidSemanticQueryError(ValueError):
+    pass
+
+
+def nearest_chunks(case_id: int, query: str, limit: int, volume_ids: Optional[List[int]] = None,
+                   chunk_ids: Optional[List[int]] = None) -> Tuple[list, dict]:
+    """
+    [(chunk_id, score)] и сведения о поиске (модель, способ, число векторов дела).
+    chunk_ids — искать только среди этих chunks (точный перебор их строк матрицы).
+    """
+    backend = embedding_service.get_backend()
+    vector = embedding_service.embed_texts([query], backend)[0]
+    vectors = vector_store.open_case(case_id, backend.name, stale_ok=True)
+    if chunk_ids is not None:
+        hits, method = vectors.search_rows(vector, limit, vectors.rows_of(chunk_ids)), "exact"
+    else:
+        hits, method = vector_index.search(case_id, vectors, vector, limit, volume_ids)
+    return hits, {"model": backend.name, "method": method, "vectors": vectors.count}
+
+
+async def load_chunks(db: AsyncSession, chunk_ids: List[int]) -> Tuple[dict, dict]:
+    """id -> chunk с номером тома и id -> текст chunk"""
+    if not chunk_ids:
+        return {}, {}
+    rows = (await db.execute(
+        select(*CHUNK_TEXT_COLUMNS, TextChunk.volume_id, Volume.volume_number, TextChunk.chunk_index)
+        .join(Volume, Volume.id == TextChunk.volume_id)
+        .where(TextChunk.id.in_(chunk_ids))
+    )).all()
+    return {row.id: row for row in rows}, await chunk_texts_async(db, rows)
+
+
+async def search_case(db: AsyncSession, case_id: int, query: str, volume_id: Optional[int] = None,
+                      limit: int = 20) -> dict:
+    """Ближайшие по смыслу chunks дела с томом, страницей и документом"""
+    query = (query or "").strip()
+    if not query:
+        raise InvalidSemanticQueryError("Пустой поисковый запрос")
+    if len(query) > MAX_QUERY_LENGTH:
+        raise InvalidSemanticQueryError(f"Запрос длиннее {MAX_QUERY_LENGTH} символов")
+    if not 1 <= limit <= MAX_SEMANTIC_LIMIT:
+        raise InvalidSemanticQueryError(f"limit должен быть от 1 до {MAX_SEMANTIC_LIMIT}")
+
+    started = time.perf_counter()
+    hits, info = await asyncio.to_thread(
+        nearest_chunks, case_id, query, limit, [volume_id] if volume_id is not None else None
+    )
+    chunks, texts = await load_chunks(db, [chunk_id for chunk_id, _ in hits])
+    found = [(chunks[chunk_id], score) for chunk_id, score in hits if chunk_id in chunks]
+    documents = await find_documents(db, [chunk for chunk, _ in found])
+
+    return {
+        "query": query,
+        **info,
+        "took_ms": round((time.perf_counter() - started) * 1000, 1),
+        "results": [
+            {
+                "chunk_id": chunk.id,
+                "volume_id": chunk.volume_id,
+                "volume_number": chunk.volume_number,
+                "page_number": chunk.page_number,
+                "page_end": chunk.page_end or chunk.page_number,
+                "chunk_index": chunk.chunk_index,
+                "score": round(score, 4),
+                "text": texts[chunk.id],
+                "document": documents.get((chunk.volume_id, chunk.page_number))
+            }
+            for chunk, score in found
+        ]
+    }
@@ -0,0 +1,434 @@
+"""
+Сервис файлового хранилища томов
+Потоковая запись загрузок на диск: фиксированные чанки, SHA-256 и размер на лету,
+fsync временного файла и атомарное переименование.
+
+Файлы томов хранятся content-addressed: UPLOAD_DIR/blobs/ab/cd/<sha256>.pdf.
+Одинаковый PDF (повторная загрузка, том в нескольких делах) хранится один раз,
+тома ссылаются на FileBlob, файл удаляется когда ref_count падает до нуля.
+"""
+
+import os
+import uuid
+import shutil
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import FileBlob, Volume, UploadSession, OcrRun, PageText, ExtractionRun, Document
+from app.services import search_service
+
+# ============================================================
+# НАСТРОЙКИ
+# ============================================================
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB — память на одну загрузку не зависит от размера тома
+
+
+class FileTooLargeError(Exception):
+    """Файл превышает MAX_FILE_SIZE"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        super().__init__(f"Файл превышает максимальный размер {max_size // (1024 * 1024)} MB")
+
+
+def case_upload_dir(case_id: int) -> str:
+    """Директория загрузок дела"""
+    return os.path.join(settings.UPLOAD_DIR, f"case_{case_id}")
+
+
+def blob_dir() -> str:
+    """Корень content-addressed хранилища"""
+    return os.path.join(settings.UPLOAD_DIR, "blobs")
+
+
+def blob_path(sha256: str) -> str:
+    """Путь к файлу по его SHA-256 (двухуровневое разбиение, чтобы не было огромных директорий)"""
+    return os.path.join(blob_dir(), sha256[:2], sha256[2:4], f"{sha256}.pdf")
+
+
+def staging_path() -> str:
+    """Уникальный путь для файла, который ещё пишется (до того как известен хеш)"""
+    return os.path.join(blob_dir(), "staging", f"{uuid.uuid4().hex}.pdf")
+
+
+def partial_upload_path(upload_id: str) -> str:
+    """Недокачанные данные возобновляемой загрузки"""
+    return os.path.join(blob_dir(), "partial", f"{upload_id}.part")
+
+
+def normalized_path(sha256: str) -> str:
+    """Нормализованная копия файла (оригинал остаётся в хранилище без изменений)"""
+    return os.path.join(settings.PROCESSED_DIR, "normalized", sha256[:2], f"{sha256}.pdf")
+
+
+def get_volume_file_path(volume) -> str:
+    """Путь к PDF файлу тома на диске (оригинал)"""
+    if volume.blob is not None:
+        return volume.blob.storage_path
+    # Тома, загруженные до content-addressed хранилища
+    return os.path.join(case_upload_dir(volume.case_id), volume.file_name)
+
+
+def get_volume_view_path(volume) -> str:
+    """PDF для просмотра и рендеринга: нормализованная копия, если есть, иначе оригинал"""
+    if volume.file_hash:
+        path = normalized_path(volume.file_hash)
+        if os.path.exists(path):
+            return path
+    return get_volume_file_path(volume)
+
+
+def ensure_volume_hash(db: Session, volume: Volume) -> str:
+    """SHA-256 файла тома (для томов, загруженных до хранения хеша — считается и сохраняется)"""
+    if not volume.file_hash:
+        volume.file_hash = hash_file(get_volume_file_path(volume))
+        db.commit()
+    return volume.file_hash
+
+
+def _write_chunk(f, hasher, chunk: bytes):
+    f.write(chunk)
+    hasher.update(chunk)
+
+
+def _fsync_close(f):
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+
+
+def hash_file(path: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    """SHA-256 файла, читая его чанками (блокирующий вызов)"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+async def fsync_close(f):
+    """fsync и закрытие файла в потоке"""
+    await asyncio.to_thread(_fsync_close, f)
+
+
+async def save_stream(
+    chunks: AsyncIterator[bytes],
+    dest_path: str,
+    max_size: int = None
+) -> Tuple[int, str]:
+    """
+    Записать поток чанков в dest_path.
+    Пишет во временный файл рядом с целевым, делает fsync и атомарно переименовывает.
+    Возвращает (размер в байтах, SHA-256 hex). При превышении max_size бросает FileTooLargeError.
+    """
+    max_size = max_size or settings.MAX_FILE_SIZE
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    tmp_path = f"{dest_path}.{uuid.uuid4().hex}.part"
+
+    hasher = hashlib.sha256()
+    size = 0
+
+    f = await asyncio.to_thread(open, tmp_path, 'wb')
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            size += len(chunk)
+            if size > max_size:
+                raise FileTooLargeError(max_size)
+            # Запись и хеширование в потоке — event loop не блокируется
+            await asyncio.to_thread(_write_chunk, f, hasher, chunk)
+
+        await asyncio.to_thread(_fsync_close, f)
+        await asyncio.to_thread(os.replace, tmp_path, dest_path)
+
+    except BaseException:
+        if not f.closed:
+            f.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return size, hasher.hexdigest()
+
+
+async def iter_upload_file(upload, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Читать UploadFile фиксированными чанками"""
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def save_upload_file(upload, dest_path: str, max_size: int = None) -> Tuple[int, str]:
+    """Потоково сохранить UploadFile на диск, возвращает (размер, SHA-256)"""
+    return await save_stream(iter_upload_file(upload), dest_path, max_size=max_size)
+
+
+async def save_upload_to_staging(upload, max_size: int = None) -> Tuple[str, int, str]:
+    """Потоково сохранить UploadFile во временную зону хранилища, возвращает (путь, размер, SHA-256)"""
+    path = staging_path()
+    size, sha256 = await save_upload_file(upload, path, max_size=max_size)
+    return path, size, sha256
+
+
+# ============================================================
+# CONTENT-ADDRESSED ХРАНИЛИЩЕ
+# ============================================================
+
+def commit_blob(db: Session, staged_path: str, sha256: str, size: int) -> FileBlob:
+    """
+    Переместить файл из staging в хранилище и увеличить счётчик ссылок.
+    Если такой файл уже есть — временная копия удаляется.
+    Вызывать до добавления в сессию других объектов: при гонке делается rollback.
+    """
+    blob = db.query(FileBlob).filter(FileBlob.sha256 == sha256).first()
+
+    if blob is None:
+        final_path = blob_path(sha256)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(staged_path, final_path)
+
+        blob = FileBlob(sha256=sha256, size=size, storage_path=final_path, ref_count=0)
+        db.add(blob)
+        try:
+            db.flush()
+        except IntegrityError:
+            # Тот же файл параллельно загрузил другой запрос — используем его запись
+            db.rollback()
+            blob = db.query(FileBlob).filter(FileBlob.sha256 == sha256).first()
+    elif os.path.exists(staged_path):
+        os.remove(staged_path)
+
+    # Файл мог быть удалён вручную — восстанавливаем из новой загрузки
+    if not os.path.exists(blob.storage_path) and os.path.exists(staged_path):
+        os.makedirs(os.path.dirname(blob.storage_path), exist_ok=True)
+        os.replace(staged_path, blob.storage_path)
+
+    blob.ref_count = (blob.ref_count or 0) + 1
+    return blob
+
+
+def link_to_staging(path: str) -> str:
+    """
+    Файл в staging второй ссылкой (os.link; если не вышло — копия): исходный файл
+    остаётся на месте, пока перенос в хранилище (commit_blob) не зафиксирован
+    """
+    staged = staging_path()
+    os.makedirs(os.path.dirname(staged), exist_ok=True)
+    try:
+        os.link(path, staged)
+    except OSError:
+        shutil.copyfile(path, staged)
+    return staged
+
+
+def release_blob(db: Session, blob: FileBlob):
+    """Уменьшить счётчик ссылок, удалить файл и запись когда ссылок не осталось"""
+    from app.services.pdf_slice_service import drop_slices
+
+    blob.ref_count = max((blob.ref_count or 0) - 1, 0)
+    if blob.ref_count == 0:
+        for path in (blob.storage_path, normalized_path(blob.sha256)):
+            if os.path.exists(path):
+                os.remove(path)
+        drop_slices(blob.sha256)
+        db.delete(blob)
+
+
+def release_volume_file(db: Session, volume: Volume):
+    """Освободить файл тома перед удалением тома"""
+    if volume.blob is not None:
+        blob = volume.blob
+        volume.blob = None
+        release_blob(db, blob)
+        return
+
+    file_path = get_volume_file_path(volume)
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+
+def register_volume(
+    db: Session,
+    case_id: int,
+    blob: FileBlob,
+    file_name: str,
+    gdrive_file_id: str = None
+) -> Tuple[Volume, Optional[dict]]:
+    """
+    Создать том для файла из хранилища (следующий номер тома в деле).
+    Если тот же файл уже распознан в другом томе — копирует OCR и выделение документов.
+    Возвращает (том, статистика повторного использования или None). Коммит делает вызывающий.
+    """
+    max_volume = db.query(Volume).filter(Volume.case_id == case_id).order_by(Volume.volume_number.desc()).first()
+    next_volume_number = (max_volume.volume_number + 1) if max_volume else 1
+
+    volume = Volume(
+        case_id=case_id,
+        volume_number=next_volume_number,
+        blob=blob,
+        gdrive_file_id=gdrive_file_id,
+        file_name=file_name,
+        file_size=blob.size,
+        file_hash=blob.sha256,
+        processing_status="pending"
+    )
+    db.add(volume)
+    db.flush()
+
+    reused = reuse_processing_results(db, volume) if blob.ref_count > 1 else None
+    return volume, reused
+
+
+# ============================================================
+# ВОЗОБНОВЛЯЕМЫЕ ЗАГРУЗКИ
+# ============================================================
+
+def upload_session_expiry() -> datetime:
+    """Когда незавершённая загрузка будет удалена (продлевается при каждом чанке)"""
+    return datetime.utcnow() + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+
+
+def cleanup_expired_upload_sessions(db: Session) -> int:
+    """Удалить данные просроченных незавершённых загрузок, возвращает количество"""
+    expired = db.query(UploadSession).filter(
+        UploadSession.status == "active",
+        UploadSession.expires_at < datetime.utcnow()
+    ).all()
+
+    for upload in expired:
+        path = partial_upload_path(upload.id)
+        if os.path.exists(path):
+            os.remove(path)
+        upload.status = "expired"
+
+    if expired:
+        db.commit()
+        print(f"[STORAGE] Удалено просроченных загрузок: {len(expired)}")
+    return len(expired)
+
+
+# ============================================================
+# ПОВТОРНОЕ ИСПОЛЬЗОВАНИЕ РЕЗУЛЬТАТОВ ОБРАБОТКИ
+# ============================================================
+
+def find_donor_volume(db: Session, volume: Volume) -> Optional[Volume]:
+    """Другой том с тем же файлом, у которого уже есть завершённый OCR"""
+    if not volume.blob_id:
+        return None
+
+    return db.query(Volume).join(OcrRun, OcrRun.volume_id == Volume.id).filter(
+        Volume.blob_id == volume.blob_id,
+        Volume.id != volume.id,
+        OcrRun.status == 'completed'
+    ).order_by(OcrRun.id.desc()).first()
+
+
+def reuse_processing_results(db: Session, volume: Volume) -> dict:
+    """
+    Скопировать OCR и выделение документов с тома, у которого тот же файл.
+    Копируется последний завершённый OCR run со страницами и текущая версия выделения.
+    """
+    donor = find_donor_volume(db, volume)
+    if donor is None:
+        return {"reused_from_volume_id": None, "ocr_pages": 0, "documents": 0}
+
+    result = {"reused_from_volume_id": donor.id, "ocr_pages": 0, "documents": 0}
+
+    donor_run = db.query(OcrRun).filter(
+        OcrRun.volume_id == donor.id,
+        OcrRun.status == 'completed'
+    ).order_by(OcrRun.id.desc()).first()
+
+    new_run = OcrRun(
+        volume_id=volume.id,
+        engine=donor_run.engine,
+        model=donor_run.model,
+        pages_processed=donor_run.pages_processed,
+        pages_total=donor_run.pages_total,
+        status="completed",
+        avg_confidence=donor_run.avg_confidence,
+        started_at=datetime.utcnow(),
+        completed_at=datetime.utcnow()
+    )
+    db.add(new_run)
+    db.flush()
+
+    donor_pages = db.query(PageText).filter(
+        PageText.ocr_run_id == donor_run.id
+    ).order_by(PageText.page_number).all()
+
+    for page in donor_pages:
+        copy = PageText(
+            volume_id=volume.id,
+            ocr_run_id=new_run.id,
+            page_number=page.page_number,
+            ocr_engine=page.ocr_engine,
+            text=page.text,
+            text_zstd=page.text_zstd,
+            text_hash=page.text_hash,
+            confidence=page.confidence,
+            word_boxes=page.word_boxes,
+            word_boxes_packed=page.word_boxes_packed,
+            processed_at=page.processed_at
+        )
+        db.add(copy)
+        search_service.index_page(db, copy, case_id=volume.case_id)
+    result["ocr_pages"] = len(donor_pages)
+
+    donor_extraction = db.query(ExtractionRun).filter(
+        ExtractionRun.volume_id == donor.id,
+        ExtractionRun.is_current == 1
+    ).first()
+
+    if donor_extraction is not None:
+        new_extraction = ExtractionRun(
+            volume_id=volume.id,
+            version=1,
+            documents_count=donor_extraction.documents_count,
+            total_pages=donor_extraction.total_pages,
+            crop_ratio=donor_extraction.crop_ratio,
+            model_used=donor_extraction.model_used,
+            is_current=1
+        )
+        db.add(new_extraction)
+        db.flush()
+
+        donor_docs = db.query(Document).filter(
+            Document.extraction_run_id == donor_extraction.id
+        ).order_by(Document.start_page).all()
+
+        for doc in donor_docs:
+            db.add(Document(
+                case_id=volume.case_id,
+                volume_id=volume.id,
+                extraction_run_id=new_extraction.id,
+                doc_type=doc.doc_type,
+                title=doc.title,
+                start_page=doc.start_page,
+                end_page=doc.end_page,
+                document_date=doc.document_date,
+                author=doc.author,
+                importance_score=doc.importance_score
+            ))
+        result["documents"] = len(donor_docs)
+
+    volume.page_count = volume.page_count or donor.page_count or donor_run.pages_total
+    volume.ocr_quality = donor.ocr_quality
+    volume.processing_status = "ocr_completed"
+    volume.processed_at = datetime.utcnow()
+
+    print(f"[STORAGE] Том {volume.id}: результаты скопированы с тома {donor.id} "
+          f"({result['ocr_pages']} страниц, {result['documents']} документов)")
+    return result
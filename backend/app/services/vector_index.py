@@ -0,0 +1,267 @@
+"""
+Приближённый поиск ближайших векторов (IVF) по матрице дела
+
+Индекс строится по поколению матрицы (app.services.vector_store) и лежит рядом с ней, gen_<N>/ivf/:
+- centroids.f32 — центры списков (сферический k-means на выборке векторов);
+- offsets.i64, rows.i64 — границы списков и строки матрицы, сгруппированные по спискам;
+- codes.i8, scales.f32 — копия векторов в int8 (значение / масштаб строки) в порядке списков.
+
+Запрос: VECTOR_INDEX_NPROBE ближайших центров -> перебор их списков по int8-копии
+(непрерывные срезы файла) -> точный пересчёт лучших кандидатов по float32-матрице.
+Строки, дописанные в матрицу после сборки индекса, перебираются точно. Когда их больше
+VECTOR_INDEX_REBUILD_FRACTION от индекса или матрица пересобрана — индекс пересобирается
+в фоне (jobs), до готовности поиск идёт точным перебором.
+Дела меньше VECTOR_INDEX_MIN_VECTORS векторов всегда ищутся точным перебором.
+"""
+
+import os
+import json
+import math
+import time
+import shutil
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services import jobs, vector_store
+from app.services.vector_store import CaseVectors, SCAN_BLOCK_ROWS
+
+# ============================================================
+# НАСТРОЙКИ
+# ============================================================
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 40  # векторов выборки на один список
+MIN_LISTS = 16
+MAX_LISTS = 16384
+FILTERED_NPROBE_FACTOR = 2  # с фильтром по томам просматривается больше списков
+FILTERED_EXACT_MAX = 50000  # выбранные тома меньше — точный перебор только их строк
+
+_cache: Dict[int, "IvfIndex"] = {}
+_cache_lock = threading.Lock()
+
+
+def index_dir(case_id: int, generation: int) -> str:
+    return os.path.join(vector_store.generation_dir(case_id, generation), "ivf")
+
+
+def list_count(vectors: int) -> int:
+    return max(MIN_LISTS, min(MAX_LISTS, int(math.sqrt(vectors))))
+
+
+def quantize(block: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """float32-строки -> int8 и масштаб строки"""
+    scales = np.abs(block).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.rint(block / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+# ============================================================
+# СБОРКА
+# ============================================================
+
+def nearest_centroids(matrix, centroids: np.ndarray) -> np.ndarray:
+    """Номер ближайшего центра для каждой строки (по блокам)"""
+    assignment = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), SCAN_BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
+
+
+def train_centroids(vectors: CaseVectors, lists: int, rng: np.random.Generator) -> np.ndarray:
+    """Сферический k-means на случайной выборке строк матрицы"""
+    sample_size = min(vectors.count, lists * KMEANS_SAMPLE_PER_LIST)
+    sample_rows = np.sort(rng.choice(vectors.count, size=sample_size, replace=False))
+    sample = np.asarray(vectors.matrix[sample_rows], dtype=np.float32)
+
+    centroids = sample[rng.choice(sample_size, size=lists, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = nearest_centroids(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        counts = np.bincount(assignment, minlength=lists)
+        empty = counts == 0
+        # Пустой список получает случайную точку выборки
+        sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+def build_index(case_id: int, model: str) -> Optional[dict]:
+    """Собрать IVF-индекс по текущему поколению матрицы дела"""
+    vectors = vector_store.open_case(case_id, model)
+    if vectors.count < settings.VECTOR_INDEX_MIN_VECTORS:
+        return None
+
+    started = time.perf_counter()
+    generation = vectors.meta["generation"]
+    lists = list_count(vectors.count)
+    rng = np.random.default_rng(case_id)
+
+    centroids = train_centroids(vectors, lists, rng)
+    assignment = nearest_centroids(vectors.matrix, centroids)
+    rows = np.argsort(assignment, kind="stable").astype(np.int64)
+    offsets = np.zeros(lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignment, minlength=lists), out=offsets[1:])
+
+    directory = index_dir(case_id, generation)
+    temp_dir = directory + ".tmp"
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    centroids.tofile(os.path.join(temp_dir, "centroids.f32"))
+    offsets.tofile(os.path.join(temp_dir, "offsets.i64"))
+    rows.tofile(os.path.join(temp_dir, "rows.i64"))
+    with open(os.path.join(temp_dir, "codes.i8"), "wb") as codes_file, \
+            open(os.path.join(temp_dir, "scales.f32"), "wb") as scales_file:
+        for start in range(0, len(rows), SCAN_BLOCK_ROWS):
+            block_rows = rows[start:start + SCAN_BLOCK_ROWS]
+            # Строки читаются по возрастанию (последовательно по файлу), пишутся в порядке списков
+            read_order = np.argsort(block_rows)
+            block = np.empty((len(block_rows), vectors.dim), dtype=np.float32)
+            block[read_order] = vectors.matrix[block_rows[read_order]]
+            codes, scales = quantize(block)
+            codes_file.write(codes.tobytes())
+            scales_file.write(scales.tobytes())
+
+    meta = {
+        "generation": generation,
+        "count": vectors.count,
+        "dim": vectors.dim,
+        "lists": lists,
+        "seconds": round(time.perf_counter() - started, 2),
+        "built_at": time.time()
+    }
+    with open(os.path.join(temp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(temp_dir, directory)
+    with _cache_lock:
+        _cache.pop(case_id, None)
+    print(f"[VECTORS] Дело {case_id}: индекс IVF, {vectors.count} векторов, {lists} списков за {meta['seconds']} с")
+    return meta
+
+
+def refresh_case(case_id: int, model: str):
+    """Фоновое обновление: дописать матрицу и пересобрать индекс, если он устарел"""
+    vectors = vector_store.open_case(case_id, model)
+    if index_is_stale(case_id, vectors):
+        build_index(case_id, model)
+
+
+def schedule_refresh(case_id: int, model: str) -> bool:
+    return jobs.submit(f"vector-index:{case_id}", refresh_case, case_id, model) is not None
+
+
+# ============================================================
+# ПОИСК
+# ============================================================
+
+class IvfIndex:
+    """Индекс, открытый через mmap"""
+
+    def __init__(self, directory: str, meta: dict):
+        self.meta = meta
+        self.count = meta["count"]
+        self.dim = meta["dim"]
+        self.centroids = np.fromfile(os.path.join(directory, "centroids.f32"), dtype=np.float32).reshape(-1, self.dim)
+        self.offsets = np.fromfile(os.path.join(directory, "offsets.i64"), dtype=np.int64)
+        self.rows = np.memmap(os.path.join(directory, "rows.i64"), dtype=np.int64, mode="r", shape=(self.count,))
+        self.codes = np.memmap(os.path.join(directory, "codes.i8"), dtype=np.int8, mode="r", shape=(self.count, self.dim))
+        self.scales = np.memmap(os.path.join(directory, "scales.f32"), dtype=np.float32, mode="r", shape=(self.count,))
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Строки матрицы из nprobe ближайших списков и их приближённые оценки"""
+        nprobe = min(nprobe, len(self.centroids))
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        slices = [slice(self.offsets[i], self.offsets[i + 1]) for i in np.sort(probe)]
+        scores = np.concatenate([(self.codes[s].astype(np.float32) @ query) * self.scales[s] for s in slices])
+        rows = np.concatenate([self.rows[s] for s in slices])
+        return rows, scores
+
+
+def load_index(case_id: int, generation: int) -> Optional[IvfIndex]:
+    with _cache_lock:
+        cached = _cache.get(case_id)
+        if cached and cached.meta["generation"] == generation:
+            return cached
+        directory = index_dir(case_id, generation)
+        try:
+            with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        cached = _cache[case_id] = IvfIndex(directory, meta)
+        return cached
+
+
+def index_is_stale(case_id: int, vectors: CaseVectors) -> bool:
+    if vectors.count < settings.VECTOR_INDEX_MIN_VECTORS:
+        return False
+    index = load_index(case_id, vectors.meta["generation"])
+    if index is None:
+        return True
+    return vectors.count - index.count > index.count * settings.VECTOR_INDEX_REBUILD_FRACTION
+
+
+def exact_rows(vectors: CaseVectors, query: np.ndarray, rows: slice, volume_ids) -> Tuple[np.ndarray, np.ndarray]:
+    scores = vectors.scores(query, rows)
+    positions = np.arange(rows.start, rows.stop)
+    if volume_ids is not None:
+        keep = np.isin(vectors.volumes[rows], volume_ids)
+        return positions[keep], scores[keep]
+    return positions, scores
+
+
+def search(case_id: int, vectors: CaseVectors, query: np.ndarray, k: int,
+           volume_ids: Optional[Sequence[int]] = None) -> Tuple[List[Tuple[int, float]], str]:
+    """
+    k ближайших chunks: [(chunk_id, score)] и способ поиска ("ivf" или "exact").
+    Без готового индекса — точный перебор и фоновая сборка индекса.
+    """
+    query = np.asarray(query, dtype=np.float32).ravel()
+    index = None
+    if vectors.count >= settings.VECTOR_INDEX_MIN_VECTORS:
+        index = load_index(case_id, vectors.meta["generation"])
+        if index_is_stale(case_id, vectors):
+            schedule_refresh(case_id, vectors.meta["model"])
+    if index is None or query.size != index.dim:
+        return vectors.search(query, k, volume_ids), "exact"
+
+    subset = None
+    nprobe = settings.VECTOR_INDEX_NPROBE
+    if volume_ids is not None:
+        subset = np.flatnonzero(np.isin(vectors.volumes, volume_ids))
+        if len(subset) <= FILTERED_EXACT_MAX:
+            return vectors.search_rows(query, k, subset), "exact"
+        nprobe *= FILTERED_NPROBE_FACTOR
+
+    rows, approx = index.candidates(query, nprobe)
+    if volume_ids is not None:
+        keep = np.isin(vectors.volumes[rows], volume_ids)
+        rows, approx = rows[keep], approx[keep]
+
+    # Точный пересчёт лучших кандидатов по float32-матрице
+    rerank = max(k, settings.VECTOR_INDEX_RERANK)
+    if len(rows) > rerank:
+        top = np.argpartition(-approx, rerank - 1)[:rerank]
+        rows = rows[top]
+    rows = np.sort(rows)
+    scores = np.asarray(vectors.matrix[rows], dtype=np.float32) @ query
+
+    # Строки, дописанные после сборки индекса
+    if vectors.count > index.count:
+        tail_rows, tail_scores = exact_rows(vectors, query, slice(index.count, vectors.count), volume_ids)
+        rows = np.concatenate([rows, tail_rows])
+        scores = np.concatenate([scores, tail_scores])
+
+    if subset is not None and len(rows) < k:
+        return vectors.search_rows(query, k, subset), "exact"
+
+    order = np.argsort(-scores)[:k]
+    return [(int(vectors.ids[rows[i]]), float(scores[i])) for i in order], "ivf"
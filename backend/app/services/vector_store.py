@@ -0,0 +1,364 @@
+"""
+Матрица векторов дела на диске (memory-mapped)
+
+PROCESSED_DIR/vectors/case_<id>/
+  meta.json           — текущее поколение, модель, размерность, число строк, сверка с базой
+  gen_<N>/ids.i64     — id chunks по возрастанию
+  gen_<N>/volumes.i32 — том каждого chunk
+  gen_<N>/matrix      — векторы строками (VECTOR_MATRIX_DTYPE: float32 или float16)
+
+В матрицу попадают chunks текущего запуска OCR каждого тома с вектором текущей модели.
+Поиск — умножение блоков матрицы на вектор запроса прямо из mmap, без разбора строк.
+
+Сверка с базой: число и сумма id chunks (по индексу ix_text_chunks_run_model, строки
+таблицы не читаются). Если для id <= max_id они совпали — дописываются только новые
+chunks, иначе матрица пересобирается в новом поколении. meta.json заменяется атомарно,
+читатели старого поколения дочитывают свои mmap. Сверка — не чаще VECTOR_SYNC_INTERVAL
+секунд на дело, для поисковых запросов — в фоне; о пересчёте существующих векторов
+embedding_service сообщает сразу.
+"""
+
+import os
+import json
+import time
+import shutil
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import text, func
+
+from app.core.config import settings
+from app.core.packing import unpack_vector
+from app.models import TextChunk
+from app.models.database import SessionLocal
+from app.services import jobs
+from app.services.search_service import CURRENT_RUN_SQL
+
+# ============================================================
+# НАСТРОЙКИ
+# ============================================================
+SCAN_BLOCK_ROWS = 65536  # строк матрицы на одно умножение
+READ_BATCH = 2000  # chunks за одно чтение из базы при сборке
+WRITE_BLOCK = 4096  # строк на одну запись в файлы матрицы
+
+_cache: Dict[int, "CaseVectors"] = {}
+_checked: Dict[int, float] = {}
+_locks: Dict[int, threading.Lock] = defaultdict(threading.Lock)
+
+
+class VectorStoreError(RuntimeError):
+    pass
+
+
+# ============================================================
+# ФАЙЛЫ
+# ============================================================
+
+def case_dir(case_id: int) -> str:
+    return os.path.join(settings.PROCESSED_DIR, "vectors", f"case_{case_id}")
+
+
+def generation_dir(case_id: int, generation: int) -> str:
+    return os.path.join(case_dir(case_id), f"gen_{generation}")
+
+
+def read_meta(case_id: int) -> Optional[dict]:
+    try:
+        with open(os.path.join(case_dir(case_id), "meta.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_meta(case_id: int, meta: dict):
+    """Атомарная замена meta.json (временный файл и переименование)"""
+    path = os.path.join(case_dir(case_id), "meta.json")
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(temp_path, path)
+
+
+def matrix_dtype() -> np.dtype:
+    if settings.VECTOR_MATRIX_DTYPE not in ("float32", "float16"):
+        raise VectorStoreError(f"Неизвестный VECTOR_MATRIX_DTYPE: {settings.VECTOR_MATRIX_DTYPE}")
+    return np.dtype(settings.VECTOR_MATRIX_DTYPE)
+
+
+class MatrixWriter:
+    """Дописывает строки в файлы поколения (ids, volumes, matrix)"""
+
+    def __init__(self, directory: str, dtype: np.dtype, count: int = 0, dim: Optional[int] = None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.dtype = dtype
+        self.dim = dim
+        self.count = count
+        self.id_sum = 0
+        self.max_id = None
+        self._rows: List[Tuple[int, int, np.ndarray]] = []
+        # Хвост после прерванной записи (сверх meta.count) отбрасывается
+        self._truncate("ids.i64", 8)
+        self._truncate("volumes.i32", 4)
+        if dim:
+            self._truncate("matrix", dim * dtype.itemsize)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _truncate(self, name: str, row_size: int):
+        path = self._path(name)
+        if os.path.exists(path) and os.path.getsize(path) > self.count * row_size:
+            os.truncate(path, self.count * row_size)
+
+    def add(self, chunk_id: int, volume_id: int, vector: np.ndarray):
+        if self.dim is None:
+            self.dim = vector.size
+        elif vector.size != self.dim:
+            raise VectorStoreError(f"Chunk {chunk_id}: размерность {vector.size}, ожидалась {self.dim}")
+        self._rows.append((chunk_id, volume_id, vector))
+        if len(self._rows) >= WRITE_BLOCK:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        ids = np.array([row[0] for row in self._rows], dtype="<i8")
+        volumes = np.array([row[1] for row in self._rows], dtype="<i4")
+        matrix = np.stack([row[2] for row in self._rows]).astype(self.dtype.newbyteorder("<"))
+        for name, values in (("ids.i64", ids), ("volumes.i32", volumes), ("matrix", matrix)):
+            with open(self._path(name), "ab") as f:
+                f.write(values.tobytes())
+        self.count += len(ids)
+        self.id_sum += int(ids.sum())
+        self.max_id = int(ids[-1])
+        self._rows = []
+
+
+# ============================================================
+# СВЕРКА С БАЗОЙ
+# ============================================================
+
+def current_runs(db, case_id: int) -> List[int]:
+    """Текущий (последний завершённый, как в полнотекстовом поиске) запуск OCR каждого тома дела"""
+    rows = db.execute(text(f"""
+        SELECT ({CURRENT_RUN_SQL.format(volume_id="v.id")})
+        FROM volumes v WHERE v.case_id = :case_id
+    """), {"case_id": case_id}).scalars()
+    return [run_id for run_id in rows if run_id is not None]
+
+
+def chunk_filter(query, runs: Sequence[int], model: str):
+    return query.filter(TextChunk.ocr_run_id.in_(runs), TextChunk.embedding_model == model)
+
+
+def fingerprint(db, runs: Sequence[int], model: str, upto_id: Optional[int] = None) -> Tuple[int, int]:
+    """(число, сумма id) chunks с вектором модели — только по индексу"""
+    if not runs:
+        return 0, 0
+    query = chunk_filter(db.query(func.count(TextChunk.id), func.coalesce(func.sum(TextChunk.id), 0)), runs, model)
+    if upto_id is not None:
+        query = query.filter(TextChunk.id <= upto_id)
+    count, id_sum = query.one()
+    return int(count), int(id_sum)
+
+
+def write_chunks(db, writer: MatrixWriter, runs: Sequence[int], model: str, after_id: int = 0):
+    if not runs:
+        return
+    query = chunk_filter(
+        db.query(TextChunk.id, TextChunk.volume_id, TextChunk.embedding_packed), runs, model
+    ).filter(TextChunk.id > after_id, TextChunk.embedding_packed.isnot(None))
+    for row in query.order_by(TextChunk.id).yield_per(READ_BATCH):
+        writer.add(row.id, row.volume_id, unpack_vector(row.embedding_packed))
+    writer.flush()
+
+
+def rebuild(db, case_id: int, runs: Sequence[int], model: str, previous: Optional[dict]) -> dict:
+    """Собрать матрицу дела заново в новом поколении"""
+    started = time.perf_counter()
+    generation = (previous or {}).get("generation", 0) + 1
+    directory = generation_dir(case_id, generation)
+    shutil.rmtree(directory, ignore_errors=True)
+
+    writer = MatrixWriter(directory, matrix_dtype())
+    write_chunks(db, writer, runs, model)
+    meta = {
+        "generation": generation,
+        "model": model,
+        "dim": writer.dim,
+        "dtype": writer.dtype.name,
+        "count": writer.count,
+        "id_sum": writer.id_sum,
+        "max_id": writer.max_id,
+        "built_at": time.time()
+    }
+    write_meta(case_id, meta)
+
+    for name in os.listdir(case_dir(case_id)):
+        if name.startswith("gen_") and name != f"gen_{generation}":
+            shutil.rmtree(os.path.join(case_dir(case_id), name), ignore_errors=True)
+    print(f"[VECTORS] Дело {case_id}: матрица пересобрана, {writer.count} векторов за {time.perf_counter() - started:.2f} с")
+    return meta
+
+
+def append(db, case_id: int, runs: Sequence[int], model: str, meta: dict) -> dict:
+    """Дописать chunks с id > max_id в текущее поколение"""
+    writer = MatrixWriter(
+        generation_dir(case_id, meta["generation"]), np.dtype(meta["dtype"]), meta["count"], meta["dim"]
+    )
+    write_chunks(db, writer, runs, model, after_id=meta["max_id"] or 0)
+    if writer.count == meta["count"]:
+        return meta
+    meta = {
+        **meta,
+        "dim": writer.dim,
+        "count": writer.count,
+        "id_sum": meta["id_sum"] + writer.id_sum,
+        "max_id": writer.max_id
+    }
+    write_meta(case_id, meta)
+    return meta
+
+
+def sync(case_id: int, model: str) -> dict:
+    """Привести матрицу дела в соответствие с базой (дописать или пересобрать)"""
+    os.makedirs(case_dir(case_id), exist_ok=True)
+    db = SessionLocal()
+    try:
+        runs = current_runs(db, case_id)
+        meta = read_meta(case_id)
+        if meta and meta["model"] == model and not meta.get("stale") and \
+                os.path.isdir(generation_dir(case_id, meta["generation"])):
+            if meta["max_id"] is None or fingerprint(db, runs, model, meta["max_id"]) == (meta["count"], meta["id_sum"]):
+                return append(db, case_id, runs, model, meta)
+        return rebuild(db, case_id, runs, model, meta)
+    finally:
+        db.close()
+
+
+def embeddings_changed(case_id: int, min_chunk_id: int):
+    """
+    Векторы chunks с id >= min_chunk_id записаны заново (embedding_service).
+    Новые chunks матрица допишет сама, перезаписанные старые — только пересборкой.
+    """
+    meta = read_meta(case_id)
+    if meta and meta["max_id"] is not None and min_chunk_id <= meta["max_id"]:
+        write_meta(case_id, {**meta, "stale": True})
+    _checked.pop(case_id, None)
+
+
+def remove_case(case_id: int):
+    _cache.pop(case_id, None)
+    _checked.pop(case_id, None)
+    shutil.rmtree(case_dir(case_id), ignore_errors=True)
+
+
+# ============================================================
+# ПОИСК
+# ============================================================
+
+class CaseVectors:
+    """Поколение матрицы дела, открытое через mmap"""
+
+    def __init__(self, case_id: int, meta: dict):
+        self.meta = meta
+        self.count = meta["count"]
+        self.dim = meta["dim"]
+        directory = generation_dir(case_id, meta["generation"])
+        if self.count:
+            self.ids = np.memmap(os.path.join(directory, "ids.i64"), dtype="<i8", mode="r", shape=(self.count,))
+            self.volumes = np.memmap(os.path.join(directory, "volumes.i32"), dtype="<i4", mode="r", shape=(self.count,))
+            self.matrix = np.memmap(os.path.join(directory, "matrix"), dtype=np.dtype(meta["dtype"]).newbyteorder("<"),
+                                    mode="r", shape=(self.count, self.dim))
+        else:
+            self.ids = np.zeros(0, dtype=np.int64)
+            self.volumes = np.zeros(0, dtype=np.int32)
+            self.matrix = np.zeros((0, self.dim or 0), dtype=np.float32)
+
+    def key(self) -> tuple:
+        return self.meta["generation"], self.count
+
+    def scores(self, query: np.ndarray, rows: slice) -> np.ndarray:
+        block = self.matrix[rows]
+        if block.dtype != np.float32:
+            block = block.astype(np.float32)
+        return block @ query
+
+    def rows_of(self, chunk_ids: Sequence[int]) -> np.ndarray:
+        """Строки матрицы (по возрастанию) для chunks, которые в ней есть (ids в матрице упорядочены)"""
+        chunk_ids = np.unique(np.asarray(chunk_ids, dtype=np.int64))
+        rows = np.searchsorted(self.ids, chunk_ids)
+        rows = rows[rows < self.count]
+        return rows[np.asarray(self.ids[rows]) == chunk_ids[:len(rows)]] if len(rows) else rows
+
+    def search_rows(self, query: np.ndarray, k: int, rows: np.ndarray) -> List[Tuple[int, float]]:
+        """Точный поиск среди заданных строк матрицы (строки по возрастанию)"""
+        best_scores, best_rows = [], []
+        for start in range(0, len(rows), SCAN_BLOCK_ROWS):
+            block_rows = rows[start:start + SCAN_BLOCK_ROWS]
+            scores = np.asarray(self.matrix[block_rows], dtype=np.float32) @ query
+            top = np.argpartition(-scores, k)[:k] if scores.size > k else np.arange(scores.size)
+            best_scores.append(scores[top])
+            best_rows.append(block_rows[top])
+        if not best_scores:
+            return []
+        scores = np.concatenate(best_scores)
+        rows = np.concatenate(best_rows)
+        order = np.argsort(-scores)[:k]
+        return [(int(self.ids[rows[i]]), float(scores[i])) for i in order]
+
+    def search(self, query: np.ndarray, k: int, volume_ids: Optional[Sequence[int]] = None) -> List[Tuple[int, float]]:
+        """Точный поиск: k chunks с наибольшим скалярным произведением (векторы нормированы)"""
+        if not self.count or k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32).ravel()
+        if query.size != self.dim:
+            raise VectorStoreError(f"Размерность запроса {query.size}, у матрицы дела {self.dim}")
+
+        best_scores, best_rows = [], []
+        for start in range(0, self.count, SCAN_BLOCK_ROWS):
+            rows = slice(start, min(start + SCAN_BLOCK_ROWS, self.count))
+            scores = self.scores(query, rows)
+            if volume_ids is not None:
+                scores[~np.isin(self.volumes[rows], volume_ids)] = -np.inf
+            top = np.argpartition(-scores, k)[:k] if scores.size > k else np.arange(scores.size)
+            best_scores.append(scores[top])
+            best_rows.append(top + start)
+
+        scores = np.concatenate(best_scores)
+        rows = np.concatenate(best_rows)
+        order = np.argsort(-scores)[:k]
+        return [(int(self.ids[rows[i]]), float(scores[i])) for i in order if np.isfinite(scores[i])]
+
+
+def is_fresh(case_id: int, cached: Optional[CaseVectors], model: str) -> bool:
+    checked = _checked.get(case_id, float("-inf"))
+    return bool(cached) and cached.meta["model"] == model and \
+        time.monotonic() - checked < settings.VECTOR_SYNC_INTERVAL
+
+
+def open_case(case_id: int, model: str, stale_ok: bool = False) -> CaseVectors:
+    """
+    Матрица дела для поиска (сверка с базой не чаще VECTOR_SYNC_INTERVAL).
+    stale_ok — если матрица уже открыта, сверка уходит в фон, запрос её не ждёт.
+    """
+    cached = _cache.get(case_id)
+    if is_fresh(case_id, cached, model):
+        return cached
+    if stale_ok and cached and cached.meta["model"] == model:
+        jobs.submit(f"vector-sync:{case_id}", open_case, case_id, model)
+        return cached
+
+    with _locks[case_id]:
+        cached = _cache.get(case_id)
+        if is_fresh(case_id, cached, model):
+            return cached
+
+        meta = sync(case_id, model)
+        _checked[case_id] = time.monotonic()
+        if not cached or cached.key() != (meta["generation"], meta["count"]) or cached.meta["model"] != model:
+            cached = _cache[case_id] = CaseVectors(case_id, meta)
+        return cached
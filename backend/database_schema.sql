@@ -30,6 +30,7 @@ CREATE TABLE cases (
     initiation_date DATE,
     status VARCHAR(50) DEFAULT 'active',
     notes TEXT,
+    run_retention INTEGER, -- сколько предыдущих запусков OCR/выделения хранить (NULL — по умолчанию)
     created_at TIMESTAMP DEFAULT NOW(),
     updated_at TIMESTAMP DEFAULT NOW()
 );
@@ -38,15 +39,31 @@ CREATE INDEX idx_cases_user_id ON cases(user_id);
 CREATE INDEX idx_cases_case_number ON cases(case_number);
 CREATE INDEX idx_cases_status ON cases(status);
 
+-- Файлы томов (content-addressed по SHA-256)
+CREATE TABLE file_blobs (
+    id SERIAL PRIMARY KEY,
+    sha256 VARCHAR(64) UNIQUE NOT NULL,
+    size BIGINT NOT NULL,
+    storage_path VARCHAR(1000) NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
 -- Тома
 CREATE TABLE volumes (
     id SERIAL PRIMARY KEY,
     case_id INTEGER REFERENCES cases(id) ON DELETE CASCADE,
+    blob_id INTEGER REFERENCES file_blobs(id),
     volume_number INTEGER NOT NULL,
     gdrive_file_id VARCHAR(255),
+    gdrive_md5 VARCHAR(32),
+    gdrive_modified_time VARCHAR(40),
     file_name VARCHAR(500),
     file_size BIGINT,
+    file_hash VARCHAR(64),
     page_count INTEGER,
+    page_manifest TEXT,
+    normalization TEXT,
     ocr_quality INTEGER,
     processing_status VARCHAR(50) DEFAULT 'pending',
     created_at TIMESTAMP DEFAULT NOW(),
@@ -56,12 +73,50 @@ CREATE TABLE volumes (
 
 CREATE INDEX idx_volumes_case_id ON volumes(case_id);
 CREATE INDEX idx_volumes_processing_status ON volumes(processing_status);
+CREATE INDEX idx_volumes_file_hash ON volumes(file_hash);
+CREATE INDEX idx_volumes_blob_id ON volumes(blob_id);
+CREATE INDEX idx_volumes_gdrive_file_id ON volumes(gdrive_file_id);
+CREATE INDEX ix_volumes_case_number ON volumes(case_id, volume_number);
+
+-- Возобновляемые загрузки томов
+CREATE TABLE upload_sessions (
+    id VARCHAR(32) PRIMARY KEY,
+    case_id INTEGER REFERENCES cases(id) ON DELETE CASCADE,
+    file_name VARCHAR(500) NOT NULL,
+    total_size BIGINT NOT NULL,
+    committed_offset BIGINT NOT NULL DEFAULT 0,
+    status VARCHAR(20) DEFAULT 'active',
+    volume_id INTEGER REFERENCES volumes(id) ON DELETE SET NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW(),
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX idx_upload_sessions_case_id ON upload_sessions(case_id);
+CREATE INDEX idx_upload_sessions_expires_at ON upload_sessions(expires_at);
 
 -- Документы
+-- Версии выделения документов
+CREATE TABLE extraction_runs (
+    id SERIAL PRIMARY KEY,
+    volume_id INTEGER NOT NULL REFERENCES volumes(id) ON DELETE CASCADE,
+    version INTEGER NOT NULL DEFAULT 1,
+    documents_count INTEGER DEFAULT 0,
+    total_pages INTEGER DEFAULT 0,
+    crop_ratio VARCHAR(10) DEFAULT '0.9',
+    model_used VARCHAR(100),
+    is_current INTEGER DEFAULT 1,
+    created_at TIMESTAMP DEFAULT NOW(),
+    CONSTRAINT uq_extraction_runs_volume_version UNIQUE(volume_id, version)
+);
+
+CREATE INDEX ix_extraction_runs_volume_current ON extraction_runs(volume_id, is_current);
+
 CREATE TABLE documents (
     id SERIAL PRIMARY KEY,
     case_id INTEGER REFERENCES cases(id) ON DELETE CASCADE,
     volume_id INTEGER REFERENCES volumes(id) ON DELETE CASCADE,
+    extraction_run_id INTEGER REFERENCES extraction_runs(id) ON DELETE CASCADE,
     doc_type VARCHAR(100),
     title VARCHAR(1000) NOT NULL,
     start_page INTEGER,
@@ -80,10 +135,75 @@ CREATE INDEX idx_documents_volume_id ON documents(volume_id);
 CREATE INDEX idx_documents_doc_type ON documents(doc_type);
 CREATE INDEX idx_documents_analysis_status ON documents(analysis_status);
 CREATE INDEX idx_documents_document_date ON documents(document_date);
+CREATE INDEX ix_documents_run_start ON documents(extraction_run_id, start_page);
+CREATE INDEX ix_documents_volume_run_start ON documents(volume_id, extraction_run_id, start_page);
 
 -- Полнотекстовый поиск по документам
 CREATE INDEX idx_documents_full_text ON documents USING gin(to_tsvector('russian', full_text));
 
+-- Запуски OCR
+CREATE TABLE ocr_runs (
+    id SERIAL PRIMARY KEY,
+    volume_id INTEGER NOT NULL REFERENCES volumes(id) ON DELETE CASCADE,
+    engine VARCHAR(50) NOT NULL,
+    model VARCHAR(100),
+    pages_processed INTEGER DEFAULT 0,
+    pages_total INTEGER DEFAULT 0,
+    status VARCHAR(20) DEFAULT 'running',
+    avg_confidence INTEGER,
+    started_at TIMESTAMP DEFAULT NOW(),
+    completed_at TIMESTAMP,
+    owner VARCHAR(100), -- процесс, выполняющий запуск (хост:pid:токен)
+    heartbeat_at TIMESTAMP -- запись последней страницы
+);
+
+CREATE INDEX ix_ocr_runs_volume_status ON ocr_runs(volume_id, status, id);
+
+-- Распознанный текст страниц
+CREATE TABLE page_texts (
+    id SERIAL PRIMARY KEY,
+    volume_id INTEGER NOT NULL REFERENCES volumes(id) ON DELETE CASCADE,
+    ocr_run_id INTEGER REFERENCES ocr_runs(id) ON DELETE CASCADE,
+    page_number INTEGER NOT NULL,
+    ocr_engine VARCHAR(50) DEFAULT 'tesseract',
+    text TEXT,
+    text_zstd BYTEA, -- текст, сжатый zstd (только SQLite-режим, в PostgreSQL сжимает TOAST)
+    text_hash VARCHAR(32), -- хеш текста страницы (сравнение запусков OCR при векторизации)
+    confidence INTEGER,
+    word_boxes TEXT, -- JSON (старые записи)
+    word_boxes_packed BYTEA, -- координаты слов колонками (app/core/packing.py)
+    processed_at TIMESTAMP DEFAULT NOW(),
+    CONSTRAINT uq_page_texts_run_page UNIQUE(ocr_run_id, page_number)
+);
+
+CREATE INDEX ix_page_texts_volume_run_page ON page_texts(volume_id, ocr_run_id, page_number);
+CREATE INDEX ix_page_texts_volume_page ON page_texts(volume_id, page_number);
+CREATE INDEX ix_page_texts_search ON page_texts USING gin(to_tsvector('russian', coalesce(text, '')));
+
+-- Чанки текста для поиска
+CREATE TABLE text_chunks (
+    id SERIAL PRIMARY KEY,
+    ocr_run_id INTEGER NOT NULL REFERENCES ocr_runs(id) ON DELETE CASCADE,
+    volume_id INTEGER NOT NULL REFERENCES volumes(id) ON DELETE CASCADE,
+    page_number INTEGER NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    text TEXT,
+    page_end INTEGER,
+    char_start INTEGER,
+    char_end INTEGER,
+    text_hash VARCHAR(32),
+    embedding TEXT,
+    embedding_packed BYTEA,
+    embedding_model VARCHAR(100),
+    created_at TIMESTAMP DEFAULT NOW(),
+    CONSTRAINT uq_text_chunks_run_page_chunk UNIQUE(ocr_run_id, page_number, chunk_index)
+);
+
+CREATE INDEX ix_text_chunks_volume_run_page_chunk ON text_chunks(volume_id, ocr_run_id, page_number, chunk_index);
+CREATE INDEX ix_text_chunks_volume_page_chunk ON text_chunks(volume_id, page_number, chunk_index);
+CREATE INDEX ix_text_chunks_run_model ON text_chunks(ocr_run_id, embedding_model);
+CREATE INDEX ix_text_chunks_text_hash ON text_chunks(text_hash);
+
 -- Сущности (участники, даты, суммы)
 CREATE TABLE entities (
     id SERIAL PRIMARY KEY,
@@ -174,6 +294,7 @@ CREATE TRIGGER update_cases_updated_at BEFORE UPDATE ON cases
 -- Комментарии к таблицам
 COMMENT ON TABLE users IS 'Пользователи системы (адвокаты, юристы)';
 COMMENT ON TABLE cases IS 'Уголовные дела';
+COMMENT ON TABLE file_blobs IS 'Файлы томов, хранящиеся один раз по SHA-256';
 COMMENT ON TABLE volumes IS 'Тома дела';
 COMMENT ON TABLE documents IS 'Документы из томов';
 COMMENT ON TABLE entities IS 'Извлеченные сущности (участники, даты, суммы)';
@@ -0,0 +1,59 @@
+"""
+Общие фикстуры тестов
+
+База и каталоги файлов создаются во временном каталоге до импорта приложения:
+настройки (app.core.config) читаются из окружения один раз при импорте.
+"""
+
+import os
+import asyncio
+import tempfile
+
+TMP_DIR = tempfile.mkdtemp(prefix="starec-tests-")
+os.environ["SQLITE_PATH"] = os.path.join(TMP_DIR, "test.db")
+os.environ["UPLOAD_DIR"] = os.path.join(TMP_DIR, "uploads")
+os.environ["PROCESSED_DIR"] = os.path.join(TMP_DIR, "processed")
+os.environ["DEBUG"] = "false"
+
+import httpx
+import pytest
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "benchmark: замеры размера и латентности (отчёт печатается с -s, пропуск: -m 'not benchmark')"
+    )
+
+
+@pytest.fixture(scope="session")
+def app():
+    """Приложение FastAPI над временной базой с применёнными миграциями"""
+    from app.core.migrations import upgrade_database
+    from app.main import app
+    from app.services import jobs
+
+    upgrade_database()
+    yield app
+    jobs.shutdown()
+
+
+@pytest.fixture
+def run_client(app):
+    """
+    Выполнить сценарий с httpx-клиентом приложения: run_client(scenario), где scenario(client) — корутина.
+    asgi_app — другое приложение вместо основного (например, собранное в тесте).
+    Каждый сценарий — свой event loop, поэтому пул async_engine после него сбрасывается.
+    """
+    from app.models.database import async_engine
+
+    def run(scenario, asgi_app=None):
+        async def main():
+            try:
+                async with httpx.AsyncClient(app=asgi_app or app, base_url="http://test", timeout=120) as client:
+                    return await scenario(client)
+            finally:
+                await async_engine.dispose()
+
+        return asyncio.run(main())
+
+    return run
@@ -0,0 +1,114 @@
+"""
+Пропускная способность: async-эндпоинт (get_async_db) против синхронного (get_db в threadpool)
+
+Список дел со статистикой запрашивается конкурентными клиентами через настоящий
+обработчик cases.get_cases и через его синхронный двойник с тем же запросом.
+Оба должны отвечать одинаково; запросы/с и p95 печатаются (pytest -s).
+"""
+
+import asyncio
+import statistics
+import time
+
+import pytest
+from fastapi import Depends, FastAPI
+from sqlalchemy.orm import Session
+
+from app.api.v1 import cases
+from app.models import Case, Volume, OcrRun, PageText, get_db
+from app.models.database import SessionLocal
+from app.services.case_stats import cases_with_stats, stats_from_row
+
+pytestmark = pytest.mark.benchmark
+
+CASES = 50
+CLIENTS = 20
+REQUESTS = 150
+URL = f"?limit={CASES}"
+
+
+def sync_get_cases(limit: int = 100, db: Session = Depends(get_db)):
+    """Синхронный эндпоинт: FastAPI выполняет его в threadpool"""
+    rows = db.execute(cases_with_stats().order_by(Case.id).limit(limit)).all()
+    return [
+        {
+            "id": row.Case.id,
+            "case_number": row.Case.case_number,
+            "title": row.Case.title,
+            "article": row.Case.article,
+            "defendant_name": row.Case.defendant_name,
+            "status": row.Case.status,
+            **stats_from_row(row),
+            "created_at": row.Case.created_at.isoformat(),
+            "updated_at": row.Case.updated_at.isoformat()
+        }
+        for row in rows
+    ]
+
+
+@pytest.fixture(scope="module")
+def bench_app(app):
+    """Приложение только с двумя вариантами списка дел (без middleware основного)"""
+    db = SessionLocal()
+    try:
+        for i in range(CASES):
+            case = Case(user_id=1, case_number=f"bench-038-{i}", title="Пропускная способность")
+            db.add(case)
+            db.flush()
+            volume = Volume(case_id=case.id, volume_number=1, page_count=10)
+            db.add(volume)
+            db.flush()
+            ocr_run = OcrRun(volume_id=volume.id, engine="tesseract", pages_total=10, pages_processed=10,
+                             status="completed")
+            db.add(ocr_run)
+            db.flush()
+            db.add_all([PageText(volume_id=volume.id, ocr_run_id=ocr_run.id, page_number=page, text="текст")
+                        for page in range(1, 11)])
+        db.commit()
+    finally:
+        db.close()
+
+    bench = FastAPI()
+    bench.include_router(cases.router, prefix="/async")
+    bench.add_api_route("/sync/", sync_get_cases)
+    return bench
+
+
+async def hammer(client, url: str) -> tuple:
+    """REQUESTS запросов от CLIENTS конкурентных клиентов -> (запросов/с, p95, последний ответ)"""
+    latencies = []
+    responses = []
+    queue = asyncio.Queue()
+    for _ in range(REQUESTS):
+        queue.put_nowait(url)
+
+    async def client_loop():
+        while not queue.empty():
+            next_url = queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.get(next_url)
+            latencies.append(time.perf_counter() - started)
+            responses.append(response)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client_loop() for _ in range(CLIENTS)])
+    elapsed = time.perf_counter() - started
+    assert len(responses) == REQUESTS
+    assert all(response.status_code == 200 for response in responses)
+    return REQUESTS / elapsed, statistics.quantiles(latencies, n=20)[18], responses[-1].json()
+
+
+def test_async_vs_sync_case_list(run_client, bench_app):
+    async def scenario(client):
+        await client.get(f"/async/{URL}")
+        await client.get(f"/sync/{URL}")
+        return {variant: await hammer(client, f"/{variant}/{URL}") for variant in ("async", "sync")}
+
+    results = run_client(scenario, bench_app)
+
+    assert results["async"][2] == results["sync"][2]
+    assert len(results["async"][2]) >= CASES
+    print()
+    for variant, (throughput, p95, _) in results.items():
+        print(f"{variant:5} get_cases: {throughput:6.0f} запросов/с, p95 {p95 * 1000:6.1f} ms "
+              f"({CLIENTS} клиентов, {REQUESTS} запросов)")
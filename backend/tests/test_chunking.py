@@ -0,0 +1,97 @@
+"""
+Разбиение текста тома на chunks (app.core.chunking)
+"""
+
+import random
+
+import pytest
+
+from app.core.chunking import WORD_RE, chunk_pages, chunk_text, rechunk_spans, span_of, split_sentences
+
+WORDS = "протокол допроса свидетеля ст. 159 ч. 4 УК РФ т.е. г. Москва И. И. Иванов деньги карта перевод".split()
+
+
+def random_sentence(rnd: random.Random) -> str:
+    if rnd.random() < 0.2:
+        # без знаков конца: длинные предложения режутся по словам
+        return " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(5, 250)))
+    words = [rnd.choice(WORDS) for _ in range(rnd.randint(3, 25))]
+    words[0] = words[0].capitalize()
+    return " ".join(words) + rnd.choice([".", ".", "!", "?", ""])
+
+
+def random_page(rnd: random.Random) -> str:
+    if rnd.random() < 0.05:
+        return ""
+    parts = []
+    for _ in range(rnd.randint(1, 12)):
+        parts.append(random_sentence(rnd))
+        parts.append(rnd.choice([" ", " ", " ", "\n", "\n\n"]))
+    return "".join(parts).strip()
+
+
+def edit(rnd: random.Random, pages: dict) -> dict:
+    """Изменить от 1 до N/4 страниц: заменить, обрезать, дописать; иногда добавить или убрать последнюю"""
+    edited = dict(pages)
+    for _ in range(rnd.randint(1, max(1, len(pages) // 4))):
+        number = rnd.choice(list(edited))
+        action = rnd.random()
+        if action < 0.7:
+            edited[number] = random_page(rnd)
+        elif action < 0.85:
+            edited[number] = edited[number][:rnd.randint(0, len(edited[number]))]
+        else:
+            edited[number] += " " + random_sentence(rnd)
+    if rnd.random() < 0.2:
+        edited[max(edited) + 1] = random_page(rnd)
+    if rnd.random() < 0.1 and len(edited) > 2:
+        del edited[max(edited)]
+    return edited
+
+
+@pytest.mark.parametrize("budget", [(200, 60, 40), (30, 10, 8), (12, 0, 5)])
+@pytest.mark.parametrize("seed", range(5))
+def test_incremental_rechunk_matches_full(seed, budget):
+    rnd = random.Random(seed)
+    for _ in range(40):
+        old = {number: random_page(rnd) for number in range(1, rnd.randint(2, 40) + 1)}
+        new = edit(rnd, old)
+        changed = sorted(number for number in set(old) | set(new) if old.get(number) != new.get(number))
+
+        spans = [span_of(chunk) for chunk in chunk_pages(sorted(old.items()), *budget)]
+        kept, created = rechunk_spans(
+            spans, changed, sorted(new), lambda numbers: {number: new[number] for number in numbers}, *budget
+        )
+        incremental = sorted([spans[i] for i in kept] + [span_of(chunk) for chunk in created])
+        full = [span_of(chunk) for chunk in chunk_pages(sorted(new.items()), *budget)]
+        assert incremental == full, f"changed pages {changed}"
+
+
+def test_unchanged_text_is_not_rechunked():
+    rnd = random.Random(1)
+    pages = {number: random_page(rnd) for number in range(1, 30)}
+    spans = [span_of(chunk) for chunk in chunk_pages(sorted(pages.items()), 30, 10, 8)]
+    kept, created = rechunk_spans(spans, [], sorted(pages), lambda numbers: {}, 30, 10, 8)
+    assert kept == list(range(len(spans)))
+    assert created == []
+
+
+def test_sentence_continues_on_next_page():
+    pages = {
+        1: "Свидетель пояснил, что деньги были",
+        2: "переведены на карту. Далее он ушёл."
+    }
+    chunks = chunk_pages(sorted(pages.items()), 8)
+    assert [span_of(chunk) for chunk in chunks] == [(1, 0, 2, 20), (2, 21, 2, 35)]
+    assert chunk_text(pages, *span_of(chunks[0])) == "Свидетель пояснил, что деньги были\nпереведены на карту."
+
+
+def test_abbreviations_and_initials_do_not_end_sentence():
+    text = ("Обвиняется по ст. 159 ч. 4 УК РФ, т.е. мошенничество в г. Москве. "
+            "Допрошен И. И. Иванов. Изъято 2 шт. Карты переданы.")
+    word_starts = [match.start() for match in WORD_RE.finditer(text)]
+    assert [text[s.start:s.end] for s in split_sentences(text, word_starts)] == [
+        "Обвиняется по ст. 159 ч. 4 УК РФ, т.е. мошенничество в г. Москве.",
+        "Допрошен И. И. Иванов.",
+        "Изъято 2 шт. Карты переданы."
+    ]
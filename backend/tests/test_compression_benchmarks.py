@@ -0,0 +1,124 @@
+"""
+Сжатие больших JSON-ответов (app.core.compression): orjson без сжатия против gzip и br
+
+Текст всех страниц, chunks и результаты выделения документов запрашиваются
+с разным Accept-Encoding. Сжатый ответ должен раскодироваться в тот же JSON
+и быть заметно меньше; размеры и латентность печатаются (pytest -s).
+"""
+
+import random
+import statistics
+import time
+
+import pytest
+
+from app.core.compression import HAS_BROTLI
+from app.models import Case, Volume, OcrRun, ExtractionRun, Document
+from app.models.database import SessionLocal, db_writer
+from app.services.chunking_service import rechunk_run
+from app.services.ingest_service import save_page_text
+
+pytestmark = pytest.mark.benchmark
+
+PAGES = 300
+DOCUMENTS = 400
+REPEATS = 5
+VOCAB = ("протокол допроса свидетеля потерпевшего обвиняемого постановление уголовного дела "
+         "следователь показал года статья УК РФ денежные средства банковская карта перевод").split()
+
+
+def random_page(rnd: random.Random) -> str:
+    sentences = [" ".join(rnd.choice(VOCAB) for _ in range(rnd.randint(6, 18))).capitalize() + "."
+                 for _ in range(rnd.randint(20, 40))]
+    return " ".join(sentences)
+
+
+def word_boxes(text: str) -> list:
+    return [
+        {"text": word, "left": 100 + (i % 12) * 120, "top": 150 + (i // 12) * 40, "width": 110, "height": 30, "conf": 90}
+        for i, word in enumerate(text.split())
+    ]
+
+
+@pytest.fixture(scope="module")
+def volume(app):
+    """Том с завершённым OCR, chunks и текущим выделением документов"""
+    rnd = random.Random(40)
+    db = SessionLocal()
+    try:
+        case = Case(user_id=1, case_number="bench-040", title="Сжатие ответов")
+        db.add(case)
+        db.flush()
+        volume = Volume(case_id=case.id, volume_number=1, page_count=PAGES, file_name="bench.pdf")
+        db.add(volume)
+        db.flush()
+        ocr_run = OcrRun(volume_id=volume.id, engine="tesseract", pages_total=PAGES, status="running")
+        db.add(ocr_run)
+        db.commit()
+        case_id, volume_id, ocr_run_id = case.id, volume.id, ocr_run.id
+
+        futures = []
+        for page_number in range(1, PAGES + 1):
+            text = random_page(rnd)
+            futures.append(db_writer.submit(save_page_text, ocr_run_id, volume_id, page_number,
+                                            text, 90, "tesseract", word_boxes(text)))
+        for future in futures:
+            future.result()
+
+        db.query(OcrRun).filter(OcrRun.id == ocr_run_id).update({"status": "completed"})
+        rechunk_run(db, volume_id, ocr_run_id, full=True)
+
+        extraction_run = ExtractionRun(volume_id=volume_id, version=1, documents_count=DOCUMENTS,
+                                       total_pages=PAGES, is_current=1)
+        db.add(extraction_run)
+        db.flush()
+        for i in range(DOCUMENTS):
+            db.add(Document(case_id=case_id, volume_id=volume_id, extraction_run_id=extraction_run.id,
+                            doc_type=rnd.choice(["Протокол", "Постановление", "Заключение эксперта"]),
+                            title=f"{random_page(rnd)[:200]}", start_page=i + 1, end_page=i + 1))
+        db.commit()
+    finally:
+        db.close()
+    return case_id, volume_id
+
+
+ENDPOINTS = ["all-pages-text", "all-pages-text?include_word_boxes=false", "chunks", "documents"]
+ENCODINGS = ["gzip", pytest.param("br", marks=pytest.mark.skipif(not HAS_BROTLI, reason="brotli не установлен"))]
+
+
+async def fetch(client, url: str, encoding: str):
+    """Ответ и медианная латентность REPEATS запросов"""
+    latencies = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        response = await client.get(url, headers={"Accept-Encoding": encoding})
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.text
+    return response, statistics.median(latencies)
+
+
+def wire_size(response) -> int:
+    """Размер тела на проводе (httpx отдаёт content уже раскодированным)"""
+    return int(response.headers["content-length"])
+
+
+@pytest.mark.parametrize("endpoint", ENDPOINTS)
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_compressed_payload_is_smaller(run_client, volume, endpoint, encoding):
+    case_id, volume_id = volume
+    url = f"/api/v1/cases/{case_id}/volumes/{volume_id}/{endpoint}"
+
+    async def scenario(client):
+        return await fetch(client, url, "identity"), await fetch(client, url, encoding)
+
+    (plain, plain_latency), (packed, packed_latency) = run_client(scenario)
+
+    assert "content-encoding" not in plain.headers
+    assert packed.headers["content-encoding"] == encoding
+    assert packed.json() == plain.json()
+    # Текст и координаты слов сжимаются минимум вдвое
+    assert wire_size(packed) * 2 < wire_size(plain)
+
+    print(f"\n{endpoint:45} orjson {wire_size(plain) / 1e3:8.0f} KB {plain_latency * 1000:6.1f} ms | "
+          f"{encoding:4} {wire_size(packed) / 1e3:8.0f} KB {packed_latency * 1000:6.1f} ms "
+          f"(x{wire_size(plain) / wire_size(packed):.1f})")
@@ -0,0 +1,192 @@
+"""
+Нагрузка на SQLite: параллельные потоки OCR через DatabaseWriter и конкурентные читатели
+
+Страницы пишутся как при фоновом OCR (save_page_text через db_writer), читатели
+в это время считают страницы отдельными сессиями. Проверяется профиль WAL,
+отсутствие ошибок блокировки и потерянных строк, в том числе при пакетной записи
+с повтором по одной после сбоя коммита.
+"""
+
+import threading
+import time
+
+import pytest
+from sqlalchemy import func, select, text
+
+from app.models import Case, Volume, OcrRun, PageText
+from app.models.database import DatabaseWriter, SessionLocal, db_writer
+from app.services.ingest_service import save_page_text
+
+pytestmark = pytest.mark.benchmark
+
+OCR_STREAMS = 6
+PAGES = 100
+READERS = 4
+
+
+def create_runs(count: int, case_number: str) -> list:
+    """count томов с запущенным OCR -> [(ocr_run_id, volume_id)]"""
+    db = SessionLocal()
+    try:
+        case = Case(user_id=1, case_number=case_number, title="Нагрузка на запись")
+        db.add(case)
+        db.flush()
+        runs = []
+        for number in range(1, count + 1):
+            volume = Volume(case_id=case.id, volume_number=number, page_count=PAGES)
+            db.add(volume)
+            db.flush()
+            ocr_run = OcrRun(volume_id=volume.id, engine="tesseract", pages_total=PAGES, status="running")
+            db.add(ocr_run)
+            db.flush()
+            runs.append((ocr_run.id, volume.id))
+        db.commit()
+        return runs
+    finally:
+        db.close()
+
+
+def select_count(volume_ids: list):
+    return select(func.count(PageText.id)).where(PageText.volume_id.in_(volume_ids))
+
+
+def page_count(volume_ids: list) -> int:
+    db = SessionLocal()
+    try:
+        return db.scalar(select_count(volume_ids))
+    finally:
+        db.close()
+
+
+def test_wal_profile(app):
+    db = SessionLocal()
+    try:
+        assert db.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert db.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert db.execute(text("PRAGMA busy_timeout")).scalar() > 0
+    finally:
+        db.close()
+    assert isinstance(db_writer, DatabaseWriter)
+
+
+def test_parallel_ocr_streams_with_readers(app):
+    runs = create_runs(OCR_STREAMS, "load-037")
+    volume_ids = [volume_id for _, volume_id in runs]
+    errors = []
+    done = threading.Event()
+    reads = []
+
+    def ocr_stream(ocr_run_id: int, volume_id: int):
+        """Как run_background_ocr: страница за страницей, ожидание коммита каждой"""
+        for page_number in range(1, PAGES + 1):
+            try:
+                db_writer.call(save_page_text, ocr_run_id, volume_id, page_number,
+                               f"Протокол допроса, страница {page_number}. " * 20, 90, "tesseract")
+            except Exception as e:
+                errors.append(e)
+
+    def reader():
+        """Читатель видит согласованные снимки: число страниц не убывает"""
+        db = SessionLocal()
+        last = 0
+        try:
+            while not done.is_set():
+                count = db.scalar(select_count(volume_ids))
+                db.rollback()  # новая транзакция чтения — новый снимок WAL
+                if count < last:
+                    errors.append(AssertionError(f"страниц стало меньше: {last} -> {count}"))
+                last = count
+                reads.append(count)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.close()
+
+    readers = [threading.Thread(target=reader) for _ in range(READERS)]
+    writers = [threading.Thread(target=ocr_stream, args=run) for run in runs]
+    started = time.perf_counter()
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    for thread in readers:
+        thread.join()
+
+    assert not errors, errors[:3]
+    assert page_count(volume_ids) == OCR_STREAMS * PAGES
+    db = SessionLocal()
+    try:
+        progress = db.query(OcrRun.pages_processed).filter(OcrRun.id.in_([run_id for run_id, _ in runs])).all()
+        assert [row.pages_processed for row in progress] == [PAGES] * OCR_STREAMS
+    finally:
+        db.close()
+    print(f"\n{OCR_STREAMS * PAGES} страниц за {elapsed:.2f} s ({OCR_STREAMS * PAGES / elapsed:.0f} стр/с), "
+          f"{len(reads)} чтений параллельно")
+
+
+class CountingSessions:
+    """Фабрика сессий писателя, считающая транзакции"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self):
+        self.count += 1
+        return SessionLocal()
+
+
+def run_gated(writer: DatabaseWriter, items: list) -> list:
+    """
+    Поставить записи в очередь, пока писатель занят первой записью:
+    накопившаяся очередь уходит пакетами. Возвращает Future записей items.
+    """
+    gate = threading.Event()
+    blocker = writer.submit(lambda session: gate.wait(10))
+    futures = [writer.submit(fn, *args) for fn, *args in items]
+    gate.set()
+    blocker.result(timeout=10)
+    for future in futures:
+        try:
+            future.result(timeout=30)
+        except Exception:
+            pass
+    return futures
+
+
+def test_writer_batches_queued_pages(app):
+    (ocr_run_id, volume_id), = create_runs(1, "batch-037")
+    sessions = CountingSessions()
+    writer = DatabaseWriter(sessions, max_batch=100)
+
+    futures = run_gated(writer, [
+        (save_page_text, ocr_run_id, volume_id, page_number, f"Страница {page_number}", 90, "tesseract")
+        for page_number in range(1, 251)
+    ])
+
+    assert all(future.exception() is None for future in futures)
+    assert page_count([volume_id]) == 250
+    # Блокирующая запись + 250 страниц пакетами по 100
+    assert sessions.count <= 1 + 3
+
+
+def test_failed_batch_is_retried_without_losing_rows(app):
+    (ocr_run_id, volume_id), = create_runs(1, "retry-037")
+    sessions = CountingSessions()
+    writer = DatabaseWriter(sessions, max_batch=100)
+
+    def broken_page(session):
+        """Нарушает NOT NULL — ошибка только при коммите всего пакета"""
+        session.add(PageText(volume_id=volume_id, ocr_run_id=ocr_run_id, page_number=None))
+
+    items = [(save_page_text, ocr_run_id, volume_id, page_number, f"Страница {page_number}", 90, "tesseract")
+             for page_number in range(1, 61)]
+    items.insert(30, (broken_page,))
+    futures = run_gated(writer, items)
+
+    failed = [future for future in futures if future.exception() is not None]
+    assert failed == [futures[30]]
+    assert page_count([volume_id]) == 60
+    # Пакет откатился и записан заново по одной
+    assert sessions.count >= 1 + 1 + len(items)
@@ -0,0 +1,113 @@
+"""
+Отзывчивость event loop во время выделения документов (SSE extract-documents-stream)
+
+Несколько потоков выделения идут одновременно; анализ страницы (рендеринг + запрос
+к Claude) заменён блокирующей заглушкой. Пока они работают, /api/health опрашивается
+в цикле: блокирующая работа в обработчиках останавливала бы event loop, и p99
+латентности health рос бы до времени анализа страницы.
+"""
+
+import asyncio
+import json
+import os
+import statistics
+import time
+import types
+
+import fitz
+import pytest
+
+from app.api.v1 import cases
+from app.core.config import settings
+from app.models import Case, Volume
+from app.models.database import SessionLocal
+from app.services import extraction_service
+from app.services.storage_service import case_upload_dir
+
+pytestmark = pytest.mark.benchmark
+
+STREAMS = 4
+PAGES = 5
+PAGE_ANALYSIS_SECONDS = 0.2
+HEALTH_P99_LIMIT = 0.1  # анализ страницы в event loop дал бы p99 >= PAGE_ANALYSIS_SECONDS
+
+
+def make_pdf(path: str, pages: int):
+    doc = fitz.open()
+    for i in range(pages):
+        doc.new_page().insert_text((72, 72), f"Protocol {i + 1}", fontname="helv")
+    doc.save(path)
+    doc.close()
+
+
+def analyze_pdf_page(client, doc, page_num, history, log_prefix="[DEBUG]", file_hash=None):
+    """Заглушка анализа: рендеринг страницы и ожидание ответа API — блокирующие"""
+    doc.load_page(page_num).get_pixmap(dpi=72)
+    time.sleep(PAGE_ANALYSIS_SECONDS)
+    return {"is_start": True, "type": "Протокол", "title": f"протокол {page_num + 1}", "date": ""}
+
+
+@pytest.fixture
+def volumes(app, monkeypatch):
+    """STREAMS томов с PDF на диске, extraction_service и anthropic заменены заглушками"""
+    monkeypatch.setattr(extraction_service, "analyze_pdf_page", analyze_pdf_page)
+    monkeypatch.setattr(cases, "anthropic", types.SimpleNamespace(Anthropic=lambda api_key: object()), raising=False)
+    monkeypatch.setattr(cases, "HAS_ANTHROPIC", True)
+    monkeypatch.setattr(settings, "ANTHROPIC_API_KEY", "test")
+
+    db = SessionLocal()
+    try:
+        case = Case(user_id=1, case_number="bench-026", title="Отзывчивость event loop")
+        db.add(case)
+        db.flush()
+        os.makedirs(case_upload_dir(case.id), exist_ok=True)
+        result = []
+        for number in range(1, STREAMS + 1):
+            file_name = f"volume_{number}.pdf"
+            make_pdf(os.path.join(case_upload_dir(case.id), file_name), PAGES)
+            volume = Volume(case_id=case.id, volume_number=number, file_name=file_name, page_count=PAGES)
+            db.add(volume)
+            db.flush()
+            result.append((case.id, volume.id))
+        db.commit()
+    finally:
+        db.close()
+    return result
+
+
+def test_health_p99_during_extraction_streams(run_client, volumes):
+    async def extract(client, case_id, volume_id):
+        """Последнее событие SSE потока выделения"""
+        last = None
+        url = f"/api/cases/{case_id}/volumes/{volume_id}/extract-documents-stream"
+        async with client.stream("GET", url) as response:
+            async for line in response.aiter_lines():
+                if line.startswith("data: "):
+                    last = json.loads(line[len("data: "):])
+        return last
+
+    async def scenario(client):
+        # Первый запрос собирает стек middleware — в замер не входит
+        await client.get("/api/health")
+        streams = asyncio.gather(*[extract(client, case_id, volume_id) for case_id, volume_id in volumes])
+        latencies = []
+        while not streams.done():
+            started = time.perf_counter()
+            response = await client.get("/api/health")
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 200
+            await asyncio.sleep(0.005)
+        return await streams, latencies
+
+    events, latencies = run_client(scenario)
+
+    for event in events:
+        assert event["type"] == "complete", event
+        assert len(event["documents"]) == PAGES
+
+    p99 = statistics.quantiles(latencies, n=100)[98]
+    print(f"\n/api/health при {STREAMS} потоках выделения: {len(latencies)} запросов, "
+          f"медиана {statistics.median(latencies) * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms")
+    # Поток выделения длится не меньше PAGES * PAGE_ANALYSIS_SECONDS: опросов должно хватить для p99
+    assert len(latencies) >= 50
+    assert p99 < HEALTH_P99_LIMIT
@@ -0,0 +1,42 @@
+"""
+Восстановление запусков OCR после перезапуска (ingest_service.is_abandoned)
+"""
+
+import os
+import socket
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.models import OcrRun
+from app.services import jobs
+from app.services.ingest_service import is_abandoned
+
+NOW = datetime(2026, 10, 19, 12, 0)
+FRESH = NOW - timedelta(seconds=5)
+STALE = NOW - timedelta(seconds=settings.OCR_RUN_STALE_SECONDS + 5)
+
+
+def run(owner, heartbeat_at):
+    return OcrRun(volume_id=1, engine="tesseract", status="running", owner=owner,
+                  started_at=heartbeat_at, heartbeat_at=heartbeat_at)
+
+
+@pytest.mark.parametrize("owner, heartbeat_at, abandoned", [
+    (None, FRESH, False),
+    (None, STALE, True),
+    ("otherhost:1:abcd", FRESH, False),
+    ("otherhost:1:abcd", STALE, True),
+    (f"{socket.gethostname()}:999999999:abcd", FRESH, True),  # процесса нет
+    (f"{socket.gethostname()}:{os.getpid()}:restart", FRESH, True),  # pid тот же, запуск другой
+    # pid занят живым процессом (родитель теста) — это может быть не владелец: решает пульс
+    (f"{socket.gethostname()}:{os.getppid()}:abcd", FRESH, False),
+    (f"{socket.gethostname()}:{os.getppid()}:abcd", STALE, True),
+])
+def test_is_abandoned(owner, heartbeat_at, abandoned):
+    assert is_abandoned(run(owner, heartbeat_at), NOW) is abandoned
+
+
+def test_own_run_is_never_abandoned():
+    assert not is_abandoned(run(jobs.worker_id(), STALE), NOW)
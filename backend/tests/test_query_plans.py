@@ -0,0 +1,54 @@
+"""
+Планы горячих запросов SQLite (индексы миграции 0003_hot_query_indexes)
+
+База создаётся миграциями во временном каталоге; EXPLAIN QUERY PLAN должен
+показывать поиск по составному индексу без полного просмотра таблицы и без
+сортировки во временном B-дереве.
+"""
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.core.migrations import upgrade_database
+from app.models import Case
+from app.services.case_stats import cases_with_stats
+from app.services.search_service import CURRENT_RUN_SQL
+
+
+@pytest.fixture(scope="module")
+def engine(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('plans') / 'plans.db'}")
+    upgrade_database(engine)
+    yield engine
+    engine.dispose()
+
+
+def query_plan(engine, sql: str) -> str:
+    with engine.connect() as connection:
+        return "\n".join(row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+
+@pytest.mark.parametrize("sql, index", [
+    (CURRENT_RUN_SQL.format(volume_id=1), "ix_ocr_runs_volume_status"),
+    ("SELECT * FROM page_texts WHERE volume_id = 1 AND ocr_run_id = 2 ORDER BY page_number",
+     "ix_page_texts_volume_run_page"),
+    ("SELECT * FROM text_chunks WHERE volume_id = 1 AND ocr_run_id = 2 ORDER BY page_number, chunk_index",
+     "ix_text_chunks_volume_run_page_chunk"),
+    ("SELECT * FROM documents WHERE volume_id = 1 AND extraction_run_id = 3 ORDER BY start_page",
+     "ix_documents_volume_run_start"),
+    ("SELECT * FROM extraction_runs WHERE volume_id = 1 AND is_current = 1",
+     "ix_extraction_runs_volume_current"),
+    ("SELECT * FROM volumes WHERE case_id = 1 ORDER BY volume_number", "ix_volumes_case_number"),
+])
+def test_hot_query_uses_composite_index(engine, sql, index):
+    plan = query_plan(engine, sql)
+    assert f"INDEX {index}" in plan, plan
+    assert "TEMP B-TREE" not in plan, plan
+
+
+def test_case_stats_reads_current_runs_by_index(engine):
+    sql = str(cases_with_stats().where(Case.id == 1).compile(engine, compile_kwargs={"literal_binds": True}))
+    plan = query_plan(engine, sql)
+    assert "ix_ocr_runs_volume_status" in plan, plan
+    assert "SCAN page_texts" not in plan, plan
+    assert "ix_documents_case" in plan, plan
@@ -78,7 +78,7 @@ export default function PDFViewerPage() {
 
     const loadText = async () => {
       try {
-        const response = await fetch(`/api/cases/${id}/volumes/${volumeId}/all-pages-text`)
+        const response = await fetch(`/api/cases/${id}/volumes/${volumeId}/all-pages-text?include_word_boxes=false`)
         if (response.ok) {
           const data = await response.json()
           if (data.pages && data.pages.length > 0) {
@@ -87,7 +87,7 @@ export default function PDFViewerPage() {
             if (data.ocr_run_id) {
               setCurrentOcrRunId(data.ocr_run_id)
               // Загружаем количество chunks
-              const chunksRes = await fetch(`/api/cases/${id}/volumes/${volumeId}/chunks?ocr_run_id=${data.ocr_run_id}`)
+              const chunksRes = await fetch(`/api/cases/${id}/volumes/${volumeId}/chunks?ocr_run_id=${data.ocr_run_id}&limit=1`)
               if (chunksRes.ok) {
                 const chunksData = await chunksRes.json()
                 setChunksCount(chunksData.total || 0)
@@ -164,7 +164,7 @@ export default function PDFViewerPage() {
   const loadAllPagesText = async () => {
     setIsLoadingText(true)
     try {
-      const response = await fetch(`/api/cases/${id}/volumes/${volumeId}/all-pages-text`)
+      const response = await fetch(`/api/cases/${id}/volumes/${volumeId}/all-pages-text?include_word_boxes=false`)
       if (response.ok) {
         const data = await response.json()
         setAllPagesText(data.pages || [])
@@ -699,7 +699,7 @@ export default function PDFViewerPage() {
                               <button
                                 onClick={async () => {
                                   try {
-                                    const response = await fetch(`/api/cases/${id}/volumes/${volumeId}/ocr-run/${run.id}/pages`)
+                                    const response = await fetch(`/api/cases/${id}/volumes/${volumeId}/ocr-run/${run.id}/pages?include_word_boxes=false`)
                                     if (response.ok) {
                                       const data = await response.json()
                                       const sortedPages = (data.pages || []).sort((a: any, b: any) => a.page_number - b.page_number)
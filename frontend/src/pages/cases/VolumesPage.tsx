@@ -141,6 +141,9 @@ export default function VolumesPage() {
     const styles = {
       pending: 'apple-badge-success',
       processing: 'apple-badge-warning',
+      ingested: 'apple-badge-success',
+      ocr_queued: 'apple-badge-warning',
+      ocr_running: 'apple-badge-warning',
       completed: 'apple-badge-success',
       ocr_completed: 'apple-badge-success',
       failed: 'apple-badge-danger',
@@ -148,6 +151,9 @@ export default function VolumesPage() {
     const labels = {
       pending: 'Загружен',
       processing: 'Обработка',
+      ingested: 'Подготовлен',
+      ocr_queued: 'OCR в очереди',
+      ocr_running: 'OCR идёт',
       completed: 'Готово',
       ocr_completed: 'OCR готов',
       failed: 'Ошибка',